@@ -0,0 +1,241 @@
+"""Message Batches API backend for bulk offline synthesis.
+
+Instead of one synchronous request per placename, the prompts built by
+synthesis.create_prompt_template() are packaged into Message Batches jobs,
+submitted, polled until they end and their results merged back into the usual
+(placename, sentence, model) rows. Batches trade latency (results can take up
+to 24h) for much higher total throughput at half the price per token.
+
+Submitted batch ids are saved in a small state file next to the journal, with
+the (index, placename) of each request, so a job that is restarted polls the
+batches it already submitted instead of paying for them twice, and results are
+only merged for rows that still hold the same placename. base_url points the client at a local stub server for testing.
+
+Note that with do_sampling the "previous sentences" shown to the model can only
+come from sentences generated before the batch was submitted (e.g. a resumed
+journal), since the whole batch is built up front.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+from anthropic import Anthropic
+
+import synthesis
+
+# Requests per batch job (the API allows up to 100,000 or 256 MB)
+BATCH_MAX_REQUESTS = 10000
+POLL_INTERVAL = 60  # Seconds between status checks
+
+
+def create_batch_client(base_url=None):
+    return Anthropic(api_key=synthesis.get_anthropic_api_key(), base_url=base_url)
+
+
+def build_batch_request(index, placename, use_sampling, simple_mode, model):
+    """One Message Batches request; custom_id carries the placename's index"""
+    prompt = synthesis.get_prompt_template(
+        include_previous=use_sampling, simple_mode=simple_mode
+    )
+    messages = prompt.format_messages(
+        **synthesis.build_invoke_params(placename, use_sampling)
+    )
+    system, api_messages = synthesis.to_anthropic_request(
+        synthesis.mark_cacheable_prefix(messages)
+    )
+    return {
+        "custom_id": f"placename-{index}",
+        "params": {
+            "model": model,
+            "max_tokens": synthesis.MAX_TOKENS,
+            "temperature": synthesis.TEMPERATURE,
+            "system": system,
+            "messages": api_messages,
+        },
+    }
+
+
+def load_batch_state(state_path):
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"batches": []}
+
+
+def save_batch_state(state_path, state):
+    directory = os.path.dirname(state_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def submit_batches(client, todo, use_sampling, simple_mode, model, state, state_path):
+    """Submit the pending (index, placename) pairs in jobs of BATCH_MAX_REQUESTS"""
+    for start in range(0, len(todo), BATCH_MAX_REQUESTS):
+        chunk = todo[start : start + BATCH_MAX_REQUESTS]
+        requests = [
+            build_batch_request(i, placename, use_sampling, simple_mode, model)
+            for i, placename in chunk
+        ]
+        batch = client.messages.batches.create(requests=requests)
+        print(f"Submitted batch {batch.id} ({len(requests)} placenames)")
+        state["batches"].append(
+            {
+                "id": batch.id,
+                "indices": [i for i, _ in chunk],
+                "placenames": [placename for _, placename in chunk],
+                "merged": False,
+            }
+        )
+        save_batch_state(state_path, state)
+
+
+def wait_for_batch(client, batch_id, poll_interval=POLL_INTERVAL):
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        print(
+            f"Batch {batch_id}: {batch.processing_status} "
+            f"({counts.succeeded} succeeded, {counts.errored} errored, "
+            f"{counts.processing} processing)"
+        )
+        if batch.processing_status == "ended":
+            return batch
+        time.sleep(poll_interval)
+
+
+def batch_placenames(batch, placenames_list):
+    """{index: placename} the requests of a batch were built from"""
+    # state files from before placenames were saved only have the indices
+    placenames = batch.get("placenames") or [
+        placenames_list[i] if i < len(placenames_list) else None
+        for i in batch["indices"]
+    ]
+    return dict(zip(batch["indices"], placenames))
+
+
+def merge_batch_results(
+    client, batch, placenames_list, use_sampling, journal=None, completed=()
+):
+    """Result rows of an ended batch, plus the indices that did not succeed.
+
+    Rows already in `completed` ((index, placename) pairs, e.g. journaled by
+    a merge that was cut short) are skipped rather than journaled twice, and
+    so are results for rows whose placename has changed since submission.
+    """
+    batch_id = batch["id"]
+    placenames = batch_placenames(batch, placenames_list)
+    rows = {}
+    failed = []
+    cache_stats = synthesis.PromptCacheStats()
+    # closed even if the merge is cut short, or the open stream holds on to
+    # a pooled connection that later requests can deadlock on
+    with contextlib.closing(client.messages.batches.results(batch_id)) as results:
+        for entry in results:
+            i = int(entry.custom_id.rsplit("-", 1)[1])
+            placename = placenames[i]
+            if i >= len(placenames_list) or placenames_list[i] != placename:
+                print(f"Skipping result for {placename}: row {i} of the input has changed")
+                continue
+            if (i, placename) in completed:
+                continue
+            if entry.result.type != "succeeded":
+                print(f"Error with {placename}: batch result {entry.result.type}")
+                failed.append(i)
+                continue
+            message = entry.result.message
+            cache_stats.add(message.usage)
+            text = "".join(block.text for block in message.content if block.type == "text")
+            row = synthesis.record_sentence(
+                placename,
+                synthesis.clean_sentence(text),
+                message.model,
+                use_sampling,
+            )
+            if journal is not None:
+                journal.append(i, row)
+            rows[i] = row
+    print(f"Batch {batch_id}: {cache_stats.summary()}")
+    return rows, failed
+
+
+def process_with_batches(
+    placenames_list,
+    model=None,
+    journal=None,
+    state_path=None,
+    base_url=None,
+    poll_interval=POLL_INTERVAL,
+    client=None,
+    use_sampling=None,
+    simple_mode=None,
+):
+    """Generate sentences for placenames_list through the Message Batches API.
+
+    Returns result rows in input order, like synthesis.process_async(); failed
+    placenames are saved with synthesis.save_failed_placenames().
+    """
+    model = model or synthesis.config.model
+    if use_sampling is None:
+        use_sampling = synthesis.config.do_sampling
+    if simple_mode is None:
+        simple_mode = synthesis.config.just_sample
+    client = client or create_batch_client(base_url or synthesis.config.base_url)
+    if state_path is None:
+        state_path = f"./synthesis/batches_{model}.json"
+    state = load_batch_state(state_path)
+
+    # placenames already journaled or in a batch that was submitted earlier
+    submitted = {
+        item
+        for batch in state["batches"]
+        for item in batch_placenames(batch, placenames_list).items()
+    }
+    todo = [
+        item
+        for item in synthesis.pending_placenames(placenames_list, journal)
+        if item not in submitted
+    ]
+    if todo:
+        submit_batches(
+            client,
+            todo,
+            use_sampling,
+            simple_mode,
+            model,
+            state,
+            state_path,
+        )
+
+    rows = {}
+    failed = []
+    for batch in state["batches"]:
+        if batch["merged"]:
+            continue
+        wait_for_batch(client, batch["id"], poll_interval)
+        batch_rows, batch_failed = merge_batch_results(
+            client,
+            batch,
+            placenames_list,
+            use_sampling,
+            journal,
+            journal.completed_keys() if journal is not None else (),
+        )
+        rows.update(batch_rows)
+        failed += batch_failed
+        batch["merged"] = True
+        save_batch_state(state_path, state)
+
+    # everything is merged (and journaled): failed placenames get resubmitted
+    # on the next run rather than being treated as already submitted
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    if failed:
+        synthesis.save_failed_placenames([placenames_list[i] for i in sorted(failed)])
+    return [rows[i] for i in sorted(rows)]
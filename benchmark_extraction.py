@@ -0,0 +1,181 @@
+"""Benchmark the placename extractor over the gazetteer PDFs.
+
+Times the extraction of every PDF in fixtures/ and placenames/placenames, per
+file and per page, and reports pages/sec, pairs/sec and peak RSS. Each file is
+benchmarked in a fresh worker process so its peak RSS isn't inflated by the
+files before it. Results are written as JSON so runs on different commits can
+be compared:
+
+    python benchmark_extraction.py --output before.json
+    ... change the parser ...
+    python benchmark_extraction.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import fitz
+
+from pdf_to_data_set import (
+    ENGINES,
+    dedupe_place_names,
+    file_names_from_dir,
+    page_to_place_names,
+)
+
+PDF_DIRS = ["./fixtures", "./placenames/placenames"]
+OUTPUT_JSON = "bench_extraction.json"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        return max_rss / (1024 * 1024)
+    return max_rss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_file(args):
+    """Time the extraction of one PDF; best of `repeat` runs per page."""
+    f_path_PDF, engine, repeat = args
+    page_times = []
+    page_pairs = []
+    with fitz.open(f_path_PDF) as doc:
+        for page_no in range(doc.page_count):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                pairs = page_to_place_names(doc[page_no], engine)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            page_times.append(best)
+            page_pairs.append(pairs)
+
+    seconds = sum(page_times)
+    n_pairs = len(dedupe_place_names(pair for pairs in page_pairs for pair in pairs))
+    return {
+        "file": os.path.basename(f_path_PDF),
+        "path": f_path_PDF,
+        "pages": len(page_times),
+        "pairs": n_pairs,
+        "seconds": seconds,
+        "pages_per_sec": len(page_times) / seconds if seconds else None,
+        "pairs_per_sec": n_pairs / seconds if seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "page_seconds": page_times,
+        "page_pairs": [len(pairs) for pairs in page_pairs],
+    }
+
+
+def run_benchmark(f_paths_PDF, engine="lines", repeat=1):
+    # maxtasksperchild=1 gives every PDF its own process, and so its own peak RSS
+    with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+        files = pool.map(
+            benchmark_file, [(f_path, engine, repeat) for f_path in f_paths_PDF], 1
+        )
+
+    pages = sum(f["pages"] for f in files)
+    pairs = sum(f["pairs"] for f in files)
+    seconds = sum(f["seconds"] for f in files)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "engine": engine,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "totals": {
+            "files": len(files),
+            "pages": pages,
+            "pairs": pairs,
+            "seconds": seconds,
+            "pages_per_sec": pages / seconds if seconds else None,
+            "pairs_per_sec": pairs / seconds if seconds else None,
+            "peak_rss_mb": max((f["peak_rss_mb"] for f in files), default=None),
+        },
+        "files": files,
+    }
+
+
+def print_report(results, baseline=None):
+    baseline_files = {}
+    if baseline is not None:
+        baseline_files = {f["path"]: f for f in baseline["files"]}
+        print(f"Comparing against {baseline['commit']} ({baseline['timestamp']})")
+
+    print(
+        f"{'file':60s} {'pages':>5s} {'pairs':>6s} {'secs':>7s} "
+        f"{'pages/s':>8s} {'pairs/s':>9s} {'rss MB':>7s}"
+    )
+    rows = results["files"] + [dict(results["totals"], file="TOTAL", path=None)]
+    for f in rows:
+        line = (
+            f"{f['file'][-60:]:60s} {f['pages']:5d} {f['pairs']:6d} {f['seconds']:7.3f} "
+            f"{f['pages_per_sec'] or 0:8.1f} {f['pairs_per_sec'] or 0:9.1f} "
+            f"{f['peak_rss_mb']:7.1f}"
+        )
+        old = baseline_files.get(f["path"]) if f["path"] else None
+        if f["path"] is None and baseline is not None:
+            old = baseline["totals"]
+        if old and f["seconds"]:
+            line += f"  x{old['seconds'] / f['seconds']:.2f} speed, {f['pairs'] - old['pairs']:+d} pairs"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help=f"PDFs or directories to benchmark (default: {' '.join(PDF_DIRS)})",
+    )
+    parser.add_argument("--engine", choices=ENGINES, default="lines")
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="runs per page, the fastest is kept"
+    )
+    parser.add_argument("--output", default=OUTPUT_JSON, help="results JSON file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    f_paths_PDF = []
+    for path in args.paths or PDF_DIRS:
+        if os.path.isdir(path):
+            f_paths_PDF += [
+                os.path.join(path, f_name)
+                for f_name in sorted(file_names_from_dir(path))
+                if f_name.endswith(".pdf")
+            ]
+        else:
+            f_paths_PDF.append(path)
+
+    results = run_benchmark(f_paths_PDF, engine=args.engine, repeat=args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
@@ -0,0 +1,267 @@
+"""Benchmark the synthesis pipeline against the local mock Anthropic API.
+
+Starts mock_anthropic_server.py in-process with a given latency distribution,
+rate limit and error rate, points synthesis.py at it and generates sentences
+for a set of placenames with one of the engines. Reports sentences/sec, the
+achieved requests/min against the server's limit (how close the engine gets to
+saturating it), p50/p99 server latency, retries (429/529s served) and the time
+the server sat with no request in flight. No network and no quota are used.
+
+Like the API, the server starts with a full minute of requests in its bucket,
+so use several times --server-rpm placenames to measure the sustained rate.
+
+    python benchmark_synthesis.py --engine async -n 300 --server-rpm 600 --output async.json
+    python benchmark_synthesis.py --engine threads -n 300 --server-rpm 600 --compare async.json
+
+Results are written as JSON, like benchmark_extraction.py, so runs with
+different settings or commits can be compared.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock_anthropic_server
+import synthesis
+
+OUTPUT_JSON = "bench_synthesis.json"
+ENGINES = ["async", "threads", "batch-api"]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def fake_placenames(n):
+    return [f"Baile Tástála {i}" for i in range(n)]
+
+
+def run_engine(engine, placenames, batch_size=None, batch_delay=None):
+    """Generate sentences with one engine; returns the result rows"""
+    if engine == "async":
+        return asyncio.run(synthesis.process_async(placenames))
+    if engine == "threads":
+        return synthesis.process_in_batches(
+            placenames, batch_size=batch_size, batch_delay=batch_delay
+        )
+    import batch_synthesis
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return batch_synthesis.process_with_batches(
+            placenames,
+            state_path=os.path.join(tmp_dir, "batches.json"),
+            poll_interval=0.2,
+        )
+
+
+def run_benchmark(
+    placenames,
+    engine="async",
+    server_settings=None,
+    concurrency=None,
+    requests_per_minute=None,
+    tokens_per_minute=None,
+    placenames_per_request=None,
+    batch_size=None,
+    batch_delay=0,
+    use_sampling=False,
+    verbose=False,
+):
+    """Run one engine against a fresh mock server and collect its numbers.
+
+    The client-side limits default to the server's, as they would be set for
+    the real API tier.
+    """
+    server_settings = server_settings or {}
+    server = mock_anthropic_server.start_server(**server_settings)
+    state = server.state
+    saved = dataclasses.replace(synthesis.config)
+    os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+    try:
+        synthesis.config.base_url = server.base_url
+        synthesis.config.do_sampling = use_sampling
+        synthesis.config.run_tag = "_benchmark"
+        synthesis.config.async_concurrency = concurrency or synthesis.config.async_concurrency
+        synthesis.config.requests_per_minute = requests_per_minute or state.requests_per_minute
+        synthesis.config.tokens_per_minute = tokens_per_minute or state.tokens_per_minute
+        synthesis.config.placenames_per_request = (
+            placenames_per_request or synthesis.config.placenames_per_request
+        )
+
+        start = time.perf_counter()
+        # the engines print a line per sentence; keep the report readable
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+                rows = run_engine(engine, placenames, batch_size, batch_delay)
+        seconds = time.perf_counter() - start
+    finally:
+        vars(synthesis.config).update(vars(saved))
+        server.shutdown()
+        server.server_close()
+
+    stats = state.stats()
+    requests_per_minute = stats["received"] / seconds * 60 if seconds else None
+    succeeded_per_minute = stats["succeeded"] / seconds * 60 if seconds else None
+    allowed = state.requests_per_minute * (1 + seconds / 60)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "engine": engine,
+        "placenames": len(placenames),
+        "settings": {
+            "server": {
+                key: getattr(state, key)
+                for key in (
+                    "latency",
+                    "latency_sigma",
+                    "latency_distribution",
+                    "seconds_per_output_token",
+                    "requests_per_minute",
+                    "tokens_per_minute",
+                    "error_rate",
+                )
+            },
+            "concurrency": concurrency,
+            "requests_per_minute": requests_per_minute,
+            "tokens_per_minute": tokens_per_minute,
+            "placenames_per_request": placenames_per_request,
+            "batch_size": batch_size,
+            "batch_delay": batch_delay,
+            "use_sampling": use_sampling,
+        },
+        "totals": {
+            "sentences": len(rows),
+            "seconds": seconds,
+            "sentences_per_sec": len(rows) / seconds if seconds else None,
+            "requests": stats["received"],
+            "requests_per_min": requests_per_minute,
+            "succeeded_per_min": succeeded_per_minute,
+            # successes against the most the server could have allowed in the
+            # time: its full bucket at the start plus the refill since
+            "limit_utilisation": stats["succeeded"] / allowed if allowed else None,
+            "retries": stats["rate_limited"] + stats["injected_errors"],
+            "rate_limited": stats["rate_limited"],
+            "injected_errors": stats["injected_errors"],
+            "latency_p50": stats["latency_p50"],
+            "latency_p99": stats["latency_p99"],
+            "max_in_flight": stats["max_in_flight"],
+            "idle_seconds": stats["idle_seconds"],
+            "input_tokens": stats["input_tokens"],
+            "output_tokens": stats["output_tokens"],
+            "cache_read_tokens": stats["cache_read_tokens"],
+        },
+    }
+
+
+def print_report(results, baseline=None):
+    totals = results["totals"]
+    server = results["settings"]["server"]
+    if baseline is not None:
+        print(
+            f"Comparing against {baseline['engine']} at {baseline['commit']} "
+            f"({baseline['timestamp']})"
+        )
+    print(
+        f"{results['engine']} engine, {results['placenames']} placenames against a server "
+        f"with {server['requests_per_minute']} requests/min, {server['latency']}s median latency, "
+        f"{server['error_rate']:.0%} injected errors"
+    )
+    rows = [
+        ("sentences", "sentences", "{:d}"),
+        ("seconds", "seconds", "{:.2f}"),
+        ("sentences/sec", "sentences_per_sec", "{:.2f}"),
+        ("requests", "requests", "{:d}"),
+        ("succeeded requests/min", "succeeded_per_min", "{:.1f}"),
+        ("request limit used", "limit_utilisation", "{:.0%}"),
+        ("retries (429/529 served)", "retries", "{:d}"),
+        ("latency p50 (s)", "latency_p50", "{:.3f}"),
+        ("latency p99 (s)", "latency_p99", "{:.3f}"),
+        ("max in flight", "max_in_flight", "{:d}"),
+        ("server idle (s)", "idle_seconds", "{:.2f}"),
+    ]
+    for label, key, fmt in rows:
+        value = totals[key]
+        line = f"{label:28s} {fmt.format(value) if value is not None else '-':>10s}"
+        old = baseline["totals"].get(key) if baseline is not None else None
+        if old is not None and value is not None:
+            line += f"  (was {fmt.format(old)})"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=ENGINES, default="async")
+    parser.add_argument(
+        "-n", "--placenames", type=int, default=200, help="placenames to generate for"
+    )
+    parser.add_argument(
+        "--input",
+        help="take the placenames from this CSV's Logainm column instead of made-up ones",
+    )
+    parser.add_argument(
+        "--sampling",
+        action="store_true",
+        help="show previous sentences in the prompt, as in a real run",
+    )
+    client = parser.add_argument_group("pipeline")
+    client.add_argument("--concurrency", type=int, help="initial requests in flight (async)")
+    client.add_argument("--rpm", type=int, help="client requests/min (default: the server's)")
+    client.add_argument("--tpm", type=int, help="client tokens/min (default: the server's)")
+    client.add_argument("--placenames-per-request", type=int)
+    client.add_argument("--batch-size", type=int, help="placenames per batch (threads)")
+    client.add_argument(
+        "--batch-delay", type=int, default=0, help="seconds between batches (threads)"
+    )
+    mock_anthropic_server.add_server_arguments(parser)
+    parser.add_argument("--output", default=OUTPUT_JSON, help="results JSON file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="show the pipeline's own output"
+    )
+    args = parser.parse_args()
+
+    if args.input:
+        placenames = synthesis.load_placenames(args.input, limit=args.placenames)
+    else:
+        placenames = fake_placenames(args.placenames)
+
+    results = run_benchmark(
+        placenames,
+        engine=args.engine,
+        server_settings=mock_anthropic_server.server_settings(args),
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        placenames_per_request=args.placenames_per_request,
+        batch_size=args.batch_size,
+        batch_delay=args.batch_delay,
+        use_sampling=args.sampling,
+        verbose=args.verbose,
+    )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
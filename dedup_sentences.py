@@ -0,0 +1,270 @@
+"""Remove exact and near-duplicate sentences from a synthetic sentences CSV.
+
+    python dedup_sentences.py big_data/synthetic_sentences_..._final.csv
+
+Writes <input>_dedup.csv with the first sentence of every duplicate cluster
+kept (other columns untouched) and <input>_dedup_stats.json with the number
+of exact and near duplicates removed and the biggest clusters.
+
+Exact duplicates are found by hashing the normalised sentence (lowercase,
+collapsed whitespace); near-duplicates with MinHash signatures of word
+shingles, bucketed by LSH band and confirmed by their estimated Jaccard
+similarity. The CSV is streamed twice in chunks (once to hash, once to write)
+and signatures go to a memory-mapped file, so RAM use is a few dozen bytes per
+row and millions of rows are fine.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from near_duplicates import MinHasher
+
+CHUNK_ROWS = 50000
+SHINGLE_WORDS = 2  # Word n-grams
+NUM_PERM = 64
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows each
+THRESHOLD = 0.8  # Estimated Jaccard similarity that makes two sentences near-duplicates
+TOP_CLUSTERS = 20  # Biggest clusters listed in the stats
+
+_KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class WordMinHasher(MinHasher):
+    """MinHash over word n-grams rather than character n-grams"""
+
+    def shingles(self, text):
+        words = normalise(text).split()
+        if len(words) <= self.ngram:
+            return {" ".join(words)}
+        return {
+            " ".join(words[i : i + self.ngram]) for i in range(len(words) - self.ngram + 1)
+        }
+
+
+def normalise(sentence):
+    return " ".join(sentence.lower().split())
+
+
+def exact_hash(sentence):
+    digest = hashlib.blake2b(normalise(sentence).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def read_chunks(csv_path, chunk_rows=CHUNK_ROWS):
+    return pd.read_csv(
+        csv_path,
+        encoding="utf-8-sig",
+        chunksize=chunk_rows,
+        dtype=str,
+        keep_default_na=False,
+    )
+
+
+def hash_sentences(csv_path, column, hasher, work_dir, chunk_rows=CHUNK_ROWS):
+    """First pass: exact hashes in memory, MinHash signatures to a memmap"""
+    exact = []
+    signatures_path = os.path.join(work_dir, "signatures.u32")
+    n_rows = 0
+    with open(signatures_path, "wb") as f:
+        for chunk in read_chunks(csv_path, chunk_rows):
+            sentences = chunk[column].tolist()
+            exact.append(np.fromiter(map(exact_hash, sentences), np.uint64, len(sentences)))
+            signatures = np.array([hasher.signature(s) for s in sentences], dtype=np.uint32)
+            signatures.tofile(f)
+            n_rows += len(sentences)
+    if not n_rows:
+        return np.zeros(0, dtype=np.uint64), np.zeros((0, len(hasher.a)), dtype=np.uint32)
+    signatures = np.memmap(
+        signatures_path, dtype=np.uint32, mode="r", shape=(n_rows, len(hasher.a))
+    )
+    return np.concatenate(exact), signatures
+
+
+def runs(sorted_keys):
+    """(start, stop) of every run of two or more equal values"""
+    boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    stops = np.concatenate((boundaries, [len(sorted_keys)]))
+    keep = stops - starts > 1
+    return zip(starts[keep], stops[keep])
+
+
+def find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def union(parent, i, j):
+    """Merge the clusters of i and j; the lowest row index stays the root"""
+    root_i, root_j = find(parent, i), find(parent, j)
+    if root_i != root_j:
+        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def band_keys(signatures, rows_idx, band, rows):
+    """One uint64 key per row in rows_idx for a band of its signature.
+
+    Reads the memmap a column at a time, so only a column is in memory.
+    """
+    keys = np.zeros(len(rows_idx), dtype=np.uint64)
+    for column in range(band * rows, (band + 1) * rows):
+        keys = keys * _KEY_MULTIPLIER + signatures[:, column][rows_idx].astype(np.uint64)
+    return keys
+
+
+def cluster_duplicates(exact, signatures, bands=BANDS, threshold=THRESHOLD):
+    """Root (first row) of every row's duplicate cluster"""
+    n_rows = len(exact)
+    parent = np.arange(n_rows)
+
+    # exact duplicates: a stable sort keeps the first occurrence at the front
+    order = np.argsort(exact, kind="stable")
+    for start, stop in runs(exact[order]):
+        parent[order[start + 1 : stop]] = order[start]
+
+    # near-duplicates among the remaining rows, band by band
+    candidates = np.flatnonzero(parent == np.arange(n_rows))
+    rows = signatures.shape[1] // bands
+    with np.errstate(over="ignore"):  # the band keys wrap around on purpose
+        for band in range(bands):
+            keys = band_keys(signatures, candidates, band, rows)
+            order = np.argsort(keys, kind="stable")
+            for start, stop in runs(keys[order]):
+                members = candidates[order[start:stop]]
+                first = members[0]
+                similar = (signatures[members[1:]] == signatures[first]).mean(axis=1)
+                for member in members[1:][similar >= threshold]:
+                    union(parent, first, member)
+
+    # every parent points at a lower index, so this converges to the roots
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+def dedup_csv(
+    csv_path,
+    output_path=None,
+    stats_path=None,
+    column="sentence",
+    threshold=THRESHOLD,
+    num_perm=NUM_PERM,
+    bands=BANDS,
+    shingle_words=SHINGLE_WORDS,
+    chunk_rows=CHUNK_ROWS,
+    work_dir=None,
+):
+    """Write the deduplicated CSV and its stats; returns the stats"""
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+    stem = os.path.splitext(csv_path)[0]
+    output_path = output_path or f"{stem}_dedup.csv"
+    stats_path = stats_path or f"{stem}_dedup_stats.json"
+    hasher = WordMinHasher(num_perm, ngram=shingle_words)
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        exact, signatures = hash_sentences(csv_path, column, hasher, tmp_dir, chunk_rows)
+        roots = cluster_duplicates(exact, signatures, bands, threshold)
+        del signatures
+
+    n_rows = len(roots)
+    kept = roots == np.arange(n_rows)
+    exact_removed = int(np.count_nonzero(~kept & (exact == exact[roots])))
+    cluster_roots, cluster_sizes = np.unique(roots, return_counts=True)
+    duplicated = cluster_sizes > 1
+    biggest = np.argsort(-cluster_sizes, kind="stable")[:TOP_CLUSTERS]
+    biggest = biggest[cluster_sizes[biggest] > 1]
+    wanted = {int(cluster_roots[i]): int(cluster_sizes[i]) for i in biggest}
+
+    # second pass: stream the rows that are kept to the output
+    representatives = {}
+    offset = 0
+    with open(output_path, "w", newline="", encoding="utf-8-sig") as f:
+        for chunk_no, chunk in enumerate(read_chunks(csv_path, chunk_rows)):
+            chunk_kept = kept[offset : offset + len(chunk)]
+            chunk[chunk_kept].to_csv(f, index=False, header=chunk_no == 0)
+            for row in [row for row in wanted if offset <= row < offset + len(chunk)]:
+                representatives[row] = chunk[column].iloc[row - offset]
+            offset += len(chunk)
+
+    size_counts = np.unique(cluster_sizes[duplicated], return_counts=True)
+    stats = {
+        "input": csv_path,
+        "output": output_path,
+        "rows": n_rows,
+        "kept": int(np.count_nonzero(kept)),
+        "exact_duplicates": exact_removed,
+        "near_duplicates": n_rows - int(np.count_nonzero(kept)) - exact_removed,
+        "duplicate_clusters": int(np.count_nonzero(duplicated)),
+        "cluster_sizes": {int(size): int(count) for size, count in zip(*size_counts)},
+        "largest_clusters": [
+            {"row": row, "size": size, "sentence": representatives[row]}
+            for row, size in wanted.items()
+        ],
+        "settings": {
+            "column": column,
+            "threshold": threshold,
+            "num_perm": num_perm,
+            "bands": bands,
+            "shingle_words": shingle_words,
+        },
+    }
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2, ensure_ascii=False)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv_path", help="synthetic sentences CSV")
+    parser.add_argument("-o", "--output", help="cleaned CSV (default <input>_dedup.csv)")
+    parser.add_argument(
+        "--stats", help="stats JSON (default <input>_dedup_stats.json)"
+    )
+    parser.add_argument("--column", default="sentence", help="sentence column")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help=f"similarity for near-duplicates (default {THRESHOLD})",
+    )
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM)
+    parser.add_argument("--bands", type=int, default=BANDS)
+    parser.add_argument(
+        "--shingle-words",
+        type=int,
+        default=SHINGLE_WORDS,
+        help=f"words per shingle (default {SHINGLE_WORDS})",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--work-dir", help="directory for the temporary signature file")
+    args = parser.parse_args()
+
+    stats = dedup_csv(
+        args.csv_path,
+        output_path=args.output,
+        stats_path=args.stats,
+        column=args.column,
+        threshold=args.threshold,
+        num_perm=args.num_perm,
+        bands=args.bands,
+        shingle_words=args.shingle_words,
+        chunk_rows=args.chunk_rows,
+        work_dir=args.work_dir,
+    )
+    print(
+        f"{stats['rows']} rows: {stats['exact_duplicates']} exact and "
+        f"{stats['near_duplicates']} near-duplicates removed, {stats['kept']} kept "
+        f"({stats['duplicate_clusters']} duplicate clusters)"
+    )
+    print(f"Saved {stats['output']}")
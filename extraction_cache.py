@@ -0,0 +1,105 @@
+"""On-disk cache of extracted (en, ga) pairs for the gazetteer PDFs.
+
+Entries are keyed by the SHA-256 of the PDF's contents, the extraction engine
+and the parser version, so a PDF is only re-parsed when the file itself changes,
+when it is extracted with a different engine or when the parser is changed
+(pdf_to_data_set.PARSER_VERSION is bumped). Renaming or moving a PDF
+keeps its cache entry.
+"""
+
+import hashlib
+import json
+import os
+
+from pdf_to_data_set import PARSER_VERSION
+
+CACHE_DIR = "./.extraction_cache"
+
+
+def file_digest(f_path):
+    """SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(f_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_entry_path(digest, engine="lines", cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"{digest}-{engine}-v{PARSER_VERSION}.json")
+
+
+def load_cached_pairs(digest, engine="lines", cache_dir=CACHE_DIR):
+    """Return the cached list of (en, ga) tuples for a digest, or None on a miss."""
+    try:
+        with open(
+            cache_entry_path(digest, engine, cache_dir), "r", encoding="utf-8"
+        ) as f:
+            entry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if entry.get("parser_version") != PARSER_VERSION:
+        return None
+    return [tuple(pair) for pair in entry["pairs"]]
+
+
+def store_cached_pairs(digest, pairs, engine="lines", source=None, cache_dir=CACHE_DIR):
+    """Write the pairs extracted for a digest to the cache."""
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = {
+        "parser_version": PARSER_VERSION,
+        "engine": engine,
+        "source": source,
+        "pairs": [list(pair) for pair in pairs],
+    }
+    f_path = cache_entry_path(digest, engine, cache_dir)
+    # write to a temp file and rename so an interrupted run never leaves a
+    # truncated entry behind
+    tmp_path = f"{f_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, f_path)
+
+
+def cached_extract(f_paths_PDF, extract, engines=None, cache_dir=CACHE_DIR):
+    """Extract pairs for several PDFs, only parsing the ones not already cached.
+
+    extract is called once with the list of paths that missed the cache and
+    must return a {path: [(en, ga), ...]} dict (e.g. extract_place_names_parallel).
+    engines optionally maps a path to the engine it is extracted with (default
+    "lines"). Returns a dict with an entry for every path in f_paths_PDF.
+
+    A PDF that yields no pairs isn't cached: the extractors print and swallow
+    parse errors, so an empty result most likely means the file failed to
+    parse, and it should be tried again next run rather than served forever.
+    """
+    engines = engines or {}
+    digests = {f_path_PDF: file_digest(f_path_PDF) for f_path_PDF in f_paths_PDF}
+
+    extracted = {}
+    misses = []
+    for f_path_PDF, digest in digests.items():
+        pairs = load_cached_pairs(
+            digest, engines.get(f_path_PDF, "lines"), cache_dir
+        )
+        if pairs is None:
+            misses.append(f_path_PDF)
+        else:
+            extracted[f_path_PDF] = pairs
+    print(f"Extraction cache: {len(extracted)} hit(s), {len(misses)} miss(es)")
+
+    if misses:
+        for f_path_PDF, pairs in extract(misses).items():
+            extracted[f_path_PDF] = pairs
+            if not pairs:
+                print(f"No pairs extracted from {f_path_PDF}, not cached")
+                continue
+            store_cached_pairs(
+                digests[f_path_PDF],
+                pairs,
+                engine=engines.get(f_path_PDF, "lines"),
+                source=os.path.basename(f_path_PDF),
+                cache_dir=cache_dir,
+            )
+
+    return {f_path_PDF: extracted[f_path_PDF] for f_path_PDF in f_paths_PDF}
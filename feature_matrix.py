@@ -1,9 +1,20 @@
+import functools
 import random
+
+import numpy as np
 import pandas as pd
-from itertools import product
 
 class IrishFeatureMatrix:
-    def __init__(self):
+    """All person x verb x preposition x case x tense combinations.
+
+    Only the axis vocabularies are stored: combination i is decoded from i as a
+    mixed-radix number (last axis fastest, the same order as
+    itertools.product), so construction is O(sum of axes) and sampling or
+    filtering never builds the full product. feature_matrix still gives the
+    full DataFrame, built on first use.
+    """
+
+    def __init__(self, extra_axes=None):
         # Person features (1st, 2nd, 3rd singular/plural)
         self.persons = [
             "1sg",  # mé/mise
@@ -65,25 +76,57 @@ class IrishFeatureMatrix:
             "Aimsir Gnáthláithreach" # Present habitual
         ]
         
-        # Create the full feature matrix
-        self.feature_matrix = self._create_matrix()
-    
-    def _create_matrix(self):
-        """Create a pandas DataFrame with all feature combinations including tense"""
-        combinations = list(product(
-            self.persons, 
-            self.verbs, 
-            self.prepositions, 
-            self.cases,
-            self.tenses  # Add tense to the combinations
-        ))
-        
-        df = pd.DataFrame(combinations, columns=[
-            'person', 'verb', 'preposition', 'case', 'tense'
-        ])
-        
-        return df
-    
+        # Axis name -> vocabulary, in combination order; extra_axes (e.g.
+        # {"number": ["singular", "plural"]}) are appended after tense
+        self.axes = {
+            'person': self.persons,
+            'verb': self.verbs,
+            'preposition': self.prepositions,
+            'case': self.cases,
+            'tense': self.tenses,
+        }
+        self.axes.update(extra_axes or {})
+        self.radices = np.array([len(values) for values in self.axes.values()], dtype=np.int64)
+        # strides[k]: how far apart combinations that differ by 1 on axis k are
+        self.strides = np.ones(len(self.radices), dtype=np.int64)
+        self.strides[:-1] = np.cumprod(self.radices[::-1])[:-1][::-1]
+        self.total_combinations = int(np.prod(self.radices))
+        self._codes = {
+            name: {value: code for code, value in enumerate(values)}
+            for name, values in self.axes.items()
+        }
+
+    def __len__(self):
+        return self.total_combinations
+
+    @functools.cached_property
+    def feature_matrix(self):
+        """pandas DataFrame of every feature combination, built on first use"""
+        return self.decode(np.arange(self.total_combinations))
+
+    def decode(self, indices):
+        """DataFrame of the combinations with these indices (categorical
+        columns, indexed by combination index)"""
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = {}
+        for (name, values), radix, stride in zip(self.axes.items(), self.radices, self.strides):
+            codes = indices // stride % radix
+            columns[name] = pd.Categorical.from_codes(codes, categories=values)
+        return pd.DataFrame(columns, index=pd.Index(indices))
+
+    def encode(self, **features):
+        """Combination index of one value per axis"""
+        return int(
+            sum(self._codes[name][features[name]] * stride for name, stride in zip(self.axes, self.strides))
+        )
+
+    def sample_indices(self, n=1, ensure_variation=True):
+        """n random combination indices, distinct if ensure_variation"""
+        if ensure_variation and n <= self.total_combinations:
+            # sampling from a range doesn't materialise it
+            return random.sample(range(self.total_combinations), n)
+        return [random.randrange(self.total_combinations) for _ in range(n)]
+
     def sample_features(self, n=1, ensure_variation=True):
         """
         Sample n feature combinations from the matrix
@@ -95,12 +138,24 @@ class IrishFeatureMatrix:
         Returns:
             pd.DataFrame: Sampled feature combinations
         """
-        if ensure_variation and n <= len(self.feature_matrix):
-            return self.feature_matrix.sample(n=n, replace=False).reset_index(drop=True)
-        else:
-            return self.feature_matrix.sample(n=n, replace=True).reset_index(drop=True)
-    
-    def get_features_by_criteria(self, person=None, verb=None, preposition=None, case=None, tense=None):
+        return self.decode(self.sample_indices(n, ensure_variation)).reset_index(drop=True)
+
+    def criteria_indices(self, person=None, verb=None, preposition=None, case=None, tense=None, **criteria):
+        """Sorted indices of the combinations matching the criteria (None = any)"""
+        criteria.update(person=person, verb=verb, preposition=preposition, case=case, tense=tense)
+        indices = np.zeros(1, dtype=np.int64)
+        for name, radix, stride in zip(self.axes, self.radices, self.strides):
+            value = criteria.get(name)
+            if value:
+                code = self._codes[name].get(value)
+                codes = np.array([] if code is None else [code], dtype=np.int64)
+            else:
+                codes = np.arange(radix, dtype=np.int64)
+            # outer sum keeps the indices sorted, axis by axis
+            indices = (indices[:, None] + codes[None, :] * stride).ravel()
+        return indices
+
+    def get_features_by_criteria(self, person=None, verb=None, preposition=None, case=None, tense=None, **criteria):
         """
         Filter the matrix by specific criteria
         
@@ -110,32 +165,53 @@ class IrishFeatureMatrix:
             preposition (str): Specific preposition to filter by
             case (str): Specific case to filter by
             tense (str): Specific tense to filter by
+            **criteria: Values for any extra axes
         
         Returns:
-            pd.DataFrame: Filtered feature combinations
+            pd.DataFrame: Filtered feature combinations, indexed by combination index
         """
-        filtered = self.feature_matrix.copy()
-        
-        if person:
-            filtered = filtered[filtered['person'] == person]
-        if verb:
-            filtered = filtered[filtered['verb'] == verb]
-        if preposition:
-            filtered = filtered[filtered['preposition'] == preposition]
-        if case:
-            filtered = filtered[filtered['case'] == case]
-        if tense:
-            filtered = filtered[filtered['tense'] == tense]
-            
-        return filtered
+        return self.decode(
+            self.criteria_indices(person, verb, preposition, case, tense, **criteria)
+        )
     
+    def plan_indices(self, n, seed=None):
+        """Combination indices for n draws with balanced coverage of every axis.
+
+        Each axis gets every value n // radix times, plus n % radix values
+        chosen at random once more, shuffled independently of the other axes,
+        so no verb/tense/... is over- or under-used across a run. The same
+        seed gives the same plan.
+        """
+        rng = np.random.default_rng(seed)
+        indices = np.zeros(n, dtype=np.int64)
+        for radix, stride in zip(self.radices, self.strides):
+            codes = np.concatenate(
+                [
+                    np.tile(np.arange(radix), n // radix),
+                    rng.choice(radix, n % radix, replace=False),
+                ]
+            )
+            indices += rng.permutation(codes) * stride
+        return indices
+
+    def iter_planned_features(self, n, seed=None):
+        """Iterator over n {axis: value} feature dicts planned by plan_indices()"""
+        indices = self.plan_indices(n, seed)
+        names = list(self.axes)
+        columns = [
+            np.asarray(values, dtype=object)[indices // stride % radix].tolist()
+            for values, radix, stride in zip(self.axes.values(), self.radices, self.strides)
+        ]
+        for row in zip(*columns):
+            yield dict(zip(names, row))
+
     def sample_random_combination(self):
         """Sample a single random feature combination"""
         return self.sample_features(n=1).iloc[0]
     
     def get_matrix_info(self):
         """Get information about the feature matrix"""
-        total_combinations = len(self.feature_matrix)
+        total_combinations = self.total_combinations
         
         print(f"Irish Feature Matrix Summary:")
         print(f"- Total combinations: {total_combinations:,}")
@@ -144,6 +220,8 @@ class IrishFeatureMatrix:
         print(f"- Prepositions: {len(self.prepositions)} ({', '.join(self.prepositions)})")
         print(f"- Cases: {len(self.cases)} ({', '.join(self.cases)})")
         print(f"- Tenses: {len(self.tenses)} ({', '.join(self.tenses)})")
+        for name, values in list(self.axes.items())[5:]:
+            print(f"- {name}: {len(values)} ({', '.join(values)})")
         
         return {
             'total_combinations': total_combinations,
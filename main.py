@@ -1,36 +1,270 @@
+import argparse
 import csv
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from extraction_cache import CACHE_DIR, cached_extract
+from parquet_io import PLACENAMES_PARQUET, write_parquet
 from pdf_to_data_set import (
     file_names_from_dir,
-    pdf_to_place_names_list,
+    extracted_place_names,
+    iter_place_names,
+    pdf_pages_to_place_names_list,
+    pdf_page_count,
+    dedupe_place_names,
     get_area_from_f_name,
+    ENGINES,
 )
 
+# Large orders (Corcaigh, Gaillimh, ...) are split into chunks of this many
+# pages so that one big PDF doesn't end up on a single worker
+PAGES_PER_TASK = 16
 
-def main():
-    directory = "./placenames/placenames"
-    files = file_names_from_dir(directory)
+# Orders whose layout the line heuristic handles badly (number on the same line
+# as the name, names wrapped over two lines, extra OS/townland columns) and that
+# are extracted with the coordinate-based "words" engine instead. Only listed
+# where it measurably wins: e.g. 1951 pairs instead of 333 for Luimneach, while
+# on ceantair-ghaeltachta-2011 it finds fewer (5610 vs 5946) and is slower
+ENGINE_BY_FILE = {
+    "an-tordu-logainmneacha-contae-chill-chainnigh-2003.pdf": "words",
+    "an-tordu-logainmneacha-contae-loch-garman-2016-dreacht.pdf": "words",
+    "an-tordu-logainmneacha-contae-luimnigh-2003.pdf": "words",
+    "an-tordu-logainmneacha-contae-mhuineachain-2003.pdf": "words",
+    "an-tordu-logainmneacha-contae-phort-lairge-2003.pdf": "words",
+    "an-tordu-logainmneacha-contae-uibh-fhaili-2003.pdf": "words",
+    "an-tordu-logainmneacha-cuigi-agus-contaetha-2003.pdf": "words",
+}
+
+
+def engine_for_file(f_name, default="lines"):
+    return ENGINE_BY_FILE.get(os.path.basename(f_name), default)
+
+
+def _extract_pages(task):
+    f_path_PDF, start, stop, engine = task
+    return pdf_pages_to_place_names_list(f_path_PDF, start, stop, engine)
+
+
+def extract_place_names_parallel(
+    f_paths_PDF, workers=None, pages_per_task=PAGES_PER_TASK, engines=None
+):
+    """Extract (en, ga) pairs from several PDFs with a process pool.
+
+    Each PDF is split into page ranges which are farmed out to the workers;
+    results are merged back in file/page order so the output is identical to
+    calling pdf_to_place_names_list() on each file in turn. engines optionally
+    maps a path to its extraction engine (default "lines").
+    """
+    engines = engines or {}
+    tasks = []
+    for f_path_PDF in f_paths_PDF:
+        n_pages = pdf_page_count(f_path_PDF)
+        engine = engines.get(f_path_PDF, "lines")
+        for start in range(0, n_pages, pages_per_task):
+            tasks.append(
+                (f_path_PDF, start, min(start + pages_per_task, n_pages), engine)
+            )
+
+    pairs_by_file = {f_path_PDF: [] for f_path_PDF in f_paths_PDF}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() yields results in submission order, whichever worker finishes first
+        for task, pairs in zip(tasks, executor.map(_extract_pages, tasks)):
+            pairs_by_file[task[0]].extend(pairs)
+
+    return {
+        f_path_PDF: dedupe_place_names(pairs)
+        for f_path_PDF, pairs in pairs_by_file.items()
+    }
+
+
+def extract_place_names(f_paths_PDF, workers=1, engines=None):
+    """{path: [(en, ga), ...]} for each PDF, serially or with a process pool."""
+    engines = engines or {}
+    if workers == 1:
+        return {
+            f_path_PDF: list(
+                extracted_place_names(f_path_PDF, engine=engines.get(f_path_PDF, "lines"))
+            )
+            for f_path_PDF in f_paths_PDF
+        }
+    return extract_place_names_parallel(f_paths_PDF, workers=workers, engines=engines)
+
+
+def write_place_names_csv(records, csv_path="placenames.csv"):
+    """Write (area, en, ga) records to the placenames CSV as they arrive.
+
+    records can be any iterable, e.g. the iter_place_names() generator, so rows
+    reach the file while later pages are still being parsed.
+    """
+    n_rows = 0
+    with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Ceantar", "Logainm"])
+        for area, en, ga in records:
+            writer.writerow((area, ga))
+            n_rows += 1
+    return n_rows
+
+
+def write_place_names_parquet(records, root=PLACENAMES_PARQUET):
+    """Write (area, en, ga) records as a Parquet dataset partitioned by area.
 
-    rows = []
-    place_names = {}
+    Unlike the CSV it keeps the English names (as aliases for lookups), and
+    reading it back never depends on the text encoding. Rows keep their CSV
+    order (see parquet_io.ROW_COLUMN).
+
+    The dataset is written next to root and swapped into place, so a failed
+    run leaves the old one intact and areas that are gone don't linger as
+    stale partitions. root must be a *.parquet directory (or not exist yet).
+    """
+    import pandas as pd
+
+    root = os.path.normpath(root)
+    if not root.endswith(".parquet") or (
+        os.path.exists(root) and not os.path.isdir(root)
+    ):
+        raise ValueError(f"{root} is not a *.parquet dataset directory")
+    df = pd.DataFrame(list(records), columns=["Ceantar", "English", "Logainm"])
+    tmp_root = f"{root}.{os.getpid()}.tmp"
+    old_root = f"{root}.{os.getpid()}.old"
+    write_parquet(
+        df[["Ceantar", "Logainm", "English"]],
+        tmp_root,
+        ["Ceantar"],
+        "placenames",
+        row_numbers=True,
+    )
+    if os.path.isdir(root):
+        os.replace(root, old_root)
+    os.replace(tmp_root, root)
+    shutil.rmtree(old_root, ignore_errors=True)
+    return len(df)
+
+
+def stream_place_name_records(directory, files, engine="lines"):
+    """Yield (area, en, ga) records for every PDF, one page at a time.
+
+    The same rows in the same order as extracted_place_name_records().
+    """
     for f_name in files:
+        area = get_area_from_f_name(f_name)
+        yield from iter_place_names(
+            directory + "/" + f_name, area=area, engine=engine_for_file(f_name, engine)
+        )
+
+
+def write_place_names(records, parquet=None):
+    """placenames.csv, plus a Parquet dataset at `parquet` if given"""
+    if parquet:
+        records = list(records)  # both writers need them
+        write_place_names_parquet(records, parquet)
+    return write_place_names_csv(records)
+
+
+def extracted_place_name_records(
+    directory, files, workers=1, use_cache=True, cache_dir=CACHE_DIR, engine="lines"
+):
+    """(area, en, ga) records for every PDF, file by file.
+
+    Extracted with a process pool and/or from the cache, but otherwise the
+    same rows as stream_place_name_records(): every file keeps its own rows,
+    also when two files are of the same area (e.g. two editions of an order).
+    """
+    f_paths_PDF = [directory + "/" + f_name for f_name in files]
+    engines = {
+        f_path_PDF: engine_for_file(f_name, engine)
+        for f_name, f_path_PDF in zip(files, f_paths_PDF)
+    }
+    if use_cache:
+        # only PDFs that are new or changed since the last run get parsed
+        extracted = cached_extract(
+            f_paths_PDF,
+            lambda misses: extract_place_names(misses, workers=workers, engines=engines),
+            engines=engines,
+            cache_dir=cache_dir,
+        )
+    else:
+        extracted = extract_place_names(f_paths_PDF, workers=workers, engines=engines)
+
+    records = []
+    for f_name, f_path_PDF in zip(files, f_paths_PDF):
         area = get_area_from_f_name(f_name)
         # print(area)
-        f_path_PDF = directory + "/" + f_name
-        place_names[area] = pdf_to_place_names_list(
-            f_path_PDF
-        )  # List of (en, ga) tuples
-    rows = []
-    for area in place_names:
-        for en, ga in place_names[area]:
-            rows.append((area, ga))
-
-    # Write to CSV
-    with open("placenames.csv", "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["Ceantar", "Logainm"])
-        for row in rows:
-            writer.writerow(row)
+        records.extend((area, en, ga) for en, ga in extracted[f_path_PDF])
+    return records
+
+
+def main(
+    workers=1,
+    use_cache=True,
+    cache_dir=CACHE_DIR,
+    stream=False,
+    engine="lines",
+    parquet=None,
+):
+    directory = "./placenames/placenames"
+    files = file_names_from_dir(directory)
+
+    if stream:
+        # serial and uncached: memory stays bounded by a single page (unless
+        # the rows are also kept for the Parquet output)
+        write_place_names(stream_place_name_records(directory, files, engine), parquet)
+        return
+
+    write_place_names(
+        extracted_place_name_records(
+            directory, files, workers, use_cache, cache_dir, engine
+        ),
+        parquet,
+    )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Build placenames.csv from the gazetteer PDFs"
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of extraction processes (0 = one per CPU, default 1)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="re-extract every PDF instead of reusing cached results",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=CACHE_DIR,
+        help=f"extraction cache directory (default {CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="lines",
+        help="extraction engine for PDFs not listed in ENGINE_BY_FILE (default lines)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="write rows page by page as they are parsed (serial, no cache)",
+    )
+    parser.add_argument(
+        "--parquet",
+        nargs="?",
+        const=PLACENAMES_PARQUET,
+        help=f"also write a Parquet dataset partitioned by area (default {PLACENAMES_PARQUET}); needs pyarrow",
+    )
+    args = parser.parse_args()
+    if args.parquet and not os.path.normpath(args.parquet).endswith(".parquet"):
+        parser.error("--parquet needs a *.parquet dataset directory")
+    main(
+        workers=args.workers or None,
+        use_cache=not args.no_cache,
+        cache_dir=args.cache_dir,
+        stream=args.stream,
+        engine=args.engine,
+        parquet=args.parquet,
+    )
@@ -0,0 +1,581 @@
+"""Local stand-in for the Anthropic Messages API, for tests and benchmarks.
+
+    python mock_anthropic_server.py --port 8765 --server-rpm 600 --latency 0.8
+    python synthesis.py --base-url http://127.0.0.1:8765 --skip-checks ...
+
+Serves POST /v1/messages and the Message Batches endpoints with made-up Irish
+sentences (a JSON list for multi-placename prompts), so the whole pipeline runs
+without network or quota. What makes it useful for tuning is that it behaves
+like the real thing under load:
+
+- latency drawn from a lognormal (or fixed/uniform) distribution plus a
+  per-output-token cost, served concurrently
+- requests/min and tokens/min limits enforced with token buckets, answered with
+  429 + retry-after once exhausted, and anthropic-ratelimit-* headers on every
+  response so the async engine can adapt to them
+- random 429/529 injection on top of the limits
+- prompt caching: a cache_control prefix of at least MIN_CACHEABLE_TOKENS
+  seen before is reported as cache_read_input_tokens
+
+The server keeps counters (requests, rejections, service times and the time
+with no request in flight) that benchmark_synthesis.py turns into a report.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY = 0.8  # Median seconds per request
+LATENCY_SIGMA = 0.4  # Lognormal shape; 0 = fixed latency
+SECONDS_PER_OUTPUT_TOKEN = 0.0  # Extra latency per generated token
+REQUESTS_PER_MINUTE = 50
+TOKENS_PER_MINUTE = 50000  # Input + output tokens
+ERROR_RATE = 0.0  # Share of requests answered with a random 429 or 529
+BATCH_SECONDS = 1.0  # Time a message batch stays in_progress
+MIN_CACHEABLE_TOKENS = 1024  # Shorter cache_control prefixes aren't cached, as with the API
+
+SENTENCES = [
+    "Chuaigh mé go {} inné.",
+    "Tá cónaí ar mo dheirfiúr in aice le {}.",
+    "Beidh an cruinniú ar siúl i {} amárach.",
+    "Rugadh m'athair i {}.",
+    "Ar chuala tú an scéal faoi {}?",
+    "Bhí an aimsir go hálainn i {} an samhradh seo caite.",
+]
+
+_PLACENAME_RE = re.compile(r"^Placename: (.+)$", re.MULTILINE)
+_NUMBERED_RE = re.compile(r"^\d+\.\s+(.+)$", re.MULTILINE)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def content_text(content):
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def system_text(system):
+    return content_text(system) if system else ""
+
+
+def cached_prefix(body):
+    """Text up to and including the last block marked with cache_control"""
+    parts = []
+    prefix = None
+    blocks = body.get("system") or []
+    if isinstance(blocks, str):
+        blocks = [{"type": "text", "text": blocks}]
+    for message in [{"content": blocks}] + body["messages"]:
+        content = message["content"]
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for block in content:
+            parts.append(block.get("text", ""))
+            if "cache_control" in block:
+                prefix = "".join(parts)
+    return prefix
+
+
+def placenames_in(body):
+    """Placenames asked for by the last user message: (names, as_json)"""
+    text = content_text(body["messages"][-1]["content"])
+    # previous sentences shown to the model come after the request itself
+    text = text.split("sample of previous sentences")[0]
+    if text.lstrip().startswith("Placenames:"):
+        return _NUMBERED_RE.findall(text), True
+    match = _PLACENAME_RE.search(text)
+    return [match.group(1).strip() if match else "Baile Átha Cliath"], False
+
+
+def answer(body, rng):
+    """Response text for a Messages request"""
+    placenames, as_json = placenames_in(body)
+    sentences = [rng.choice(SENTENCES).format(placename) for placename in placenames]
+    if as_json:
+        return json.dumps(
+            [
+                {"placename": placename, "sentence": sentence}
+                for placename, sentence in zip(placenames, sentences)
+            ],
+            ensure_ascii=False,
+        )
+    return sentences[0]
+
+
+class Bucket:
+    """Thread-safe token bucket refilled continuously up to a per-minute limit"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount):
+        """Take amount if it's there; returns 0, or the seconds until it is"""
+        with self.lock:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return 0.0
+            return (min(amount, self.capacity) - self.level) / self.rate
+
+    def give(self, amount):
+        with self.lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+    def remaining(self):
+        with self.lock:
+            self._refill()
+            return int(self.level)
+
+
+class MockState:
+    """Settings, rate limits and counters shared by the handler threads"""
+
+    def __init__(
+        self,
+        latency=LATENCY,
+        latency_sigma=LATENCY_SIGMA,
+        latency_distribution="lognormal",
+        seconds_per_output_token=SECONDS_PER_OUTPUT_TOKEN,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+        error_rate=ERROR_RATE,
+        batch_seconds=BATCH_SECONDS,
+        seed=None,
+    ):
+        if latency_distribution not in ("lognormal", "uniform", "fixed"):
+            raise ValueError(f"unknown latency distribution {latency_distribution!r}")
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.latency_distribution = latency_distribution
+        self.seconds_per_output_token = seconds_per_output_token
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.error_rate = error_rate
+        self.batch_seconds = batch_seconds
+        self.requests = Bucket(requests_per_minute)
+        self.tokens = Bucket(tokens_per_minute)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.cached_prefixes = set()
+        self.batches = {}
+        self.reset()
+
+    def reset(self):
+        """Zero the counters, e.g. between benchmark runs"""
+        with self.lock:
+            self.received = 0
+            self.succeeded = 0
+            self.rate_limited = 0  # 429s because a bucket was empty
+            self.injected_errors = 0  # random 429/529s
+            self.input_tokens = 0
+            self.output_tokens = 0
+            self.cache_read_tokens = 0
+            self.service_times = []
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.idle_seconds = 0.0
+            self.idle_since = None  # set once the first request arrives
+            self.first_request = None
+            self.last_response = None
+
+    def random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def sample_latency(self, output_tokens):
+        with self.lock:
+            if self.latency_distribution == "lognormal" and self.latency_sigma:
+                latency = self.rng.lognormvariate(math.log(self.latency), self.latency_sigma)
+            elif self.latency_distribution == "uniform":
+                latency = self.rng.uniform(0, 2 * self.latency)
+            else:
+                latency = self.latency
+        return latency + output_tokens * self.seconds_per_output_token
+
+    def start_request(self):
+        now = time.monotonic()
+        with self.lock:
+            self.received += 1
+            if self.first_request is None:
+                self.first_request = now
+            elif self.in_flight == 0:
+                self.idle_seconds += now - self.idle_since
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end_request(self):
+        now = time.monotonic()
+        with self.lock:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.idle_since = now
+            self.last_response = now
+
+    def record_success(self, seconds, usage):
+        with self.lock:
+            self.succeeded += 1
+            self.service_times.append(seconds)
+            self.input_tokens += usage["input_tokens"]
+            self.output_tokens += usage["output_tokens"]
+            self.cache_read_tokens += usage["cache_read_input_tokens"]
+
+    def count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def usage(self, body, output_text):
+        """Token usage of a request, with a repeated cache_control prefix
+        counted as a cache read"""
+        prompt = system_text(body.get("system")) + "".join(
+            content_text(message["content"]) for message in body["messages"]
+        )
+        input_tokens = estimate_tokens(prompt)
+        cache_read = cache_creation = 0
+        prefix = cached_prefix(body)
+        if prefix is not None and estimate_tokens(prefix) >= MIN_CACHEABLE_TOKENS:
+            with self.lock:
+                seen = prefix in self.cached_prefixes
+                self.cached_prefixes.add(prefix)
+            if seen:
+                cache_read = estimate_tokens(prefix)
+            else:
+                cache_creation = estimate_tokens(prefix)
+            input_tokens = max(1, input_tokens - cache_read - cache_creation)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": estimate_tokens(output_text),
+            "cache_creation_input_tokens": cache_creation,
+            "cache_read_input_tokens": cache_read,
+        }
+
+    def message(self, body, rng=None):
+        """A Messages API response object for a request body"""
+        text = answer(body, rng or self.rng)
+        return {
+            "id": f"msg_mock_{next(self.ids)}",
+            "type": "message",
+            "role": "assistant",
+            "model": body["model"],
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": self.usage(body, text),
+        }
+
+    def ratelimit_headers(self):
+        reset = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            minutes=1
+        )
+        reset = reset.isoformat(timespec="seconds").replace("+00:00", "Z")
+        return {
+            "anthropic-ratelimit-requests-limit": str(self.requests_per_minute),
+            "anthropic-ratelimit-requests-remaining": str(self.requests.remaining()),
+            "anthropic-ratelimit-requests-reset": reset,
+            "anthropic-ratelimit-tokens-limit": str(self.tokens_per_minute),
+            "anthropic-ratelimit-tokens-remaining": str(self.tokens.remaining()),
+            "anthropic-ratelimit-tokens-reset": reset,
+        }
+
+    def stats(self):
+        """Counters so far, with service time percentiles"""
+        with self.lock:
+            times = sorted(self.service_times)
+            elapsed = (
+                (self.last_response - self.first_request)
+                if self.first_request is not None and self.last_response is not None
+                else 0.0
+            )
+            return {
+                "received": self.received,
+                "succeeded": self.succeeded,
+                "rate_limited": self.rate_limited,
+                "injected_errors": self.injected_errors,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cache_read_tokens": self.cache_read_tokens,
+                "max_in_flight": self.max_in_flight,
+                "busy_seconds": elapsed - self.idle_seconds,
+                "idle_seconds": self.idle_seconds,
+                "elapsed_seconds": elapsed,
+                "latency_p50": percentile(times, 50),
+                "latency_p99": percentile(times, 99),
+                "latency_mean": sum(times) / len(times) if times else None,
+            }
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def error_body(error_type, message):
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+def iso_time(timestamp):
+    return (
+        datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+        .isoformat(timespec="seconds")
+        .replace("+00:00", "Z")
+    )
+
+
+class MockAnthropicHandler(BaseHTTPRequestHandler):
+    # keep-alive, so a client pool reuses connections like it would with the API
+    protocol_version = "HTTP/1.1"
+    state = None  # a MockState, set by make_server()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("request-id", f"req_mock_{next(self.state.ids)}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/messages":
+            self.create_message(self._read_body())
+        elif path == "/v1/messages/batches":
+            self.create_batch(self._read_body())
+        else:
+            self._send(404, error_body("not_found_error", f"no route {path}"))
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/messages/batches/(\w+)(/results)?", self.path.split("?")[0])
+        if match is None or match.group(1) not in self.state.batches:
+            self._send(404, error_body("not_found_error", f"no route {self.path}"))
+        elif match.group(2):
+            self.batch_results(match.group(1))
+        else:
+            self._send(200, self.batch_object(match.group(1)))
+
+    def create_message(self, body):
+        state = self.state
+        state.start_request()
+        try:
+            started = time.monotonic()
+            if state.random() < state.error_rate:
+                state.count("injected_errors")
+                status, error_type = (
+                    (429, "rate_limit_error")
+                    if state.random() < 0.5
+                    else (529, "overloaded_error")
+                )
+                time.sleep(state.sample_latency(0) / 10)
+                self._send(
+                    status,
+                    error_body(error_type, "injected by mock server"),
+                    {"retry-after": "1", **state.ratelimit_headers()},
+                )
+                return
+
+            estimated = estimate_tokens(json.dumps(body["messages"], ensure_ascii=False))
+            wait = state.requests.take(1)
+            if not wait:
+                wait = state.tokens.take(estimated + body.get("max_tokens", 0) // 4)
+                if wait:
+                    state.requests.give(1)
+            if wait:
+                state.count("rate_limited")
+                self._send(
+                    429,
+                    error_body("rate_limit_error", "mock rate limit exceeded"),
+                    {"retry-after": str(math.ceil(wait)), **state.ratelimit_headers()},
+                )
+                return
+
+            message = state.message(body)
+            time.sleep(state.sample_latency(message["usage"]["output_tokens"]))
+            state.record_success(time.monotonic() - started, message["usage"])
+            self._send(200, message, state.ratelimit_headers())
+        finally:
+            state.end_request()
+
+    def create_batch(self, body):
+        batch_id = f"msgbatch_mock_{next(self.state.ids)}"
+        self.state.batches[batch_id] = (time.time(), body["requests"])
+        self._send(200, self.batch_object(batch_id))
+
+    def batch_object(self, batch_id):
+        created, requests = self.state.batches[batch_id]
+        ended = time.time() - created >= self.state.batch_seconds
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else len(requests),
+                "succeeded": len(requests) if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": iso_time(created),
+            "expires_at": iso_time(created + 24 * 3600),
+            "ended_at": iso_time(created + self.state.batch_seconds) if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": (
+                f"http://{self.headers['Host']}/v1/messages/batches/{batch_id}/results"
+                if ended
+                else None
+            ),
+        }
+
+    def batch_results(self, batch_id):
+        _, requests = self.state.batches[batch_id]
+        rng = random.Random(batch_id)
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": request["custom_id"],
+                    "result": {
+                        "type": "succeeded",
+                        "message": self.state.message(request["params"], rng),
+                    },
+                },
+                ensure_ascii=False,
+            )
+            for request in requests
+        ]
+        self._send(200, ("\n".join(lines) + "\n").encode("utf-8"), content_type="application/binary")
+
+
+def make_server(host="127.0.0.1", port=0, **settings):
+    """A ThreadingHTTPServer with its own MockState (server.state); settings
+    are MockState's keyword arguments"""
+    handler = type("Handler", (MockAnthropicHandler,), {"state": MockState(**settings)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = handler.state
+    server.base_url = f"http://{host}:{server.server_port}"
+    return server
+
+
+def start_server(host="127.0.0.1", port=0, **settings):
+    """make_server() serving from a daemon thread; call server.shutdown() when done"""
+    server = make_server(host, port, **settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_server_arguments(parser):
+    """Latency, limit and error options shared with benchmark_synthesis.py"""
+    group = parser.add_argument_group("mock server")
+    group.add_argument(
+        "--latency",
+        type=float,
+        default=LATENCY,
+        help=f"median seconds per request (default {LATENCY})",
+    )
+    group.add_argument(
+        "--latency-sigma",
+        type=float,
+        default=LATENCY_SIGMA,
+        help=f"lognormal sigma (default {LATENCY_SIGMA})",
+    )
+    group.add_argument(
+        "--latency-distribution",
+        choices=["lognormal", "uniform", "fixed"],
+        default="lognormal",
+    )
+    group.add_argument(
+        "--seconds-per-output-token",
+        type=float,
+        default=SECONDS_PER_OUTPUT_TOKEN,
+        help="extra latency per generated token",
+    )
+    group.add_argument(
+        "--server-rpm",
+        type=int,
+        default=REQUESTS_PER_MINUTE,
+        help=f"requests/min the server allows (default {REQUESTS_PER_MINUTE})",
+    )
+    group.add_argument(
+        "--server-tpm",
+        type=int,
+        default=TOKENS_PER_MINUTE,
+        help=f"tokens/min the server allows (default {TOKENS_PER_MINUTE})",
+    )
+    group.add_argument(
+        "--error-rate",
+        type=float,
+        default=ERROR_RATE,
+        help="share of requests answered with a random 429/529",
+    )
+    group.add_argument(
+        "--batch-seconds",
+        type=float,
+        default=BATCH_SECONDS,
+        help=f"seconds a message batch stays in progress (default {BATCH_SECONDS})",
+    )
+    group.add_argument("--server-seed", type=int, help="seed for latencies and errors")
+    return group
+
+
+def server_settings(args):
+    return {
+        "latency": args.latency,
+        "latency_sigma": args.latency_sigma,
+        "latency_distribution": args.latency_distribution,
+        "seconds_per_output_token": args.seconds_per_output_token,
+        "requests_per_minute": args.server_rpm,
+        "tokens_per_minute": args.server_tpm,
+        "error_rate": args.error_rate,
+        "batch_seconds": args.batch_seconds,
+        "seed": args.server_seed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, **server_settings(args))
+    print(f"Mock Anthropic API on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.state.stats(), indent=2))
@@ -0,0 +1,164 @@
+"""Bounded sentence history with a MinHash near-duplicate index.
+
+The synthesis prompt shows the model some of its earlier sentences so it
+varies verbs, tenses and structure. SentenceHistory keeps the last `capacity`
+sentences in a ring buffer, so memory stays flat however many sentences are
+generated, and indexes each one by a MinHash signature of its character
+n-grams in LSH band buckets. That makes two things cheap:
+
+- flagging a new sentence that is a near-duplicate of one already generated
+- finding the earlier sentences most similar to a given one, to show the model
+  the patterns it keeps repeating rather than only a random sample
+
+Signatures are computed outside the lock and sampling doesn't take it at all,
+so the lock is only held for the few dict updates of an insert.
+"""
+
+import random
+import re
+import threading
+import zlib
+
+import numpy as np
+
+NUM_PERM = 64  # MinHash permutations (signature length)
+BANDS = 8  # LSH bands of NUM_PERM // BANDS rows; candidates from ~0.7 similarity
+NGRAM = 4  # Character n-grams
+DUPLICATE_THRESHOLD = 0.8  # Estimated Jaccard similarity that counts as a near-duplicate
+HISTORY_CAPACITY = 10000
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class MinHasher:
+    """MinHash signatures of the character n-gram sets of sentences"""
+
+    def __init__(self, num_perm=NUM_PERM, ngram=NGRAM, seed=1):
+        rng = np.random.RandomState(seed)
+        # a, b < 2**31 and 32-bit n-gram hashes keep a * h + b inside uint64
+        self.a = rng.randint(1, 1 << 31, num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, num_perm).astype(np.uint64)
+        self.ngram = ngram
+
+    def shingles(self, text):
+        text = _WHITESPACE_RE.sub(" ", text.lower()).strip()
+        if len(text) <= self.ngram:
+            return {text}
+        return {text[i : i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)), dtype=np.uint64
+        )
+        permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+
+class SentenceHistory:
+    """Ring buffer of the last `capacity` sentences with an LSH index"""
+
+    def __init__(
+        self,
+        capacity=HISTORY_CAPACITY,
+        num_perm=NUM_PERM,
+        bands=BANDS,
+        threshold=DUPLICATE_THRESHOLD,
+        seed=1,
+    ):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.capacity = capacity
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, seed=seed)
+        self.rows = num_perm // bands
+        self.sentences = [None] * capacity
+        self.signatures = np.zeros((capacity, num_perm), dtype=np.uint64)
+        self.buckets = [{} for _ in range(bands)]  # band key -> slots
+        self.next_slot = 0
+        self.size = 0
+        self.added = 0
+        self.near_duplicates = 0
+        self.last = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _band_keys(self, signature):
+        return [
+            signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            for band in range(len(self.buckets))
+        ]
+
+    def _candidates(self, band_keys):
+        slots = set()
+        for buckets, key in zip(self.buckets, band_keys):
+            slots.update(buckets.get(key, ()))
+        return slots
+
+    def _ranked(self, signature, slots, n):
+        """The n (estimated Jaccard similarity, sentence) pairs of slots closest
+        to signature, most similar first"""
+        if not slots:
+            return []
+        slots = np.fromiter(slots, dtype=np.intp, count=len(slots))
+        similarities = (self.signatures[slots] == signature).mean(axis=1)
+        order = np.argsort(-similarities, kind="stable")[:n]
+        return [(float(similarities[i]), self.sentences[slots[i]]) for i in order]
+
+    def add(self, sentence):
+        """Add a sentence; returns (similarity, sentence) of the closest earlier
+        near-duplicate, or None if it isn't one"""
+        signature = self.hasher.signature(sentence)
+        band_keys = self._band_keys(signature)
+        with self.lock:
+            ranked = self._ranked(signature, self._candidates(band_keys), 1)
+            duplicate = ranked[0] if ranked and ranked[0][0] >= self.threshold else None
+
+            slot = self.next_slot
+            if self.sentences[slot] is not None:
+                # evict the oldest sentence from the index
+                for buckets, key in zip(self.buckets, self._band_keys(self.signatures[slot])):
+                    bucket = buckets[key]
+                    bucket.discard(slot)
+                    if not bucket:
+                        del buckets[key]
+            self.sentences[slot] = sentence
+            self.signatures[slot] = signature
+            for buckets, key in zip(self.buckets, band_keys):
+                buckets.setdefault(key, set()).add(slot)
+            self.next_slot = (slot + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+            self.added += 1
+            self.last = sentence
+            if duplicate is not None:
+                self.near_duplicates += 1
+        return duplicate
+
+    def most_similar(self, text, n=10):
+        """Up to n (similarity, sentence) pairs from the history closest to text"""
+        signature = self.hasher.signature(text)
+        with self.lock:
+            return self._ranked(signature, self._candidates(self._band_keys(signature)), n)
+
+    def sample(self, n=10):
+        """n random sentences from the history, without taking the lock"""
+        size = self.size
+        slots = random.sample(range(size), min(n, size))
+        return [self.sentences[slot] for slot in slots]
+
+    def sample_for_prompt(self, n=10):
+        """Sentences to show the model: the ones most similar to the latest
+        sentence (the pattern it is currently repeating), topped up at random"""
+        chosen = []
+        last = self.last
+        if last is not None:
+            chosen = [sentence for _, sentence in self.most_similar(last, n // 2)]
+        for sentence in self.sample(n):
+            if len(chosen) >= n:
+                break
+            if sentence not in chosen:
+                chosen.append(sentence)
+        return chosen
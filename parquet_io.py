@@ -0,0 +1,182 @@
+"""Partitioned Parquet copies of the placename and sentence tables, and
+readers that take either format.
+
+placenames.csv and the synthetic sentence CSVs are re-parsed in full by pandas
+on every load, and their text encoding depends on who wrote them (utf-8 vs
+utf-8-sig, and mojibake in synthetic_sentences.csv). Parquet stores strings as
+UTF-8 by definition, with the repeated values (areas, models, placenames)
+dictionary-encoded, and a reader only decodes the columns and partitions it
+asks for:
+
+    placenames.parquet/Ceantar=ceantair ghaeltachta/placenames-0.parquet
+    synthetic_sentences.parquet/model=claude-3-haiku-20240307/..._simple_sampling-0.parquet
+
+pyarrow is optional: it's only imported when a Parquet file is written or
+read, and the readers fall back to pandas for CSV paths. Existing CSVs can be
+converted with
+
+    python parquet_io.py big_data/synthetic_sentences_..._final.csv --partition-by model
+"""
+
+import argparse
+import os
+
+PLACENAMES_PARQUET = "./placenames.parquet"
+SENTENCES_PARQUET = "./synthesis/synthetic_sentences.parquet"
+COMPRESSION = "zstd"
+# Position of each row in the source CSV. A partitioned dataset reads back
+# partition by partition, so without it placenames.parquet would come back in
+# a different row order than placenames.csv (and journal indices, --start/--stop
+# and shards would point at different rows depending on the input format)
+ROW_COLUMN = "row"
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def is_parquet(path):
+    """True for a .parquet file or a partitioned dataset directory"""
+    return str(path).endswith(".parquet") or os.path.isdir(path)
+
+
+def write_parquet(df, root, partition_cols, basename="part", row_numbers=False):
+    """Write df as a hive-partitioned dataset under root.
+
+    String columns are stored dictionary-encoded (and read back as pandas
+    categoricals). Files are named <basename>-<i>.parquet inside each
+    partition and overwrite earlier files of the same name only, so runs with
+    different basenames (e.g. SLURM shards) add to the same partition.
+    With row_numbers, df's row order is kept in ROW_COLUMN so read_table can
+    restore it.
+    """
+    pa = import_pyarrow()
+    df = df.copy()
+    if row_numbers:
+        df[ROW_COLUMN] = range(len(df))
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].astype("category")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pa.parquet.write_to_dataset(
+        table,
+        root,
+        partition_cols=list(partition_cols),
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        compression=COMPRESSION,
+    )
+    return root
+
+
+def read_table(path, columns=None, where=None):
+    """A CSV or Parquet table as a DataFrame, with only `columns` (default
+    all) and only the rows whose `where` columns take one of the given values,
+    e.g. where={"model": ["claude-3-haiku-20240307"]}.
+
+    For Parquet only the needed columns are decoded and partitions that don't
+    match `where` are never opened. Datasets written with row numbers come
+    back in their original row order.
+    """
+    where = where or {}
+    if is_parquet(path):
+        pa = import_pyarrow()
+        filters = [(column, "in", list(values)) for column, values in where.items()]
+        ordered = ROW_COLUMN in pa.parquet.ParquetDataset(path).schema.names
+        read_columns = columns
+        if ordered and columns is not None and ROW_COLUMN not in columns:
+            read_columns = [*columns, ROW_COLUMN]
+        table = pa.parquet.read_table(
+            path, columns=read_columns, filters=filters or None
+        )
+        df = table.to_pandas()
+        if ordered:
+            df = df.sort_values(ROW_COLUMN, kind="stable").reset_index(drop=True)
+            if columns is None or ROW_COLUMN not in columns:
+                df = df.drop(columns=ROW_COLUMN)
+        # the partition columns read back as categoricals of every partition
+        for column in where:
+            if column in df and hasattr(df[column], "cat"):
+                df[column] = df[column].cat.remove_unused_categories()
+        return df
+
+    import pandas as pd
+
+    usecols = None if columns is None else list(dict.fromkeys([*columns, *where]))
+    df = pd.read_csv(path, encoding="utf-8-sig", usecols=usecols)
+    for column, values in where.items():
+        df = df[df[column].isin(values)]
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+
+def read_placenames(path=PLACENAMES_PARQUET, columns=("Logainm",), areas=None):
+    """Placename rows (Ceantar, Logainm and, in Parquet, English), optionally
+    only those of some areas"""
+    where = {"Ceantar": areas} if areas is not None else None
+    return read_table(path, columns=list(columns) if columns else None, where=where)
+
+
+def read_sentences(path=SENTENCES_PARQUET, columns=None, models=None):
+    """Synthetic sentence rows (placename, sentence, model), optionally only
+    those of some models"""
+    where = {"model": models} if models is not None else None
+    return read_table(path, columns=list(columns) if columns else None, where=where)
+
+
+def repair_mojibake(text):
+    """Undo UTF-8 that was decoded as cp1252 ("TÃ¡" -> "Tá"); text that
+    isn't mojibake (it doesn't round-trip) is returned unchanged"""
+    if not isinstance(text, str):
+        return text
+    try:
+        return text.encode("cp1252").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return text
+
+
+def convert_csv(csv_path, root=None, partition_by=(), repair=False):
+    """Write a CSV as a Parquet dataset (default <csv stem>.parquet)"""
+    import pandas as pd
+
+    root = root or os.path.splitext(csv_path)[0] + ".parquet"
+    df = pd.read_csv(csv_path, encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    if repair:
+        for column in df.columns:
+            df[column] = df[column].map(repair_mojibake)
+    basename = os.path.splitext(os.path.basename(csv_path))[0]
+    write_parquet(df, root, partition_by, basename, row_numbers=bool(partition_by))
+    return root, len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a placenames or sentences CSV to a Parquet dataset"
+    )
+    parser.add_argument("csv_path")
+    parser.add_argument(
+        "-o", "--output", help="dataset directory (default <csv>.parquet)"
+    )
+    parser.add_argument(
+        "--partition-by",
+        nargs="*",
+        default=[],
+        help="partition columns, e.g. Ceantar or model",
+    )
+    parser.add_argument(
+        "--repair-mojibake",
+        action="store_true",
+        help='fix cells of UTF-8 mis-decoded as cp1252 ("TÃ¡" -> "Tá")',
+    )
+    args = parser.parse_args()
+
+    root, n_rows = convert_csv(
+        args.csv_path, args.output, args.partition_by, args.repair_mojibake
+    )
+    print(f"Wrote {n_rows} rows to {root}")
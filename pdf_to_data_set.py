@@ -17,10 +17,39 @@ Plan:
         else:
               """
 
+import functools
 import os
 import fitz
 import re
 
+# Bump whenever a change to the parser changes the pairs it extracts, so that
+# cached extraction results (see extraction_cache.py) are rebuilt
+PARSER_VERSION = 1
+
+# Patterns used on every line of every page, compiled once
+UPPER_RUN_RE = re.compile(r"[A-Z]{3}")
+DIGIT_RE = re.compile(r"\d")
+NUMBER_RE = re.compile(r"\d+\.?\s*$")
+SQUARE_BRACKETS_RE = re.compile(r"\[.*?\]")
+PARENTHESES_RE = re.compile(r"\(.*?\)")
+BRACKET_CHAR_RE = re.compile(r"[\[\]\(\)]")
+
+# Line classes for the number/en/ga/number window, one character per line so
+# a whole page can be matched with a single regex scan
+LINE_OTHER = "o"
+LINE_NUMBER = "n"
+LINE_NAME = "v"
+# lookahead so that consecutive entries sharing a number line all match
+PAIR_WINDOW_RE = re.compile(f"(?={LINE_NUMBER}{LINE_NAME}{LINE_NAME}{LINE_NUMBER})")
+
+# Extraction engines: "lines" is the plain text number/en/ga/number heuristic,
+# "words" pairs the columns using word coordinates (page_words_to_place_names)
+ENGINES = ("lines", "words")
+# how far (in points) a wrapped line may sit from its column's left edge
+WORD_COLUMN_TOLERANCE = 4
+# fraction of a line's height it must overlap a row by to be part of that row
+ROW_OVERLAP = 0.25
+
 
 # function that takes directory path as input and returns a list the files within
 def file_names_from_dir(dir_path):
@@ -46,9 +75,9 @@ def file_names_from_dir(dir_path):
 def is_valid_name(s):
     if s == "":
         return False
-    if re.search(r"[A-Z]{3}", s):
+    if UPPER_RUN_RE.search(s):
         return False
-    if re.search(r"\d", s):
+    if DIGIT_RE.search(s):
         return False
     else:
         return True
@@ -60,9 +89,11 @@ def clean_name_brackets(s):
     E.g. "Adamstown [ED:Garristown]" → "Adamstown"
     """
     # Remove anything in square brackets, including the brackets themselves
-    s = re.sub(r"\[.*?\]", "", s)
+    if "[" in s:
+        s = SQUARE_BRACKETS_RE.sub("", s)
     # Remove anything in parentheses, including the parentheses themselves
-    s = re.sub(r"\(.*?\)", "", s)
+    if "(" in s:
+        s = PARENTHESES_RE.sub("", s)
     return s.strip()
 
 
@@ -78,71 +109,260 @@ def handle_or_case(en_name, ga_name):
 
 
 def is_number(s):
-    return re.fullmatch(r"\d+\.?\s*$", s) is not None
+    return NUMBER_RE.fullmatch(s) is not None
 
 
-def pdf_to_place_names_list(fn_name_pdf):
-    set_of_tuples = set()
-    """Extract all English-Irish placename pairs from a PDF."""
+def classify_line(s):
+    """Class of a text line: LINE_NUMBER, LINE_NAME (is_valid_name) or LINE_OTHER."""
+    if NUMBER_RE.fullmatch(s) is not None:
+        return LINE_NUMBER
+    if is_valid_name(s):
+        return LINE_NAME
+    return LINE_OTHER
+
+
+def page_lines_to_place_names(lines):
+    """Extract the (en, ga) pairs found in the text lines of a single page.
+
+    Pairs are returned in page order and are not de-duplicated, so pages can be
+    processed independently and merged with dedupe_place_names().
+    """
+    # classify every line once, then find all number/en/ga/number windows
+    line_classes = "".join(map(classify_line, lines))
+    place_name_pairs = []
+    for match in PAIR_WINDOW_RE.finditer(line_classes):
+        i = match.start()
+        pair = clean_place_name_pair(lines[i + 1], lines[i + 2])
+        if pair is not None:
+            place_name_pairs.append(pair)
+    return place_name_pairs
+
+
+def clean_place_name_pair(en_name, ga_name):
+    """Clean a raw (en, ga) pair; returns None if the pair should be dropped."""
+    en_name = clean_name_brackets(en_name.strip())
+    ga_name = clean_name_brackets(ga_name.strip())
+
+    if "[" in en_name and "]" in ga_name:
+        return None
+
+    # keep it simple and just keep the first name
+    if (" or " in en_name) or (" nó " in ga_name):
+        en_name, ga_name = handle_or_case(en_name, ga_name)
+    if not (is_valid_name(en_name) and is_valid_name(ga_name)):
+        return None
+    if BRACKET_CHAR_RE.search(en_name) or BRACKET_CHAR_RE.search(ga_name):
+        return None
+    return en_name, ga_name
+
+
+def _page_text_lines(page):
+    """Group a page's words into text lines: (x0, y0, y1, [words]) in reading order."""
+    lines = {}
+    for x0, y0, _, y1, word, block_no, line_no, _ in page.get_text("words"):
+        # words on a line share its bbox height, the first word's is enough
+        line = lines.get((block_no, line_no))
+        if line is None:
+            lines[(block_no, line_no)] = [x0, y0, y1, [word]]
+        else:
+            line[3].append(word)
+    return sorted(lines.values(), key=lambda line: ((line[1] + line[2]) / 2, line[0]))
+
+
+def _page_rows(page):
+    """Cluster a page's text lines into rows that share a baseline.
+
+    Lines that overlap vertically by more than ROW_OVERLAP of their height join
+    the same row, which catches a name wrapped onto two lines and centred on its
+    entry's row. Each row is (y0, y1, [(x0, [words]), ...]), one element per
+    column, left to right, with a column's lines joined top to bottom.
+    """
+    rows = []
+    for line in _page_text_lines(page):
+        x0, y0, y1, words = line
+        if rows:
+            row = rows[-1]
+            overlap = min(y1, row[1]) - max(y0, row[0])
+            if overlap > ROW_OVERLAP * (y1 - y0):
+                row[0] = min(row[0], y0)
+                row[1] = max(row[1], y1)
+                row[2].append(line)
+                continue
+        rows.append([y0, y1, [line]])
+
+    page_rows = []
+    for y0, y1, lines in rows:
+        columns = []
+        for x0, _, _, words in sorted(lines, key=lambda line: (line[0], line[1])):
+            if columns and abs(x0 - columns[-1][0]) <= WORD_COLUMN_TOLERANCE:
+                columns[-1][1].extend(words)
+            else:
+                columns.append((x0, list(words)))
+        page_rows.append((y0, y1, columns))
+    return page_rows
+
+
+def page_words_to_place_names(page):
+    """Extract the (en, ga) pairs on a page from word coordinates.
+
+    Alternative to page_lines_to_place_names() for the "words" engine. Rows are
+    rebuilt from the positions of fitz's words: a row starting with an entry
+    number gives the English (first) and Irish (second) column, and following
+    unnumbered rows aligned with those columns are names wrapped onto a new line.
+    Extra columns (OS sheet, townland) are ignored. Unlike the line heuristic
+    this does not need the next entry's number, so the last entry on a page and
+    entries with a number on the same line as the name are kept.
+    """
     place_name_pairs = []
+    entry = None  # [en_x, ga_x, en_words, ga_words, y1, row_height]
+    for y0, y1, row_lines in _page_rows(page):
+        first_x, first_words = row_lines[0]
+        if NUMBER_RE.fullmatch(first_words[0]):
+            if entry is not None:
+                place_name_pairs.append((" ".join(entry[2]), " ".join(entry[3])))
+                entry = None
+            # the name may share a text line with the number ("326 Blanchville")
+            columns = row_lines[1:]
+            if len(first_words) > 1:
+                columns.insert(0, (first_x, first_words[1:]))
+            if len(columns) >= 2:
+                (en_x, en_words), (ga_x, ga_words) = columns[:2]
+                entry = [en_x, ga_x, list(en_words), list(ga_words), y1, y1 - y0]
+            continue
+
+        if entry is None:
+            continue
+        # a wrapped name: close below the entry and aligned with its columns
+        if y0 - entry[4] > 0.5 * entry[5]:
+            place_name_pairs.append((" ".join(entry[2]), " ".join(entry[3])))
+            entry = None
+            continue
+        for x, words in row_lines:
+            if abs(x - entry[0]) <= WORD_COLUMN_TOLERANCE:
+                entry[2].extend(words)
+            elif abs(x - entry[1]) <= WORD_COLUMN_TOLERANCE:
+                entry[3].extend(words)
+        entry[4] = y1
+    if entry is not None:
+        place_name_pairs.append((" ".join(entry[2]), " ".join(entry[3])))
+
+    return [
+        pair
+        for pair in (clean_place_name_pair(en, ga) for en, ga in place_name_pairs)
+        if pair is not None
+    ]
+
+
+def page_to_place_names(page, engine="lines"):
+    """(en, ga) pairs on a fitz page using the given extraction engine."""
+    if engine == "words":
+        return page_words_to_place_names(page)
+    return page_lines_to_place_names(page.get_text().split("\n"))
+
+
+def dedupe_place_names(place_name_pairs):
+    """Drop repeated (en, ga) pairs, keeping the first occurrence."""
+    set_of_tuples = set()
+    unique_pairs = []
+    for pair in place_name_pairs:
+        if pair not in set_of_tuples:
+            set_of_tuples.add(pair)
+            unique_pairs.append(pair)
+    return unique_pairs
+
+
+def pdf_page_count(fn_name_pdf):
+    """Number of pages in a PDF (0 if it cannot be opened)."""
+    try:
+        with fitz.open(fn_name_pdf) as doc:
+            return doc.page_count
+    except Exception as e:
+        print(f"Error processing {fn_name_pdf}: {e}")
+        return 0
+
+
+def iter_pdf_page_place_names(fn_name_pdf, start=0, stop=None, engine="lines"):
+    """Yield, for each page in [start, stop) of a PDF, the list of (en, ga) pairs
+    found on it (not de-duplicated). Only one page's text is held at a time.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown extraction engine {engine!r}, expected one of {ENGINES}")
     try:
-        doc = fitz.open(fn_name_pdf)
-        print("||||||||||||||||||||")
-        print(fn_name_pdf)
-        for page in doc:
-            lines = page.get_text().split("\n")
-            # print(lines)
-            i = 0
-            while i + 3 < len(lines):
-                if (
-                    is_number(lines[i])
-                    and is_valid_name(lines[i + 1])
-                    and is_valid_name(lines[i + 2])
-                    and is_number(lines[i + 3])
-                ):
-                    en_name = lines[i + 1].strip()
-                    ga_name = lines[i + 2].strip()
-
-                    en_name = clean_name_brackets(en_name)
-                    ga_name = clean_name_brackets(ga_name)
-
-                    if re.search(r"\[", en_name) and re.search(r"\]", ga_name):
-                        i += 3
-                        continue
-
-                    # keep it simple and just keep the first name
-                    if (" or " in en_name) or (" nó " in ga_name):
-                        en_name, ga_name = handle_or_case(en_name, ga_name)
-                        if (
-                            is_valid_name(en_name)
-                            and is_valid_name(ga_name)
-                            and (en_name, ga_name) not in set_of_tuples
-                        ):
-                            set_of_tuples.add((en_name, ga_name))
-                            if not re.search(r"[\[\]\(\)]", en_name) and not re.search(
-                                r"[\[\]\(\)]", ga_name
-                            ):
-                                place_name_pairs.append((en_name, ga_name))
-                        i += 3
-                    else:
-                        if (
-                            is_valid_name(en_name)
-                            and is_valid_name(ga_name)
-                            and (en_name, ga_name) not in set_of_tuples
-                        ):
-                            set_of_tuples.add((en_name, ga_name))
-                            if not re.search(r"[\[\]\(\)]", en_name) and not re.search(
-                                r"[\[\]\(\)]", ga_name
-                            ):
-                                place_name_pairs.append((en_name, ga_name))
-                        i += 3
-                else:
-                    i += 1
+        with fitz.open(fn_name_pdf) as doc:
+            if stop is None or stop > doc.page_count:
+                stop = doc.page_count
+            for page_no in range(start, stop):
+                yield page_to_place_names(doc[page_no], engine)
     except Exception as e:
         print(f"Error processing {fn_name_pdf}: {e}")
+
+
+def pdf_pages_to_place_names_list(fn_name_pdf, start=0, stop=None, engine="lines"):
+    """Extract (en, ga) pairs from pages [start, stop) of a PDF.
+
+    Used to split one large PDF across worker processes; the result is in page
+    order but not de-duplicated.
+    """
+    place_name_pairs = []
+    for page_pairs in iter_pdf_page_place_names(fn_name_pdf, start, stop, engine):
+        place_name_pairs.extend(page_pairs)
     return place_name_pairs
 
 
+def iter_place_names(fn_name_pdf, area=None, engine="lines"):
+    """Stream the (area, en, ga) records of a PDF page by page.
+
+    Yields the same pairs, in the same order, as pdf_to_place_names_list() but
+    without building the list first; only the set of pairs already seen is kept
+    for de-duplication.
+    """
+    set_of_tuples = set()
+    for page_pairs in iter_pdf_page_place_names(fn_name_pdf, engine=engine):
+        for en_name, ga_name in page_pairs:
+            if (en_name, ga_name) not in set_of_tuples:
+                set_of_tuples.add((en_name, ga_name))
+                yield area, en_name, ga_name
+
+
+def pdf_to_place_names_list(fn_name_pdf, engine="lines"):
+    """Extract all English-Irish placename pairs from a PDF.
+
+    engine is "lines" (default) or "words", see ENGINES.
+    """
+    print("||||||||||||||||||||")
+    print(fn_name_pdf)
+    return [(en, ga) for _, en, ga in iter_place_names(fn_name_pdf, engine=engine)]
+
+
+class PlaceNamePairs(tuple):
+    """Tuple of (en, ga) pairs, in extraction order, with set-backed `in` tests."""
+
+    def __new__(cls, pairs):
+        self = super().__new__(cls, pairs)
+        self.pair_set = frozenset(self)
+        return self
+
+    def __contains__(self, pair):
+        return pair in self.pair_set
+
+
+@functools.lru_cache(maxsize=None)
+def _memoized_place_names(abs_path, mtime_ns, size, engine):
+    return PlaceNamePairs(pdf_to_place_names_list(abs_path, engine=engine))
+
+
+def extracted_place_names(fn_name_pdf, engine="lines"):
+    """Memoized pdf_to_place_names_list(): each PDF is parsed at most once per
+    process (per engine, and again only if the file changes on disk).
+
+    Returns a PlaceNamePairs, so `(en, ga) in result` is a set lookup.
+    """
+    stat = os.stat(fn_name_pdf)
+    return _memoized_place_names(
+        os.path.abspath(fn_name_pdf), stat.st_mtime_ns, stat.st_size, engine
+    )
+
+
 # between logainmneacha and YYYY and an-tordu-logainmneacha-contae-laoise-2018-dreacht
 def get_area_from_f_name(f_name):
     # remove ".pdf"
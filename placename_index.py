@@ -0,0 +1,568 @@
+"""Fast placename lookups over transcripts for ASR post-processing.
+
+PlacenameIndex holds every Logainm (and, as aliases, the English names kept by
+pdf_to_place_names_list, which placenames.parquet has) in one character trie
+over their normalised text, with Aho-Corasick failure links on top:
+
+- lookup(name): the placenames a name stands for, exactly
+- find_all(transcript) / find_longest(transcript): every placename occurring in
+  a transcript, in one left-to-right pass, or the leftmost-longest
+  non-overlapping ones ("Baile Átha Cliath" rather than "Átha Cliath")
+- lookup_fuzzy(name) / find_fuzzy(transcript): the same within a bounded
+  Levenshtein distance, for misrecognised names, by walking the trie with one
+  banded row of the edit-distance table per node, so only the few branches
+  within max_distance of the query are ever visited
+
+Matches only start and end on token boundaries, and report character offsets
+into the original transcript. Names and transcripts go through the same
+normalisation, done token by token (see normalise_token).
+
+Running text mutates placenames (i gCaisleán Aircín, go Bhaile Átha Cliath, i
+bPaiteagó) and ASR often drops the fadas. fold_token undoes both, and
+NormalisedIndex is a plain dict from the folded form of every name to its
+entries, so checking a candidate span is one hash lookup. Use it to validate
+and tag generated sentences in bulk (tag_sentences, or run this module on a
+sentences CSV/Parquet). PlacenameIndex(placenames, normalise=fold_token) gives
+the trie the same tolerance.
+"""
+
+import argparse
+import dataclasses
+import functools
+import re
+import unicodedata
+from collections import deque
+
+TOKEN_RE = re.compile(r"\w+(?:['’\-]\w+)*")
+MAX_DISTANCE = 1  # Default edit budget of the fuzzy lookups
+CHARS_PER_EDIT = 4  # A name needs this many characters per allowed edit
+
+_INF = 1 << 30
+
+
+def normalise_token(token):
+    return token.casefold().replace("’", "'")
+
+
+# Eclipsis (urú) in front of a consonant, longest first: bhFear, gCorcaigh, dTeach
+ECLIPSIS = ("bhf", "mb", "gc", "nd", "ng", "bp", "dt")
+LENITABLE = frozenset("bcdfgmpst")  # Consonants lenition (séimhiú) puts an h after
+_UPPER_VOWELS = frozenset("AEIOUÁÉÍÓÚ")
+
+
+def strip_mutation(token):
+    """token without its initial mutation: eclipsis, lenition, and h-, n- or
+    t- in front of a vowel (hÁth, n-Inis, tOileán) or t in front of s
+    (tSalainn).
+
+    Only the consonant clusters are unambiguous in lower case; n, h and t in
+    front of a vowel are only taken as mutations when hyphenated or a lower
+    case prefix on a capital (nÁth, but not nead or NAAS). Canonical names are
+    stripped as well, so names that are themselves lenited (Cill Chainnigh)
+    still line up.
+    """
+    lower = token.lower()
+    for prefix in ECLIPSIS:
+        if lower.startswith(prefix) and len(token) > len(prefix):
+            token = token[len(prefix) - 1 :]
+            lower = token.lower()
+            # and lenited on top, as generated text sometimes has it (gChnoic)
+            if len(token) > 2 and lower[0] in LENITABLE and lower[1] == "h":
+                return token[0] + token[2:]
+            return token
+    if len(token) > 2:
+        if lower[0] in "hnt" and (
+            token[1] == "-" or (token[0].islower() and token[1] in _UPPER_VOWELS)
+        ):
+            return token[2:] if token[1] == "-" else token[1:]
+        if lower.startswith("ts"):
+            return token[1:]
+        if lower[0] in LENITABLE and lower[1] == "h":
+            return token[0] + token[2:]
+    return token
+
+
+def strip_fadas(text):
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def fold_token(token):
+    """normalise_token that also ignores initial mutations and fadas"""
+    return strip_fadas(strip_mutation(token.replace("’", "'"))).casefold()
+
+
+def tokenise(text, normalise=normalise_token):
+    """(normalised token, start, end) of every token of text"""
+    return [(normalise(m.group()), m.start(), m.end()) for m in TOKEN_RE.finditer(text)]
+
+
+def normalise(text, normalise=normalise_token):
+    """The form names are indexed under: normalised tokens joined by spaces"""
+    return " ".join(token for token, _, _ in tokenise(text, normalise))
+
+
+@dataclasses.dataclass(frozen=True)
+class Placename:
+    logainm: str
+    areas: tuple = ()
+    english: tuple = ()
+
+
+@dataclasses.dataclass(frozen=True)
+class Match:
+    start: int  # Character offsets of the span in the transcript
+    end: int
+    text: str
+    placenames: tuple  # Every Placename the span can stand for
+    distance: int = 0
+    alias: bool = False  # Matched an English name, not a Logainm
+
+
+def placename_entries(df):
+    """Placename entries from a placenames table (Logainm, plus Ceantar and
+    English where present), one per distinct Logainm"""
+    entries = {}
+    n_rows = len(df)
+    columns = [
+        df[column].tolist() if column in df else [None] * n_rows
+        for column in ("Logainm", "Ceantar", "English")
+    ]
+    for logainm, area, english_name in zip(*columns):
+        if not isinstance(logainm, str) or not logainm.strip():
+            continue
+        areas, english = entries.setdefault(logainm.strip(), ({}, {}))
+        if isinstance(area, str):
+            areas[area] = None
+        if isinstance(english_name, str) and english_name.strip():
+            english[english_name.strip()] = None
+    return [
+        Placename(logainm, tuple(areas), tuple(english))
+        for logainm, (areas, english) in entries.items()
+    ]
+
+
+class PlacenameIndex:
+    def __init__(self, placenames, aliases=True, normalise=normalise_token):
+        self.placenames = list(placenames)
+        self.normalise = normalise
+        # trie: children[node] maps a character to the child node; keys[node]
+        # is the normalised name ending there, names[node] its entries
+        self.children = [{}]
+        self.keys = [None]
+        self.names = [None]
+        self.alias_only = [False]
+        for i, placename in enumerate(self.placenames):
+            self._insert(placename.logainm, i, False)
+            if aliases:
+                for english in placename.english:
+                    self._insert(english, i, True)
+        self.names = [
+            None if names is None else tuple(self.placenames[i] for i in names)
+            for names in self.names
+        ]
+        self.max_key_length = max((len(key) for key in self.keys if key), default=0)
+        self._link()
+
+    @classmethod
+    def from_table(cls, path="./placenames.csv", **kwargs):
+        """An index of a placenames CSV or Parquet dataset (parquet_io)"""
+        from parquet_io import read_table
+
+        return cls(placename_entries(read_table(path)), **kwargs)
+
+    def __len__(self):
+        return len(self.placenames)
+
+    def _insert(self, name, i, alias):
+        key = normalise(name, self.normalise)
+        if not key:
+            return
+        node = 0
+        for ch in key:
+            child = self.children[node].get(ch)
+            if child is None:
+                child = len(self.children)
+                self.children[node][ch] = child
+                self.children.append({})
+                self.keys.append(None)
+                self.names.append(None)
+                self.alias_only.append(False)
+            node = child
+        if self.names[node] is None:
+            self.keys[node] = key
+            self.names[node] = []
+            self.alias_only[node] = alias
+        if i not in self.names[node]:
+            self.names[node].append(i)
+        self.alias_only[node] = self.alias_only[node] and alias
+
+    def _link(self):
+        """Aho-Corasick failure links, and for every node the nearest node on
+        its failure chain that ends a key (0 = none)"""
+        n_nodes = len(self.children)
+        self.fail = [0] * n_nodes
+        self.output = [0] * n_nodes
+        queue = deque(self.children[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.children[node].items():
+                state = self.fail[node]
+                while state and ch not in self.children[state]:
+                    state = self.fail[state]
+                target = self.children[state].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                fail = self.fail[child]
+                self.output[child] = fail if self.keys[fail] else self.output[fail]
+                queue.append(child)
+
+    def _node(self, key):
+        node = 0
+        for ch in key:
+            node = self.children[node].get(ch)
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, name):
+        """The placenames a name stands for exactly (after normalisation)"""
+        node = self._node(normalise(name, self.normalise))
+        if node is None or self.names[node] is None:
+            return ()
+        return self.names[node]
+
+    def _match(self, transcript, tokens, first, last, node, distance=0):
+        start, end = tokens[first][1], tokens[last][2]
+        return Match(
+            start,
+            end,
+            transcript[start:end],
+            self.names[node],
+            distance,
+            self.alias_only[node],
+        )
+
+    def find_all(self, transcript):
+        """Every occurrence of a name in transcript, overlapping ones included,
+        ordered by where they end"""
+        tokens = tokenise(transcript, self.normalise)
+        text = " ".join(token for token, _, _ in tokens)
+        # token index of each character of text, and which ones start a token
+        token_of = []
+        starts = set()
+        for t, (token, _, _) in enumerate(tokens):
+            starts.add(len(token_of))
+            token_of.extend([t] * (len(token) + 1))
+
+        matches = []
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in self.children[state]:
+                state = self.fail[state]
+            state = self.children[state].get(ch, 0)
+            # a key can only end where a token does
+            if pos + 1 < len(text) and text[pos + 1] != " ":
+                continue
+            node = state if self.keys[state] else self.output[state]
+            while node:
+                begin = pos + 1 - len(self.keys[node])
+                if begin in starts:
+                    matches.append(
+                        self._match(
+                            transcript, tokens, token_of[begin], token_of[pos], node
+                        )
+                    )
+                node = self.output[node]
+        return matches
+
+    def find_longest(self, transcript):
+        """Leftmost-longest non-overlapping names in transcript"""
+        return non_overlapping(self.find_all(transcript))
+
+    def _fuzzy_walk(self, query, ends, max_distance):
+        """{(node, end): distance} of every key within max_distance of
+        query[:end] for an end in ends.
+
+        Each trie node carries the band j = depth - k .. depth + k of the
+        Levenshtein row between its prefix and the query; branches whose
+        whole band is over max_distance are pruned, and once a branch has
+        spent the whole budget the rest of the key has to match the query
+        exactly, so it's followed with plain lookups.
+        """
+        k = max_distance
+        width = 2 * k + 1
+        n = len(query)
+        ends = set(ends)
+        row = [b - k if 0 <= b - k <= n else _INF for b in range(width)]
+        found = {}
+        stack = [(0, 0, row)]
+        while stack:
+            node, depth, row = stack.pop()
+            d = depth + 1
+            base = d - k
+            for ch, child in self.children[node].items():
+                new = [_INF] * width
+                new_min = _INF
+                for b in range(width):
+                    j = base + b
+                    if j < 0 or j > n:
+                        continue
+                    best = row[b + 1] + 1 if b + 1 < width else _INF
+                    if j > 0:
+                        cost = row[b] if query[j - 1] == ch else row[b] + 1
+                        if cost < best:
+                            best = cost
+                        if b > 0 and new[b - 1] + 1 < best:
+                            best = new[b - 1] + 1
+                    new[b] = best
+                    if best < new_min:
+                        new_min = best
+                if new_min > k:
+                    continue
+                if self.keys[child] is not None:
+                    for b in range(width):
+                        if base + b in ends:
+                            self._found(found, child, d, base + b, new[b], k)
+                if new_min < k:
+                    stack.append((child, d, new))
+                    continue
+                next_chars = self.children[child]
+                for b in range(width):
+                    j = base + b
+                    if new[b] == k and j < n and query[j] in next_chars:
+                        self._exact_tail(found, child, d, j, query, ends, k)
+        return found
+
+    def _found(self, found, node, depth, end, distance, max_distance):
+        if distance <= min(max_distance, depth // CHARS_PER_EDIT):
+            if distance < found.get((node, end), _INF):
+                found[(node, end)] = distance
+
+    def _exact_tail(self, found, node, depth, j, query, ends, distance):
+        """Follow query[j:] exactly down from node, recording the keys that
+        end at an end in ends"""
+        children = self.children
+        keys = self.keys
+        for ch in query[j:]:
+            node = children[node].get(ch)
+            if node is None:
+                return
+            depth += 1
+            j += 1
+            if keys[node] is not None and j in ends:
+                self._found(found, node, depth, j, distance, distance)
+
+    def lookup_fuzzy(self, name, max_distance=MAX_DISTANCE):
+        """(distance, Placename) within max_distance edits of name, closest first.
+
+        Names get one edit per CHARS_PER_EDIT characters at most, so short
+        names only match exactly.
+        """
+        query = normalise(name, self.normalise)
+        found = self._fuzzy_walk(query, (len(query),), max_distance)
+        return [
+            (distance, placename)
+            for (node, _), distance in sorted(
+                found.items(), key=lambda item: (item[1], self.keys[item[0][0]])
+            )
+            for placename in self.names[node]
+        ]
+
+    def find_fuzzy(self, transcript, max_distance=MAX_DISTANCE):
+        """Leftmost-longest non-overlapping spans of transcript within
+        max_distance edits of a name (exact matches have distance 0)"""
+        tokens = tokenise(transcript, self.normalise)
+        matches = []
+        for first in range(len(tokens)):
+            # the query: tokens from `first` on, as long as any key can be
+            query = ""
+            ends = []
+            for last in range(first, len(tokens)):
+                if len(query) > self.max_key_length + max_distance:
+                    break
+                query = query + " " + tokens[last][0] if query else tokens[last][0]
+                ends.append(len(query))
+            best = {}
+            found = self._fuzzy_walk(query, ends, max_distance)
+            for (node, end), distance in found.items():
+                last = first + ends.index(end)
+                if last not in best or distance < best[last][0]:
+                    best[last] = (distance, node)
+            for last, (distance, node) in best.items():
+                matches.append(
+                    self._match(transcript, tokens, first, last, node, distance)
+                )
+        return non_overlapping(matches)
+
+
+class NormalisedIndex:
+    """Placenames keyed by their normalised form (by default mutations and
+    fadas folded away) in one dict, built once.
+
+    Names starting with the article An are also keyed without it, as it's
+    often dropped in running text (i dTeach Mór for An Teach Mór). Since
+    that makes plenty of ordinary words keys (teach mór, cois), find() only
+    takes those spans when their first word is capitalised or eclipsed.
+    """
+
+    def __init__(self, placenames, aliases=True, normalise=fold_token):
+        self.placenames = list(placenames)
+        self.normalise = normalise
+        forms = {}
+        bare_forms = {}  # the article-less keys
+        alias_only = {}
+        for placename in self.placenames:
+            names = [(placename.logainm, False)]
+            if aliases:
+                names += [(english, True) for english in placename.english]
+            for name, alias in names:
+                keys = self._keys(name)
+                for key, table in zip(keys, (forms, bare_forms)):
+                    entries = table.setdefault(key, {})
+                    entries[placename] = None
+                    alias_only[key] = alias_only.get(key, True) and alias
+        self.forms = {key: tuple(entries) for key, entries in forms.items()}
+        self.bare_forms = {
+            key: tuple(entries)
+            for key, entries in bare_forms.items()
+            if key not in forms
+        }
+        self.alias_only = alias_only
+        # the token counts of the keys, longest first: the span lengths to try
+        self.lengths = sorted(
+            {key.count(" ") + 1 for key in [*forms, *bare_forms]}, reverse=True
+        )
+
+    @classmethod
+    def from_table(cls, path="./placenames.csv", **kwargs):
+        """An index of a placenames CSV or Parquet dataset (parquet_io)"""
+        from parquet_io import read_table
+
+        return cls(placename_entries(read_table(path)), **kwargs)
+
+    def __len__(self):
+        return len(self.forms) + len(self.bare_forms)
+
+    def _keys(self, name):
+        tokens = [token for token, _, _ in tokenise(name, self.normalise)]
+        keys = [" ".join(tokens)] if tokens else []
+        if len(tokens) > 1 and tokens[0] == "an":
+            keys.append(" ".join(tokens[1:]))
+        return keys
+
+    def lookup(self, name):
+        """The placenames name stands for, ignoring mutations and fadas"""
+        key = normalise(name, self.normalise)
+        return self.forms.get(key) or self.bare_forms.get(key, ())
+
+    def find(self, transcript):
+        """Leftmost-longest non-overlapping placenames in transcript; one dict
+        lookup per candidate span"""
+        return self._find(transcript, tokenise(transcript, self.normalise))
+
+    def _find(self, transcript, tokens):
+        words = [token for token, _, _ in tokens]
+        matches = []
+        first = 0
+        while first < len(words):
+            for length in self.lengths:
+                if first + length > len(words):
+                    continue
+                key = " ".join(words[first : first + length])
+                names = self.forms.get(key)
+                if names is None and key in self.bare_forms:
+                    head = transcript[tokens[first][1] : tokens[first][2]]
+                    if _looks_like_a_name(head):
+                        names = self.bare_forms[key]
+                if names is not None:
+                    last = first + length - 1
+                    start, end = tokens[first][1], tokens[last][2]
+                    alias = self.alias_only[key]
+                    matches.append(
+                        Match(start, end, transcript[start:end], names, alias=alias)
+                    )
+                    first = last
+                    break
+            first += 1
+        return matches
+
+    def mentions(self, sentence, placename):
+        """Whether sentence names placename, in any mutated or unaccented form"""
+        words = [token for token, _, _ in tokenise(sentence, self.normalise)]
+        return self._mentions(words, placename)
+
+    def _mentions(self, words, placename):
+        keys = set(self._keys(placename))
+        for length in {key.count(" ") + 1 for key in keys}:
+            for first in range(len(words) - length + 1):
+                if " ".join(words[first : first + length]) in keys:
+                    return True
+        return False
+
+    def tag_sentences(self, df):
+        """The sentences table df (placename, sentence) with two more columns:
+        placename_found, whether the sentence mentions its placename, and
+        placenames_tagged, every Logainm found in it ("; "-separated)"""
+        found = []
+        tagged = []
+        for placename, sentence in zip(
+            df["placename"].tolist(), df["sentence"].tolist()
+        ):
+            sentence = sentence if isinstance(sentence, str) else ""
+            tokens = tokenise(sentence, self.normalise)
+            words = [token for token, _, _ in tokens]
+            found.append(
+                isinstance(placename, str) and self._mentions(words, placename)
+            )
+            logainmneacha = (
+                p.logainm for m in self._find(sentence, tokens) for p in m.placenames
+            )
+            tagged.append("; ".join(dict.fromkeys(logainmneacha)))
+        return df.assign(placename_found=found, placenames_tagged=tagged)
+
+
+def _looks_like_a_name(token):
+    """Capitalised (Teach, dTeach, CHARN) or eclipsed (i dteach mór)"""
+    return any(ch.isupper() for ch in token) or token.lower().startswith(ECLIPSIS)
+
+
+def non_overlapping(matches):
+    """Greedy leftmost-longest (then closest) selection of matches"""
+    chosen = []
+    end = -1
+    for match in sorted(
+        matches, key=lambda m: (m.start, -(m.end - m.start), m.distance)
+    ):
+        if match.start >= end:
+            chosen.append(match)
+            end = match.end
+    return chosen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check and tag the placenames of generated sentences"
+    )
+    parser.add_argument("sentences", help="sentences CSV or Parquet dataset")
+    parser.add_argument("-o", "--output", help="write the tagged table as CSV")
+    parser.add_argument(
+        "--placenames",
+        default="./placenames.csv",
+        help="placenames CSV or Parquet dataset",
+    )
+    args = parser.parse_args()
+
+    from parquet_io import read_table
+
+    index = NormalisedIndex.from_table(args.placenames)
+    df = index.tag_sentences(read_table(args.sentences))
+    missing = df[~df["placename_found"]]
+    print(
+        f"{len(df) - len(missing)}/{len(df)} sentences mention their placename "
+        f"({len(index)} forms indexed)"
+    )
+    for placename, sentence in zip(missing["placename"], missing["sentence"]):
+        print(f"  {placename}: {sentence}")
+    if args.output:
+        df.to_csv(args.output, index=False, encoding="utf-8")
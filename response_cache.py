@@ -0,0 +1,147 @@
+"""Persistent cache of model responses in a SQLite file.
+
+A re-run after a partial failure, or after changing only the post-processing,
+would otherwise pay again for every sentence it already has. ResponseCache
+maps a key (a hash of the prompt, placename, its occurrence and temperature, see
+synthesis.response_cache_key) to the model's raw answer, or to the placename's
+item of a multi-placename answer, in one namespace per model so switching
+models never serves another model's sentences.
+
+The file is bounded: once the stored responses pass max_bytes the least
+recently used ones are evicted until it is back under LOW_WATER of the limit.
+A lookup is a primary key read plus a last-used update in WAL mode without
+fsync, so a hit costs tens of microseconds rather than a request. Safe to share
+between the threads of a run.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+MAX_BYTES = 512 * 1024 * 1024
+LOW_WATER = 0.9  # Evict down to this share of max_bytes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+class ResponseCache:
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # autocommit; every statement runs under self.lock
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+        self.size = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, namespace, key):
+        """The cached value, or None"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM responses WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute(
+                "UPDATE responses SET last_used = ? WHERE namespace = ? AND key = ?",
+                (time.time(), namespace, key),
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, namespace, key, value):
+        size = len(namespace) + len(key) + len(value.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            old = self.db.execute(
+                "SELECT size FROM responses WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, value, size, now, now),
+            )
+            self.size += size - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self._evict(int(self.max_bytes * LOW_WATER))
+
+    def _evict(self, target):
+        """Drop least recently used entries until the total is under target"""
+        self.db.execute("BEGIN")
+        try:
+            rows = self.db.execute(
+                "SELECT namespace, key, size FROM responses ORDER BY last_used"
+            )
+            doomed = []
+            for namespace, key, size in rows:
+                if self.size <= target:
+                    break
+                doomed.append((namespace, key))
+                self.size -= size
+            rows.close()
+            self.db.executemany(
+                "DELETE FROM responses WHERE namespace = ? AND key = ?", doomed
+            )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            self.size = self.db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            raise
+
+    def clear(self, namespace=None):
+        """Forget every response, or only those of one namespace (model)"""
+        with self.lock:
+            if namespace is None:
+                self.db.execute("DELETE FROM responses")
+            else:
+                self.db.execute("DELETE FROM responses WHERE namespace = ?", (namespace,))
+            self.size = self.db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"Response cache: {self.hits}/{lookups} hits ({rate:.0%}), "
+            f"{self.size / 1e6:.1f} of {self.max_bytes / 1e6:.0f} MB in {self.path}"
+        )
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,7 +1,8 @@
 #!/bin/bash
 #SBATCH --job-name=placenames_synthesis_30k
-#SBATCH --output=./out/placenames_synthesis_%j.out
-#SBATCH --error=./err/placenames_synthesis_%j.err
+#SBATCH --output=./out/placenames_synthesis_%A_%a.out
+#SBATCH --error=./err/placenames_synthesis_%A_%a.err
+#SBATCH --array=0-9  # One shard of placenames.csv per array task
 #SBATCH --time=00:02:00
 #SBATCH --partition=k2-lowpri  # Changed from k2-gpu-v100
 #SBATCH --ntasks=1
@@ -25,5 +26,14 @@ pip install --no-cache-dir -r "requirements.txt"
 # Navigate to project directory
 cd $SLURM_SUBMIT_DIR
 
-# Update synthesis.py to use 30,000 placenames
-python synthesis.py
\ No newline at end of file
+# Each array task generates its own slice of placenames.csv, with its own
+# journal and output CSV (..._shard<i>of<n>_final.csv). The API rate limits are
+# shared by the whole account, so each task gets its share of them
+NUM_SHARDS=${SLURM_ARRAY_TASK_COUNT:-1}
+python synthesis.py \
+    --input placenames.csv \
+    --shard ${SLURM_ARRAY_TASK_ID:-0} \
+    --num-shards $NUM_SHARDS \
+    --rpm $((50 / NUM_SHARDS)) \
+    --tpm $((50000 / NUM_SHARDS)) \
+    --skip-checks
\ No newline at end of file
@@ -1,22 +1,90 @@
+import asyncio
+import dataclasses
+import functools
+import hashlib
 import json
-import pandas as pd
-from tqdm import tqdm
-from langchain.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate
-from langchain_anthropic import ChatAnthropic
+import os
 import random
+import re
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
-import os
 
-# Configuration flags
-do_sampling = True
-just_sample = True  # NEW FLAG: Use simple system message without feature matrix
-n_generated = 100
+from response_cache import ResponseCache
+from synthesis_journal import SynthesisJournal
+
+# pandas, tqdm, LangChain, anthropic and httpx are imported where they're first
+# used and the prompt files are read on first use, so importing this module
+# (a test, a worker process, a dry run) is fast and needs none of them
+
+
+@dataclasses.dataclass
+class SynthesisConfig:
+    """Settings of a synthesis run; edit the defaults below or replace
+    `config` with a SynthesisConfig of your own"""
+
+    do_sampling: bool = True
+    just_sample: bool = True  # Use simple system message without feature matrix
+    n_generated: int = None  # At most this many placenames (None = all)
+    model: str = "claude-3-haiku-20240307"  # "claude-3-5-haiku-20241022"
+    history_capacity: int = 10000  # Sentences kept for sampling and near-duplicate checks
+
+    # Crash-safe journal: every sentence is appended to a JSONL file as it is
+    # generated; with resume, placenames already journaled are skipped
+    resume: bool = True
+
+    # Rate limiting of the batch-and-sleep loop (process_in_batches)
+    batch_size: int = 40  # Stay safely under 50 RPM
+    batch_delay: int = 65  # Seconds between batches
+
+    # Asyncio engine (process_async)
+    use_async: bool = True  # False = old batch-and-sleep loop
+    use_batch_api: bool = False  # Message Batches API instead (batch_synthesis.py): cheaper, results within 24h
+    async_concurrency: int = 8  # Requests kept in flight
+    requests_per_minute: int = 50
+    tokens_per_minute: int = 50000  # Input + output tokens
+    # Multi-placename requests: one request asks for sentences for this many
+    # placenames as JSON, so far fewer requests count against the RPM limit
+    placenames_per_request: int = 1
+
+    # Prompt caching of the static prefix (system message + few-shot examples).
+    # The API only caches prefixes of at least 1024 tokens (2048 for Haiku),
+    # shorter ones are just sent uncached; the cache stats show whether it kicked in
+    prompt_caching: bool = True
+
+    # Appended to the journal, batch state and output file names, so runs
+    # over different slices (e.g. SLURM array shards) don't share files
+    run_tag: str = ""
+
+    # API endpoint; None = the real API, or e.g. a local mock_anthropic_server.py
+    base_url: str = None
+
+    # SQLite file of earlier responses, reused for the same model, prompt,
+    # placename and temperature instead of calling the API again (None = off)
+    response_cache: str = None
+    response_cache_mb: int = 512  # Least recently used responses are evicted past this
+
+    # Also add the final sentences to this Parquet dataset, partitioned by
+    # model (needs pyarrow; e.g. parquet_io.SENTENCES_PARQUET)
+    parquet_output: str = None
 
-# Rate limiting configuration
-BATCH_SIZE = 40  # Stay safely under 50 RPM
-BATCH_DELAY = 65  # Seconds between batches
+
+config = SynthesisConfig()
+
+MAX_TOKENS = 1024  # Same as ChatAnthropic's default
+MAX_CONCURRENCY = 64  # Upper bound when ramping up on spare rate limit
+# Output budget per sentence in a multi request, and the output tokens reserved
+# per placename against tokens_per_minute until a response reports its usage
+MAX_TOKENS_PER_PLACENAME = 100
+TEMPERATURE = 0.9
+
+# Retries of transient API errors (rate limits, overload, 5xx, timeouts)
+MAX_RETRIES = 8
+BACKOFF_BASE = 1.0  # Seconds, doubled on every retry
+BACKOFF_CAP = 60.0
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+CACHE_CONTROL = {"type": "ephemeral"}  # 5 minute cache, refreshed on every hit
 
 # openai.api_key = secrets["open_ai"]
 
@@ -26,40 +94,39 @@ if not just_sample:
     irish_matrix = IrishFeatureMatrix()
   """
 
-# Load examples from JSON
-with open("examples.json", "r", encoding="utf-8") as f:
-    examples = json.load(f)
+@functools.lru_cache(maxsize=None)
+def load_examples():
+    """Few-shot examples from examples.json"""
+    with open("examples.json", "r", encoding="utf-8") as f:
+        return json.load(f)
 
-# Load appropriate system message based on mode
-if just_sample:
-    with open("simple_system_message.txt", "r", encoding="utf-8") as f:
-        system_message = f.read()
-else:
-    with open("system_message.txt", "r", encoding="utf-8") as f:
-        system_message = f.read()
 
-# Global list to store previously generated sentences (thread-safe)
-previous_sentences = []
-sentence_lock = threading.Lock()
+@functools.lru_cache(maxsize=None)
+def load_system_message(simple_mode=True):
+    """Simple system message, or the feature matrix one"""
+    path = "simple_system_message.txt" if simple_mode else "system_message.txt"
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=None)
+def get_sentence_history():
+    """Sentences generated so far: bounded ring buffer with a near-duplicate index"""
+    from near_duplicates import SentenceHistory
+
+    return SentenceHistory(capacity=config.history_capacity)
 
 
 def add_to_sentence_history(sentence):
-    """Add a sentence to the history of previously generated sentences (thread-safe)"""
-    global previous_sentences
-    with sentence_lock:
-        previous_sentences.append(sentence)
+    """Add a sentence to the history; returns (similarity, sentence) of an
+    earlier near-duplicate, or None"""
+    return get_sentence_history().add(sentence)
 
 
 def sample_previous_sentences(n=10):
-    """Sample n sentences from previously generated sentences (thread-safe)"""
-    global previous_sentences
-    with sentence_lock:
-        if len(previous_sentences) == 0:
-            return []
-        elif len(previous_sentences) <= n:
-            return previous_sentences.copy()
-        else:
-            return random.sample(previous_sentences, n)
+    """n previous sentences to show the model: the ones most similar to the
+    latest sentence plus a random sample"""
+    return get_sentence_history().sample_for_prompt(n)
 
 
 def format_features(feature_row):
@@ -78,20 +145,27 @@ def format_previous_sentences(sentences):
     return formatted
 
 
-# Create example prompt template
-example_prompt = ChatPromptTemplate.from_messages(
-    [("human", "Placename: {placename}"), ("assistant", "{sentence}")]
-)
+@functools.lru_cache(maxsize=None)
+def get_few_shot_prompt():
+    """Few-shot prompt with the examples"""
+    from langchain.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate
 
-# Create few-shot prompt with examples
-few_shot_prompt = FewShotChatMessagePromptTemplate(
-    example_prompt=example_prompt,
-    examples=examples,
-)
+    # Create example prompt template
+    example_prompt = ChatPromptTemplate.from_messages(
+        [("human", "Placename: {placename}"), ("assistant", "{sentence}")]
+    )
+    return FewShotChatMessagePromptTemplate(
+        example_prompt=example_prompt,
+        examples=load_examples(),
+    )
 
 
 # Create the full prompt template (with conditional previous sentences)
 def create_prompt_template(include_previous=False, simple_mode=False):
+    from langchain.prompts import ChatPromptTemplate
+
+    system_message = load_system_message(simple_mode)
+    few_shot_prompt = get_few_shot_prompt()
     if simple_mode:
         # Simple mode without features
         if include_previous:
@@ -139,14 +213,73 @@ def create_prompt_template(include_previous=False, simple_mode=False):
             )
 
 
+MULTI_INSTRUCTIONS = (
+    "You will be given a numbered list of placenames. Write one sentence for each "
+    "placename, following the rules above. Return only a JSON array with one "
+    'object per placename, in the same order, each with a "placename" key (the '
+    'placename exactly as given) and a "sentence" key.'
+)
+
+
+def format_placename_list(placenames):
+    return "\n".join(f"{i}. {placename}" for i, placename in enumerate(placenames, 1))
+
+
+def create_multi_prompt_template(include_previous=False, simple_mode=True):
+    """Prompt asking for one sentence for each of several placenames as JSON.
+
+    The few-shot examples are shown as one multi-placename request and its
+    JSON answer, so the static prefix is still the same for every request.
+    """
+    from langchain.prompts import ChatPromptTemplate
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+    examples = load_examples()
+    example_request = HumanMessage(
+        content="Placenames:\n"
+        + format_placename_list([example["placename"] for example in examples])
+    )
+    example_answer = AIMessage(content=json.dumps(examples, ensure_ascii=False))
+    human = "Placenames:\n{placenames}"
+    if include_previous:
+        human += "\n sample of previous sentences: {previous_sentences}"
+    return ChatPromptTemplate.from_messages(
+        [
+            SystemMessage(
+                content=load_system_message(simple_mode) + "\n\n" + MULTI_INSTRUCTIONS
+            ),
+            example_request,
+            example_answer,
+            ("human", human),
+        ]
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_multi_prompt_template(include_previous=False, simple_mode=True):
+    return create_multi_prompt_template(include_previous, simple_mode)
+
+
+@functools.lru_cache(maxsize=None)
+def get_prompt_template(include_previous=False, simple_mode=False):
+    """create_prompt_template(), built once per combination and then shared"""
+    return create_prompt_template(include_previous, simple_mode)
+
+
 def get_anthropic_api_key():
     """Get Anthropic API key from environment or secrets file"""
-    # Try environment variable first
+    # Try environment variable first; read every time, so a changed key is used
     api_key = os.getenv("ANTHROPIC_API_KEY")
     if api_key:
         return api_key
 
     # Try secrets file as fallback
+    return load_secrets_api_key()
+
+
+@functools.lru_cache(maxsize=None)
+def load_secrets_api_key():
+    """Anthropic API key from secrets.json"""
     try:
         with open("secrets.json", "r", encoding="utf-8") as f:
             secrets = json.load(f)[0]
@@ -159,155 +292,972 @@ def get_anthropic_api_key():
         )
 
 
-CLAUDE_MODEL = (
-    "claude-3-haiku-20240307"  # "claude-3-5-haiku-20241022" # "claude-3-haiku-20240307"
-)
+def create_claude_instance(model=None, base_url=None, api_key=None):
+    """Create a new Claude instance (by default with config's model and base_url)"""
+    from langchain_anthropic import ChatAnthropic
 
-
-def create_claude_instance():
-    """Create a new Claude instance for each thread"""
+    # retries are done by generate_sentence_for_placename, with backoff that
+    # honours retry-after; the SDK's own would nest inside them
     return ChatAnthropic(
-        model=CLAUDE_MODEL,  # "claude-3-5-haiku-20241022",
-        temperature=0.9,
-        api_key=get_anthropic_api_key(),
+        model=model or config.model,
+        temperature=TEMPERATURE,
+        api_key=api_key or get_anthropic_api_key(),
+        base_url=base_url or config.base_url,
+        max_retries=0,
     )
 
 
-def generate_sentence_for_placename(args):
-    """Generate sentence for a single placename (designed for parallel execution)"""
-    placename, use_sampling, simple_mode = args
+@functools.lru_cache(maxsize=None)
+def shared_claude_instance(model, base_url, api_key):
+    return create_claude_instance(model, base_url, api_key)
 
-    # Create a new Claude instance for this thread
-    claude = create_claude_instance()
 
-    # Create chain
-    if use_sampling:
-        chain = (
-            create_prompt_template(include_previous=True, simple_mode=simple_mode)
-            | claude
-        )
-    else:
-        chain = (
-            create_prompt_template(include_previous=False, simple_mode=simple_mode)
-            | claude
+def get_claude_instance():
+    """One Claude instance shared by every thread, so all requests reuse its
+    HTTP connection pool (keep-alive) instead of opening new connections.
+    Cached per model, base_url and API key, so changing config gets a new one."""
+    return shared_claude_instance(config.model, config.base_url, get_anthropic_api_key())
+
+
+@functools.lru_cache(maxsize=None)
+def open_response_cache(path, max_mb):
+    return ResponseCache(path, max_bytes=max_mb * 1024 * 1024)
+
+
+def get_response_cache():
+    """The ResponseCache of config.response_cache, or None if it's off"""
+    if not config.response_cache:
+        return None
+    return open_response_cache(config.response_cache, config.response_cache_mb)
+
+
+@functools.lru_cache(maxsize=None)
+def prompt_fingerprint(include_previous=False, simple_mode=False):
+    """Hash of everything in a prompt template but its variables: system
+    message, few-shot examples and instructions"""
+    prompt = get_prompt_template(include_previous, simple_mode)
+    messages = prompt.format_messages(
+        **{name: "{" + name + "}" for name in prompt.input_variables}
+    )
+    text = json.dumps([(m.type, m.content) for m in messages], ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def response_cache_key(placename, use_sampling, simple_mode, occurrence=0):
+    """Cache key of a placename's response; the model is the namespace.
+
+    The previous sentences shown with use_sampling are a random sample and so
+    deliberately not part of the key, or a re-run would never hit the cache.
+    occurrence counts earlier rows with the same placename (placenames.csv
+    repeats names across areas), so every row gets its own sentence.
+    """
+    key = [prompt_fingerprint(use_sampling, simple_mode), placename, TEMPERATURE]
+    if occurrence:
+        key.append(occurrence)
+    return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def get_chain(include_previous=False, simple_mode=False):
+    """Prompt template | Claude chain, built once per combination and client"""
+    return build_chain(
+        include_previous, simple_mode, config.model, config.base_url, get_anthropic_api_key()
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def build_chain(include_previous, simple_mode, model, base_url, api_key):
+    from langchain_core.runnables import RunnableLambda
+
+    return (
+        get_prompt_template(include_previous, simple_mode)
+        | RunnableLambda(lambda prompt: mark_cacheable_prefix(prompt.to_messages()))
+        | shared_claude_instance(model, base_url, api_key)
+    )
+
+
+def mark_cacheable_prefix(messages):
+    """Put a cache breakpoint on the last few-shot example.
+
+    Everything before the final human message (system message and examples) is
+    the same for every placename, so with the breakpoint the API reads that
+    prefix from its prompt cache instead of processing it on every request.
+    """
+    if not config.prompt_caching or len(messages) < 2:
+        return messages
+    last_example = messages[-2]
+    cached = last_example.model_copy(
+        update={
+            "content": [
+                {
+                    "type": "text",
+                    "text": last_example.content,
+                    "cache_control": CACHE_CONTROL,
+                }
+            ]
+        }
+    )
+    return messages[:-2] + [cached, messages[-1]]
+
+
+class PromptCacheStats:
+    """Running totals of prompt cache usage, from the usage of each response"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.input_tokens = 0  # uncached input tokens
+        self.cache_read_tokens = 0
+        self.cache_creation_tokens = 0
+
+    def add(self, usage):
+        """usage is a Messages API Usage object or the equivalent dict"""
+        if not isinstance(usage, dict):
+            usage = usage.model_dump()
+        with self.lock:
+            self.requests += 1
+            self.input_tokens += usage.get("input_tokens") or 0
+            self.cache_read_tokens += usage.get("cache_read_input_tokens") or 0
+            self.cache_creation_tokens += usage.get("cache_creation_input_tokens") or 0
+
+    def hit_rate(self):
+        """Share of input tokens read from the cache"""
+        total = self.input_tokens + self.cache_read_tokens + self.cache_creation_tokens
+        return self.cache_read_tokens / total if total else 0.0
+
+    def summary(self):
+        return (
+            f"Prompt cache: {self.cache_read_tokens:,} tokens read (hits), "
+            f"{self.cache_creation_tokens:,} written (misses), "
+            f"{self.input_tokens:,} uncached over {self.requests} requests "
+            f"({self.hit_rate():.0%} of input tokens from cache)"
         )
 
+
+def build_invoke_params(placename, use_sampling):
+    """Template variables for one placename's prompt"""
+    invoke_params = {"placename": placename}
+
+    # Add features only if not in simple mode
+    """
+    if not simple_mode:
+        features = irish_matrix.sample_random_combination()
+        features_text = format_features(features)
+        invoke_params["tense"] = features['tense']
+        invoke_params["features"] = features_text
+    """
+    # Add previous sentences if sampling is enabled
+    if use_sampling:
+        previous = sample_previous_sentences(10)
+        invoke_params["previous_sentences"] = format_previous_sentences(previous)
+    return invoke_params
+
+
+def build_multi_invoke_params(placenames, use_sampling):
+    """Template variables for one multi-placename prompt"""
+    invoke_params = {"placenames": format_placename_list(placenames)}
+    if use_sampling:
+        previous = sample_previous_sentences(10)
+        invoke_params["previous_sentences"] = format_previous_sentences(previous)
+    return invoke_params
+
+
+# Letters initial mutations put in front of a word: eclipsis (gCorcaigh,
+# bhFear, n-Inis) and h-/t-prothesis (hÁth, tAonach)
+MUTATION_PREFIX = r"(?:bh|[bdgmnht])-?"
+
+
+def placename_pattern(placename):
+    """Regex matching a placename in a sentence, allowing for initial mutations.
+
+    Every word may take a mutation prefix or be lenited (an h after its first
+    letter, go Bhaile Átha Cliath), and a leading article is optional since
+    it is often dropped in running text (ag obair i dTeach Mór).
+    """
+    words = placename.split()
+    pattern = r"\s+".join(
+        f"(?:{MUTATION_PREFIX})?" + re.escape(word[0]) + "h?" + re.escape(word[1:])
+        for word in words
+    )
+    if len(words) > 1 and words[0].lower() == "an":
+        pattern = pattern.split(r"\s+", 1)
+        pattern = f"(?:{pattern[0]}\\s+)?{pattern[1]}"
+    return re.compile(r"(?<!\w)" + pattern + r"(?!\w)", re.IGNORECASE)
+
+
+def mentions_placename(sentence, placename):
+    return bool(placename.split()) and bool(placename_pattern(placename).search(sentence))
+
+
+def parse_multi_response(text, placenames):
+    """{position: sentence} for the valid items of a multi-placename answer.
+
+    The answer should be a JSON array of {"placename", "sentence"} objects in
+    request order. An item is kept only if it names one of the requested
+    placenames and its sentence is a non-empty single line that mentions that
+    placename; everything else is left out so it can be retried on its own.
+    """
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end < start:
+        return {}
     try:
-        # Prepare the invoke parameters
-        invoke_params = {"placename": placename}
+        items = json.loads(text[start : end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    positions = {}
+    for position, placename in enumerate(placenames):
+        positions.setdefault(placename.strip(), []).append(position)
+
+    sentences = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        placename, sentence = item.get("placename"), item.get("sentence")
+        if not isinstance(placename, str) or not isinstance(sentence, str):
+            continue
+        sentence = clean_sentence(sentence)
+        candidates = positions.get(placename.strip())
+        if not candidates or not sentence or not mentions_placename(sentence, placename):
+            continue
+        # the same placename can appear more than once in a request
+        sentences[candidates.pop(0)] = sentence
+    return sentences
+
+
+def clean_sentence(text):
+    """Keep only the first line of a response"""
+    sentence = text.strip()
+    # Deal with case where Claude returns multiple sentences
+    if "\n" in sentence:
+        sentence = sentence.split("\n")[0].strip()
+        sentence = " ".join(sentence.split())
+    return sentence
+
+
+def record_sentence(placename, sentence, model, use_sampling):
+    """Add a generated sentence to the history and build its result row"""
+    # Add to sentence history if sampling is enabled
+    duplicate = None
+    if use_sampling:
+        duplicate = add_to_sentence_history(sentence)
+
+    print(f"{placename} ({model}): {sentence}")
+    if duplicate is not None:
+        print(f"Near-duplicate ({duplicate[0]:.0%}) of: {duplicate[1]}")
+    """
+    if not simple_mode:
+        print(f"Features: {format_features(features)}")
+    """
+    print()
 
-        # Add features only if not in simple mode
-        """
-        if not simple_mode:
-            features = irish_matrix.sample_random_combination()
-            features_text = format_features(features)
-            invoke_params["tense"] = features['tense']
-            invoke_params["features"] = features_text
+    # Return appropriate dictionary based on mode
+    base_result = {
+        "placename": placename,
+        "sentence": sentence,
+        "model": model,
+    }
+    """
+    if not simple_mode:
+        base_result.update({
+            "person": features['person'],
+            "verb": features['verb'],
+            "preposition": features['preposition'],
+            "case": features['case'],
+            "tense": features['tense']
+        })
         """
-        # Add previous sentences if sampling is enabled
-        if use_sampling:
-            previous = sample_previous_sentences(10)
-            invoke_params["previous_sentences"] = format_previous_sentences(previous)
-
-        # Generate sentence
-        resp = chain.invoke(invoke_params)
-        sentence = resp.content.strip()
-        # Deal with case where Claude returns multiple sentences
-        if "\n" in sentence:
-            sentence = sentence.split("\n")[0].strip()
-            sentence = " ".join(sentence.split())
-
-        # Add to sentence history if sampling is enabled
-        if use_sampling:
-            add_to_sentence_history(sentence)
-
-        print(f"{placename} ({claude.model}): {sentence}")
-        """
-        if not simple_mode:
-            print(f"Features: {format_features(features)}")
-        """
-        print()
 
-        # Return appropriate dictionary based on mode
-        base_result = {
-            "placename": placename,
-            "sentence": sentence,
-            "model": claude.model,
-        }
-        """
-        if not simple_mode:
-            base_result.update({
-                "person": features['person'],
-                "verb": features['verb'],
-                "preposition": features['preposition'],
-                "case": features['case'],
-                "tense": features['tense']
-            })
-            """
-
-        return base_result
+    return base_result
+
+
+def occurrence_numbers(placenames_list):
+    """For every position, how many times its placename came up before it"""
+    seen = {}
+    occurrences = []
+    for placename in placenames_list:
+        occurrences.append(seen.get(placename, 0))
+        seen[placename] = occurrences[-1] + 1
+    return occurrences
+
+
+def generate_sentence_for_placename(args, cache_stats=None, occurrence=0):
+    """Generate sentence for a single placename (designed for parallel execution)"""
+    import anthropic
+
+    placename, use_sampling, simple_mode = args
+
+    # Shared Claude instance and pre-built chain
+    claude = get_claude_instance()
+    chain = get_chain(include_previous=use_sampling, simple_mode=simple_mode)
+
+    try:
+        # A response from an earlier run for the same prompt costs nothing
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            cache_key = response_cache_key(
+                placename, use_sampling, simple_mode, occurrence
+            )
+            text = response_cache.get(claude.model, cache_key)
+            if text is not None:
+                return record_sentence(
+                    placename, clean_sentence(text), claude.model, use_sampling
+                )
+
+        # Prepare the invoke parameters
+        invoke_params = build_invoke_params(placename, use_sampling)
+
+        # Generate sentence, backing off and retrying on transient errors
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                resp = chain.invoke(invoke_params)
+                break
+            except Exception as e:
+                if not is_transient_error(e) or attempt == MAX_RETRIES:
+                    raise
+                retry_after = None
+                if isinstance(e, anthropic.APIStatusError):
+                    retry_after = retry_after_seconds(e.response.headers)
+                delay = backoff_delay(attempt, retry_after)
+                print(f"Retrying {placename} in {delay:.1f}s ({e.__class__.__name__})")
+                time.sleep(delay)
+        if cache_stats is not None:
+            cache_stats.add(resp.response_metadata.get("usage", {}))
+        if response_cache is not None:
+            response_cache.put(claude.model, cache_key, resp.content)
+        sentence = clean_sentence(resp.content)
+
+        return record_sentence(placename, sentence, claude.model, use_sampling)
 
     except Exception as e:
         print(f"Error with {placename}: {e}")
         return None
 
 
-def process_in_batches(placenames_list, batch_size=BATCH_SIZE, batch_delay=BATCH_DELAY):
-    """Process placenames in batches to respect rate limits"""
+# ---------------------------------------------------------------------------
+# Asyncio engine: a bounded number of requests in flight on the Anthropic async
+# client, paced by token buckets instead of fixed batches and sleeps
+# ---------------------------------------------------------------------------
+
+ANTHROPIC_ROLES = {"human": "user", "ai": "assistant"}
+
 
-    batches = [
-        placenames_list[i : i + batch_size]
-        for i in range(0, len(placenames_list), batch_size)
+def to_anthropic_request(messages):
+    """Convert formatted LangChain messages to Messages API (system, messages)
+
+    Message content is passed through as is, so cache_control blocks added by
+    mark_cacheable_prefix() reach the API.
+    """
+    system = "\n\n".join(m.content for m in messages if m.type == "system")
+    api_messages = [
+        {"role": ANTHROPIC_ROLES[m.type], "content": m.content}
+        for m in messages
+        if m.type != "system"
     ]
+    return system, api_messages
+
+
+def content_text(content):
+    """Text of a message's content, a string or a list of content blocks"""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def estimate_tokens(system, messages):
+    """Rough token count of a request (~3 characters per token for Irish text)"""
+    n_chars = len(system) + sum(len(content_text(m["content"])) for m in messages)
+    return n_chars // 3 + 1
+
+
+class TokenBucket:
+    """Asyncio token bucket: holds up to `capacity` tokens, refilled at
+    `rate_per_minute`. acquire() waits until enough tokens are available."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # a request bigger than the whole bucket would wait forever
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount):
+        """Return (amount > 0) or charge (amount < 0) tokens after the fact,
+        e.g. once a response reports how many tokens it really used"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def set_rate(self, rate_per_minute):
+        """Change the limit, e.g. to the one reported by the API"""
+        self._refill()
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.tokens = min(self.tokens, self.capacity)
+
+    def sync(self, remaining):
+        """Set the level to what the server says is left in its window"""
+        self._refill()
+        self.tokens = max(0.0, min(self.capacity, remaining))
+
+
+class AdaptiveRateLimiter:
+    """Rate limiting shared by all async workers.
+
+    - requests/min and tokens/min token buckets, re-sized from the
+      anthropic-ratelimit-* response headers, so a higher API tier is used
+      without editing config.requests_per_minute/tokens_per_minute
+    - an adaptive number of requests in flight: +1 after a success while the
+      headers show headroom, halved on a 429/529
+    - a pause for every worker until the server's retry-after has passed
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        concurrency=None,
+        max_concurrency=MAX_CONCURRENCY,
+    ):
+        requests_per_minute = requests_per_minute or config.requests_per_minute
+        tokens_per_minute = tokens_per_minute or config.tokens_per_minute
+        concurrency = concurrency or config.async_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = concurrency
+        self.max_concurrency = max(max_concurrency, concurrency)
+        self.in_flight = 0
+        self.slots = asyncio.Condition()
+        self.paused_until = 0.0
+        self.retries = 0
+        self.rate_limited = 0
+
+    async def acquire(self, estimated_tokens):
+        """Wait for a free slot, the end of any pause and room in both buckets"""
+        async with self.slots:
+            await self.slots.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+    async def release(self):
+        async with self.slots:
+            self.in_flight -= 1
+            self.slots.notify_all()
+
+    def on_response(self, headers, estimated_tokens, used_tokens):
+        """Settle the token estimate and adapt to the rate-limit headers"""
+        self.tokens.adjust(estimated_tokens - used_tokens)
+
+        requests_limit = header_int(headers, "anthropic-ratelimit-requests-limit")
+        requests_remaining = header_int(headers, "anthropic-ratelimit-requests-remaining")
+        tokens_limit = header_int(headers, "anthropic-ratelimit-tokens-limit")
+        tokens_remaining = header_int(headers, "anthropic-ratelimit-tokens-remaining")
+        if requests_limit:
+            self.requests.set_rate(requests_limit)
+        if tokens_limit:
+            self.tokens.set_rate(tokens_limit)
+        # the server's count doesn't include requests still in flight here
+        if requests_remaining is not None:
+            self.requests.sync(requests_remaining - (self.in_flight - 1))
+        if tokens_remaining is not None:
+            self.tokens.sync(tokens_remaining - (self.in_flight - 1) * estimated_tokens)
+
+        # ramp up while the current window still has room for more in flight
+        if (
+            requests_remaining is not None
+            and requests_remaining > 2 * self.concurrency
+            and (
+                tokens_remaining is None
+                or tokens_remaining > 2 * self.concurrency * estimated_tokens
+            )
+            and self.concurrency < self.max_concurrency
+        ):
+            self.concurrency += 1
+
+    def on_retry(self, error, estimated_tokens, attempt):
+        """Back off after a failed attempt; returns the delay before retrying"""
+        import anthropic
+
+        self.retries += 1
+        # a rejected request doesn't count against the token budget
+        self.tokens.adjust(estimated_tokens)
+        retry_after = None
+        if isinstance(error, anthropic.APIStatusError):
+            retry_after = retry_after_seconds(error.response.headers)
+            if error.status_code in (429, 529):
+                self.rate_limited += 1
+                self.concurrency = max(1, self.concurrency // 2)
+        delay = backoff_delay(attempt, retry_after)
+        if retry_after is not None:
+            # every worker waits, not just the one that was told to
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        return delay
+
+
+def header_int(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(headers):
+    """Seconds from a retry-after header, or None"""
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient_error(e):
+    """True for errors worth retrying: rate limits, overload, 5xx, timeouts"""
+    import anthropic
+
+    if isinstance(e, anthropic.APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(e, anthropic.APIStatusError):
+        return e.status_code in TRANSIENT_STATUS_CODES
+    return False
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with full jitter, never shorter than retry-after"""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, 1))
+    return delay
+
+
+def create_async_client(max_concurrency=MAX_CONCURRENCY):
+    """Anthropic async client shared by every request of a run"""
+    import httpx
+    from anthropic import AsyncAnthropic
+
+    # keep a connection alive per concurrent request so no request waits on a
+    # new TLS handshake; retries are handled by AdaptiveRateLimiter, not the SDK
+    limits = httpx.Limits(
+        max_connections=max_concurrency, max_keepalive_connections=max_concurrency
+    )
+    return AsyncAnthropic(
+        api_key=get_anthropic_api_key(),
+        base_url=config.base_url,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            limits=limits, timeout=httpx.Timeout(600.0, connect=5.0)
+        ),
+    )
+
+
+async def acreate_message(
+    client,
+    limiter,
+    label,
+    system,
+    api_messages,
+    model,
+    max_tokens,
+    cache_stats=None,
+    n_placenames=1,
+):
+    """One Messages API call paced by the limiter.
+
+    The token bucket is charged the estimated input plus a realistic output
+    (MAX_TOKENS_PER_PLACENAME per placename, not max_tokens, which a sentence
+    never gets near) and trued up from the response's usage.
+
+    Transient failures (429/529, 5xx, timeouts) are retried up to MAX_RETRIES
+    times; anything else, or the last failure, is raised.
+    """
+    expected_output = min(max_tokens, MAX_TOKENS_PER_PLACENAME * n_placenames)
+    estimated = estimate_tokens(system, api_messages) + expected_output
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire(estimated)
+        try:
+            raw = await client.messages.with_raw_response.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=TEMPERATURE,
+                system=system,
+                messages=api_messages,
+            )
+        except Exception as e:
+            if not is_transient_error(e) or attempt == MAX_RETRIES:
+                raise
+            delay = limiter.on_retry(e, estimated, attempt)
+            print(f"Retrying {label} in {delay:.1f}s ({e.__class__.__name__})")
+        else:
+            resp = raw.parse()
+            if cache_stats is not None:
+                cache_stats.add(resp.usage)
+            # input_tokens doesn't include cache reads, so on models where
+            # they don't count against the limit the bucket gets them back
+            limiter.on_response(
+                raw.headers,
+                estimated,
+                resp.usage.input_tokens + resp.usage.output_tokens,
+            )
+            return resp
+        finally:
+            await limiter.release()
+        await asyncio.sleep(delay)
+
+
+def response_text(resp):
+    return "".join(block.text for block in resp.content if block.type == "text")
+
+
+async def agenerate_sentence_for_placename(
+    client,
+    limiter,
+    placename,
+    use_sampling,
+    simple_mode,
+    model=None,
+    cache_stats=None,
+    occurrence=0,
+):
+    """Async version of generate_sentence_for_placename using the Messages API.
+
+    Returns None only if the placename still failed after all retries.
+    """
+    model = model or config.model
+    try:
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            cache_key = response_cache_key(
+                placename, use_sampling, simple_mode, occurrence
+            )
+            text = response_cache.get(model, cache_key)
+            if text is not None:
+                return record_sentence(placename, clean_sentence(text), model, use_sampling)
+
+        prompt = get_prompt_template(
+            include_previous=use_sampling, simple_mode=simple_mode
+        )
+        messages = prompt.format_messages(**build_invoke_params(placename, use_sampling))
+        system, api_messages = to_anthropic_request(mark_cacheable_prefix(messages))
+        resp = await acreate_message(
+            client, limiter, placename, system, api_messages, model, MAX_TOKENS, cache_stats
+        )
+        text = response_text(resp)
+        if response_cache is not None:
+            response_cache.put(model, cache_key, text)
+        return record_sentence(placename, clean_sentence(text), resp.model, use_sampling)
+
+    except Exception as e:
+        print(f"Error with {placename}: {e}")
+        return None
+
+
+def cached_sentence(placename, use_sampling, simple_mode, occurrence=0, model=None):
+    """Result row of a placename from the response cache; None on a miss or
+    when the cache is off"""
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return None
+    model = model or config.model
+    text = response_cache.get(
+        model, response_cache_key(placename, use_sampling, simple_mode, occurrence)
+    )
+    if text is None:
+        return None
+    return record_sentence(placename, clean_sentence(text), model, use_sampling)
+
+
+async def agenerate_sentences_for_placenames(
+    client,
+    limiter,
+    placenames,
+    use_sampling,
+    model=None,
+    cache_stats=None,
+    simple_mode=True,
+    occurrences=None,
+):
+    """Sentences for several placenames from a single request.
+
+    Returns {position in placenames: result row} for the items that came back
+    valid (see parse_multi_response); the caller retries the rest one by one.
+    Valid items go into the response cache under the same key as a
+    single-placename answer, so a re-run finds them in either mode.
+    """
+    model = model or config.model
+    occurrences = occurrences or [0] * len(placenames)
+    label = f"{placenames[0]} (+{len(placenames) - 1})"
+    try:
+        prompt = get_multi_prompt_template(
+            include_previous=use_sampling, simple_mode=simple_mode
+        )
+        messages = prompt.format_messages(
+            **build_multi_invoke_params(placenames, use_sampling)
+        )
+        system, api_messages = to_anthropic_request(mark_cacheable_prefix(messages))
+        max_tokens = max(MAX_TOKENS, MAX_TOKENS_PER_PLACENAME * len(placenames))
+        resp = await acreate_message(
+            client,
+            limiter,
+            label,
+            system,
+            api_messages,
+            model,
+            max_tokens,
+            cache_stats,
+            n_placenames=len(placenames),
+        )
+    except Exception as e:
+        print(f"Error with {label}: {e}")
+        return {}
+
+    sentences = parse_multi_response(response_text(resp), placenames)
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        for position, sentence in sentences.items():
+            key = response_cache_key(
+                placenames[position], use_sampling, simple_mode, occurrences[position]
+            )
+            response_cache.put(model, key, sentence)
+    if len(sentences) < len(placenames):
+        print(f"{len(placenames) - len(sentences)} invalid items in {label}, retrying singly")
+    return {
+        position: record_sentence(placenames[position], sentence, resp.model, use_sampling)
+        for position, sentence in sorted(sentences.items())
+    }
+
+
+async def process_async(
+    placenames_list,
+    concurrency=None,
+    requests_per_minute=None,
+    tokens_per_minute=None,
+    client=None,
+    max_concurrency=MAX_CONCURRENCY,
+    journal=None,
+    placenames_per_request=None,
+):
+    """Generate sentences with up to `concurrency` requests in flight.
+
+    Throughput is bounded by the requests/min and tokens/min buckets rather
+    than by batches: as soon as one request finishes the next one starts. The
+    limiter raises concurrency (up to max_concurrency) while the API reports
+    headroom and halves it on 429s. Results are returned in input order;
+    placenames that still failed after all retries are listed and saved.
+
+    With a SynthesisJournal, every sentence is journaled as it completes and
+    placenames already in the journal are skipped.
+
+    With placenames_per_request > 1 each request asks for a group of
+    placenames at once; items missing or invalid in the answer are retried
+    with single-placename requests.
+    """
+    from tqdm import tqdm
+
+    concurrency = concurrency or config.async_concurrency
+    placenames_per_request = placenames_per_request or config.placenames_per_request
+    todo = pending_placenames(placenames_list, journal)
+    occurrences = occurrence_numbers(placenames_list)
+    # a client made here is closed here; a caller's client is the caller's
+    own_client = client is None
+    client = client or create_async_client(max(max_concurrency, concurrency))
+    limiter = AdaptiveRateLimiter(
+        requests_per_minute, tokens_per_minute, concurrency, max_concurrency
+    )
+    results = {}
+    cache_stats = PromptCacheStats()
+    progress = tqdm(total=len(todo), desc="Sentences")
+
+    def finish(i, result):
+        if result is not None and journal is not None:
+            journal.append(i, result)
+        results[i] = result
+        progress.set_postfix(cache_hits=f"{cache_stats.hit_rate():.0%}")
+        progress.update(1)
+
+    misses = todo
+    if placenames_per_request > 1 and get_response_cache() is not None:
+        # answer cached placenames here, so every group sent is all misses
+        misses = []
+        for i, placename in todo:
+            row = cached_sentence(
+                placename, config.do_sampling, config.just_sample, occurrences[i]
+            )
+            if row is None:
+                misses.append((i, placename))
+            else:
+                finish(i, row)
+    queue = asyncio.Queue()
+    for start in range(0, len(misses), placenames_per_request):
+        queue.put_nowait(misses[start : start + placenames_per_request])
+
+    async def worker():
+        while True:
+            try:
+                group = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if len(group) > 1:
+                rows = await agenerate_sentences_for_placenames(
+                    client,
+                    limiter,
+                    [placename for _, placename in group],
+                    config.do_sampling,
+                    cache_stats=cache_stats,
+                    simple_mode=config.just_sample,
+                    occurrences=[occurrences[i] for i, _ in group],
+                )
+                for position, row in rows.items():
+                    finish(group[position][0], row)
+                group = [item for position, item in enumerate(group) if position not in rows]
+            for i, placename in group:
+                result = await agenerate_sentence_for_placename(
+                    client,
+                    limiter,
+                    placename,
+                    config.do_sampling,
+                    config.just_sample,
+                    cache_stats=cache_stats,
+                    occurrence=occurrences[i],
+                )
+                finish(i, result)
+
+    try:
+        # enough workers for the highest concurrency the limiter may allow;
+        # the limiter's slots decide how many actually have a request out
+        await asyncio.gather(
+            *(worker() for _ in range(min(limiter.max_concurrency, queue.qsize())))
+        )
+    finally:
+        progress.close()
+        if own_client:
+            await client.close()
+
+    print(
+        f"Retries: {limiter.retries} ({limiter.rate_limited} rate limited), "
+        f"final concurrency: {limiter.concurrency}"
+    )
+    print(cache_stats.summary())
+    failed = [placename for i, placename in todo if results.get(i) is None]
+    if failed:
+        save_failed_placenames(failed)
+    return [results[i] for i, _ in todo if results.get(i) is not None]
+
+
+def pending_placenames(placenames_list, journal=None):
+    """(index, placename) pairs not yet in the journal"""
+    completed = journal.completed_keys() if journal is not None else set()
+    if completed:
+        print(f"Resuming: {len(completed)} placenames already in {journal.path}")
+    return [
+        (i, placename)
+        for i, placename in enumerate(placenames_list)
+        if (i, placename) not in completed
+    ]
+
+
+def restore_sentence_history(journal):
+    """Rebuild the sampling history from the sentences of an earlier run"""
+    for sentence in journal.sentences():
+        add_to_sentence_history(sentence)
+
+
+def save_failed_placenames(failed):
+    """Write placenames that failed after all retries so they can be re-run"""
+    import pandas as pd
+
+    failed_csv = f"./synthesis/failed_placenames_{config.model}{config.run_tag}.csv"
+    pd.DataFrame({"Logainm": failed}).to_csv(failed_csv, index=False, encoding="utf-8")
+    print(f"{len(failed)} placenames failed after {MAX_RETRIES} retries, saved to {failed_csv}")
+
+
+def process_in_batches(placenames_list, batch_size=None, batch_delay=None, journal=None):
+    """Process placenames in batches to respect rate limits
+
+    With a SynthesisJournal, each sentence is journaled as it completes and
+    placenames already in the journal are skipped. Placenames that still
+    failed after all retries are listed and saved, as in process_async.
+    """
+    from tqdm import tqdm
+
+    batch_size = batch_size or config.batch_size
+    if batch_delay is None:
+        batch_delay = config.batch_delay
+    todo = pending_placenames(placenames_list, journal)
+    occurrences = occurrence_numbers(placenames_list)
+    batches = [todo[i : i + batch_size] for i in range(0, len(todo), batch_size)]
 
     all_results = []
+    failed = []
 
     for batch_num, batch in enumerate(batches):
         print(f"\n{'='*60}")
         print(
             f"Processing batch {batch_num + 1}/{len(batches)} ({len(batch)} placenames)"
         )
-        print(f"Total processed so far: {len(all_results)}/{len(placenames_list)}")
+        print(f"Total processed so far: {len(all_results)}/{len(todo)}")
         print(f"{'='*60}")
 
         # Process this batch
-        args_list = [(pn, do_sampling, just_sample) for pn in batch]
         batch_results = []
+        cache_stats = PromptCacheStats()
+        response_cache = get_response_cache()
+        misses = response_cache.misses if response_cache is not None else None
 
         # Use limited number of workers for each batch
         max_workers = min(len(batch), 8)
 
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_placename = {
-                executor.submit(generate_sentence_for_placename, args): args[0]
-                for args in args_list
+            future_to_index = {
+                executor.submit(
+                    generate_sentence_for_placename,
+                    (pn, config.do_sampling, config.just_sample),
+                    cache_stats,
+                    occurrences[i],
+                ): i
+                for i, pn in batch
             }
 
             for future in tqdm(
-                as_completed(future_to_placename),
+                as_completed(future_to_index),
                 total=len(batch),
                 desc=f"Batch {batch_num + 1}",
             ):
                 result = future.result()
-                if result is not None:
-                    batch_results.append(result)
+                if result is None:
+                    failed.append(future_to_index[future])
+                    continue
+                # journaled as soon as it completes, not once per batch
+                if journal is not None:
+                    journal.append(future_to_index[future], result)
+                batch_results.append(result)
 
         all_results.extend(batch_results)
+        print(cache_stats.summary())
 
-        # Save intermediate results after each batch
-        if batch_results:
-            intermediate_df = pd.DataFrame(all_results)
-            mode_suffix = "_simple" if just_sample else "_features"
-            sampling_suffix = "_sampling" if do_sampling else ""
-            intermediate_csv = f"./synthesis/synthetic_sentences_{CLAUDE_MODEL}{mode_suffix}{sampling_suffix}_batch_{batch_num + 1}.csv"
-            intermediate_df.to_csv(intermediate_csv, index=False, encoding="utf-8-sig")
-            print(f"Intermediate results saved to {intermediate_csv}")
-
-        # Wait between batches (except for the last one)
-        if batch_num < len(batches) - 1:
+        # Wait between batches (except for the last one, or one that was all
+        # served from the response cache and so used none of the rate limit)
+        served_locally = response_cache is not None and response_cache.misses == misses
+        if batch_num < len(batches) - 1 and not served_locally:
             print(f"\nWaiting {batch_delay} seconds before next batch...")
             print(
-                f"Progress: {len(all_results)}/{len(placenames_list)} completed ({len(all_results)/len(placenames_list)*100:.1f}%)"
+                f"Progress: {len(all_results)}/{len(todo)} completed ({len(all_results)/len(todo)*100:.1f}%)"
             )
 
             # Countdown timer
@@ -320,11 +1270,13 @@ def process_in_batches(placenames_list, batch_size=BATCH_SIZE, batch_delay=BATCH
                 time.sleep(1)
             print()  # New line after countdown
 
+    if failed:
+        save_failed_placenames([placenames_list[i] for i in sorted(failed)])
     return all_results
 
 
-# Main execution
-if __name__ == "__main__":
+def check_setup():
+    """Check the API key, the prompt files and one API call before a run"""
     print("=== DEBUG START ===")
     
     # Test API key
@@ -337,8 +1289,7 @@ if __name__ == "__main__":
     
     # Test file loading
     try:
-        with open("examples.json", "r", encoding="utf-8") as f:
-            examples = json.load(f)
+        examples = load_examples()
         print(f"✅ Examples loaded: {len(examples)} examples")
     except Exception as e:
         print(f"❌ Examples error: {e}")
@@ -370,40 +1321,121 @@ if __name__ == "__main__":
         print(f"SETUP ERROR: {e}")
         exit(1)
 
-    # ... rest of your code
-    # Load placenames
-    csv_path = "./placenames.csv"
-    df = pd.read_csv(csv_path, encoding="utf-8")
 
-    # Select first n_generated placenames
-    placenames_list = df["Logainm"].tolist()
+def shard_bounds(n_rows, shard, num_shards):
+    """[start, stop) rows of shard `shard` of `num_shards` (e.g. a SLURM array task)"""
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"shard {shard} is not in 0..{num_shards - 1}")
+    return n_rows * shard // num_shards, n_rows * (shard + 1) // num_shards
+
+
+def load_placenames(
+    path="./placenames.csv",
+    column="Logainm",
+    start=0,
+    stop=None,
+    sample=None,
+    seed=None,
+    limit=None,
+):
+    """Placenames from rows [start:stop] of a CSV or Parquet column, optionally
+    a random sample of `sample` of them (kept in file order), at most `limit`"""
+    from parquet_io import read_table
+
+    df = read_table(path, columns=[column])
+    placenames = df[column].dropna().astype(str).tolist()[start:stop]
+    if sample is not None and sample < len(placenames):
+        rows = random.Random(seed).sample(range(len(placenames)), sample)
+        placenames = [placenames[i] for i in sorted(rows)]
+    return placenames[:limit]
+
+
+def run(placenames_list, journal_path=None, output_csv_path=None):
+    """Generate sentences for placenames_list with the engine chosen in
+    config, journaling as it goes, and write the final CSV"""
+    import pandas as pd
 
     print(f"Generating sentences for {len(placenames_list)} placenames...")
-    print(f"Batch size: {BATCH_SIZE} placenames per batch")
-    print(f"Batch delay: {BATCH_DELAY} seconds between batches")
-    print(
-        f"Estimated total time: {len(placenames_list)//BATCH_SIZE * BATCH_DELAY / 60:.1f} minutes"
-    )
+    if config.use_batch_api:
+        print("Message Batches API: results can take up to 24 hours")
+    elif config.use_async:
+        print(f"Concurrency: {config.async_concurrency} requests in flight")
+        print(f"Placenames per request: {config.placenames_per_request}")
+        print(
+            f"Rate limits: {config.requests_per_minute} requests/min, {config.tokens_per_minute} tokens/min"
+        )
+        print(
+            f"Estimated total time: {len(placenames_list) / config.placenames_per_request / config.requests_per_minute:.1f} minutes"
+        )
+    else:
+        print(f"Batch size: {config.batch_size} placenames per batch")
+        print(f"Batch delay: {config.batch_delay} seconds between batches")
+        print(
+            f"Estimated total time: {len(placenames_list)//config.batch_size * config.batch_delay / 60:.1f} minutes"
+        )
     """if not just_sample:
-        print(f"Feature matrix has {len(irish_matrix.feature_matrix):,} possible combinations")
+        print(f"Feature matrix has {len(irish_matrix):,} possible combinations")
         """
-    print(f"Mode: {'SIMPLE SAMPLING' if just_sample else 'FEATURE MATRIX'}")
-    print(f"Sentence sampling: {'ENABLED' if do_sampling else 'DISABLED'}")
+    print(f"Mode: {'SIMPLE SAMPLING' if config.just_sample else 'FEATURE MATRIX'}")
+    print(f"Sentence sampling: {'ENABLED' if config.do_sampling else 'DISABLED'}")
     print()
 
-    # Process in rate-limited batches
-    rows = process_in_batches(
-        placenames_list, batch_size=BATCH_SIZE, batch_delay=BATCH_DELAY
+    mode_suffix = "_simple" if config.just_sample else "_features"
+    sampling_suffix = "_sampling" if config.do_sampling else ""
+    tag = config.run_tag
+    journal_path = (
+        journal_path
+        or f"./synthesis/journal_{config.model}{mode_suffix}{sampling_suffix}{tag}.jsonl"
     )
+    if not config.resume and os.path.exists(journal_path):
+        os.remove(journal_path)
+    journal = SynthesisJournal(journal_path)
+    print(f"Journal: {journal_path} ({len(journal.entries)} sentences already done)")
+    if config.do_sampling:
+        restore_sentence_history(journal)
+
+    with journal:
+        if config.use_batch_api:
+            import batch_synthesis
+
+            batch_synthesis.process_with_batches(
+                placenames_list,
+                journal=journal,
+                state_path=f"./synthesis/batches_{config.model}{tag}.json",
+                use_sampling=config.do_sampling,
+                simple_mode=config.just_sample,
+            )
+        elif config.use_async:
+            # Keep config.async_concurrency requests in flight within the rate limits
+            asyncio.run(process_async(placenames_list, journal=journal))
+        else:
+            # Process in rate-limited batches
+            process_in_batches(
+                placenames_list,
+                journal=journal,
+            )
 
-    # Create final DataFrame
-    results_df = pd.DataFrame(rows)
+    if get_response_cache() is not None:
+        print(get_response_cache().summary())
+
+    # Create final DataFrame from everything journaled, this run and earlier ones
+    results_df = pd.DataFrame(
+        journal.rows(), columns=["placename", "sentence", "model"]
+    )
 
     # Create output filename based on flags
-    mode_suffix = "_simple" if just_sample else "_features"
-    sampling_suffix = "_sampling" if do_sampling else ""
-    output_csv_path = f"./synthesis/synthetic_sentences_claude_{CLAUDE_MODEL}_{mode_suffix}{sampling_suffix}_final.csv"
+    output_csv_path = (
+        output_csv_path
+        or f"./synthesis/synthetic_sentences_claude_{config.model}_{mode_suffix}{sampling_suffix}{tag}_final.csv"
+    )
     results_df.to_csv(output_csv_path, index=False, encoding="utf-8-sig")
+    if config.parquet_output:
+        from parquet_io import write_parquet
+
+        # one file per mode and shard inside the model's partition
+        basename = f"{mode_suffix}{sampling_suffix}{tag}".lstrip("_")
+        write_parquet(results_df, config.parquet_output, ["model"], basename)
+        print(f"Added to Parquet dataset {config.parquet_output} (partitioned by model)")
 
     print(f"\n{'='*60}")
     print("FINAL RESULTS")
@@ -411,12 +1443,222 @@ if __name__ == "__main__":
     print(f"Final results saved to {output_csv_path}")
     print(f"Generated {len(results_df)} sentences total")
     print(
-        f"Success rate: {len(results_df)}/{len(placenames_list)} ({len(results_df)/len(placenames_list)*100:.1f}%)"
+        f"Success rate: {len(results_df)}/{len(placenames_list)} ({len(results_df)/max(len(placenames_list), 1)*100:.1f}%)"
     )
     print(f"Models used: {results_df['model'].value_counts().to_dict()}")
 
-    if not just_sample:
+    if not config.just_sample:
         print(f"Tenses used: {results_df['tense'].value_counts().to_dict()}")
 
-    if do_sampling:
-        print(f"Total sentences in history: {len(previous_sentences)}")
+    if config.do_sampling:
+        sentence_history = get_sentence_history()
+        print(
+            f"Sentences in history: {len(sentence_history)} "
+            f"(of {sentence_history.added} added, "
+            f"{sentence_history.near_duplicates} near-duplicates)"
+        )
+    return results_df
+
+
+def parse_args(argv=None):
+    import argparse
+
+    defaults = SynthesisConfig()
+    parser = argparse.ArgumentParser(
+        description="Generate Irish sentences for placenames with Claude"
+    )
+    inputs = parser.add_argument_group("input")
+    inputs.add_argument(
+        "--input",
+        default="./placenames.csv",
+        help="placenames CSV or Parquet dataset (default ./placenames.csv)",
+    )
+    inputs.add_argument(
+        "--column", default="Logainm", help="placename column (default Logainm)"
+    )
+    inputs.add_argument("--start", type=int, default=0, help="first row to use")
+    inputs.add_argument("--stop", type=int, help="row to stop before")
+    inputs.add_argument(
+        "--shard",
+        type=int,
+        help="use only this shard of the rows, e.g. $SLURM_ARRAY_TASK_ID (needs --num-shards)",
+    )
+    inputs.add_argument(
+        "--num-shards", type=int, help="number of shards, e.g. $SLURM_ARRAY_TASK_COUNT"
+    )
+    inputs.add_argument(
+        "--sample", type=int, help="random sample of this many placenames from the rows"
+    )
+    inputs.add_argument("--seed", type=int, help="seed for --sample")
+    inputs.add_argument(
+        "-n",
+        "--n-generated",
+        type=int,
+        default=defaults.n_generated,
+        help="at most this many placenames",
+    )
+
+    mode = parser.add_argument_group("mode")
+    mode.add_argument(
+        "--engine",
+        choices=["async", "threads", "batch-api"],
+        default=(
+            "batch-api"
+            if defaults.use_batch_api
+            else "async" if defaults.use_async else "threads"
+        ),
+        help="asyncio engine, the old batch-and-sleep thread loop, or the Message Batches API",
+    )
+    mode.add_argument(
+        "--no-sampling",
+        action="store_true",
+        help="don't show previous sentences in the prompt",
+    )
+    mode.add_argument("--model", default=defaults.model)
+    mode.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="start over instead of resuming the journal",
+    )
+    mode.add_argument(
+        "--base-url",
+        help="API endpoint, e.g. http://127.0.0.1:8765 for mock_anthropic_server.py",
+    )
+    mode.add_argument(
+        "--response-cache",
+        metavar="PATH",
+        help="SQLite file of earlier responses to reuse instead of calling the API again",
+    )
+    mode.add_argument(
+        "--response-cache-mb",
+        type=int,
+        default=defaults.response_cache_mb,
+        help=f"size limit of the response cache (default {defaults.response_cache_mb})",
+    )
+    mode.add_argument(
+        "--no-prompt-cache",
+        action="store_true",
+        help="don't mark the static prefix for prompt caching",
+    )
+
+    limits = parser.add_argument_group("concurrency and rate limits")
+    limits.add_argument(
+        "--concurrency",
+        type=int,
+        default=defaults.async_concurrency,
+        help="requests in flight (async)",
+    )
+    limits.add_argument(
+        "--rpm",
+        type=int,
+        default=defaults.requests_per_minute,
+        help="requests per minute",
+    )
+    limits.add_argument(
+        "--tpm", type=int, default=defaults.tokens_per_minute, help="tokens per minute"
+    )
+    limits.add_argument(
+        "--placenames-per-request",
+        type=int,
+        default=defaults.placenames_per_request,
+        help="placenames per request (async)",
+    )
+    limits.add_argument(
+        "--batch-size",
+        type=int,
+        default=defaults.batch_size,
+        help="placenames per batch (threads)",
+    )
+    limits.add_argument(
+        "--batch-delay",
+        type=int,
+        default=defaults.batch_delay,
+        help="seconds between batches (threads)",
+    )
+
+    outputs = parser.add_argument_group("output")
+    outputs.add_argument(
+        "--output",
+        help="final CSV (default ./synthesis/synthetic_sentences_claude_<model>_..._final.csv)",
+    )
+    outputs.add_argument(
+        "--parquet",
+        nargs="?",
+        const="./synthesis/synthetic_sentences.parquet",
+        metavar="DIR",
+        help="also add the sentences to a Parquet dataset partitioned by model "
+        "(default ./synthesis/synthetic_sentences.parquet); needs pyarrow",
+    )
+    outputs.add_argument(
+        "--journal",
+        help="journal JSONL (default ./synthesis/journal_<model>_....jsonl)",
+    )
+    outputs.add_argument(
+        "--skip-checks", action="store_true", help="skip the API key / test call checks"
+    )
+    outputs.add_argument(
+        "--dry-run", action="store_true", help="print what would be generated and exit"
+    )
+
+    args = parser.parse_args(argv)
+    if (args.shard is None) != (args.num_shards is None):
+        parser.error("--shard and --num-shards go together")
+    if args.shard is not None and (args.start or args.stop is not None):
+        parser.error("--shard picks its own rows; it can't be used with --start/--stop")
+    return args
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    config.model = args.model
+    config.do_sampling = not args.no_sampling
+    config.resume = not args.no_resume
+    config.prompt_caching = not args.no_prompt_cache
+    config.base_url = args.base_url
+    config.response_cache = args.response_cache
+    config.response_cache_mb = args.response_cache_mb
+    config.parquet_output = args.parquet
+    config.use_async = args.engine == "async"
+    config.use_batch_api = args.engine == "batch-api"
+    config.async_concurrency = args.concurrency
+    config.requests_per_minute = args.rpm
+    config.tokens_per_minute = args.tpm
+    config.placenames_per_request = args.placenames_per_request
+    config.batch_size = args.batch_size
+    config.batch_delay = args.batch_delay
+    config.n_generated = args.n_generated
+
+    start, stop = args.start, args.stop
+    if args.shard is not None:
+        # bounds over the rows load_placenames keeps, not the file's empty ones
+        n_rows = len(load_placenames(args.input, args.column))
+        start, stop = shard_bounds(n_rows, args.shard, args.num_shards)
+        # every shard gets its own journal, batch state and output
+        config.run_tag = f"_shard{args.shard}of{args.num_shards}"
+    placenames_list = load_placenames(
+        args.input,
+        args.column,
+        start=start,
+        stop=stop,
+        sample=args.sample,
+        seed=args.seed,
+        limit=config.n_generated,
+    )
+
+    if args.dry_run:
+        print(
+            f"{len(placenames_list)} placenames from {args.input} rows {start}:{stop}"
+        )
+        print(config)
+        return
+    if not args.skip_checks:
+        check_setup()
+    run(placenames_list, journal_path=args.journal, output_csv_path=args.output)
+
+
+# Main execution
+if __name__ == "__main__":
+    # run through the importable module so batch_synthesis shares its config
+    import synthesis
+
+    synthesis.cli()
@@ -0,0 +1,82 @@
+"""Append-only JSONL journal of generated sentences.
+
+Every completed sentence is appended as one JSON line (and flushed to disk)
+the moment it is generated, so a crash or a SLURM timeout loses at most the
+requests that were in flight. A later run opened on the same journal skips the
+placenames already in it and can rebuild the sampling history from it.
+
+Each line is a result row plus the placename's position in the input list:
+
+    {"index": 17, "placename": "An Carn", "sentence": "...", "model": "..."}
+"""
+
+import json
+import os
+import threading
+
+
+class SynthesisJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self._read()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+        if self.file.tell() > 0 and not self._ends_with_newline():
+            # terminate a line cut short by a crash so the next entry starts clean
+            self.file.write("\n")
+            self.file.flush()
+
+    def _read(self):
+        entries = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # the last line can be cut short by a crash mid-write
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def completed_keys(self):
+        """(index, placename) of every journaled sentence"""
+        return {(entry["index"], entry["placename"]) for entry in self.entries}
+
+    def sentences(self):
+        return [entry["sentence"] for entry in self.entries]
+
+    def rows(self):
+        """Result rows (without the index) in input order"""
+        return [
+            {key: value for key, value in entry.items() if key != "index"}
+            for entry in sorted(self.entries, key=lambda entry: entry["index"])
+        ]
+
+    def append(self, index, row):
+        """Record one result row; O(1) and durable once it returns"""
+        entry = dict(row, index=index)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.entries.append(entry)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,179 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from anthropic import Anthropic
+
+import batch_synthesis
+from synthesis_journal import SynthesisJournal
+
+
+class StubBatchesHandler(BaseHTTPRequestHandler):
+    """Just enough of the Message Batches API: create, retrieve and results.
+    Every request succeeds except placenames containing "Theip"."""
+
+    batches = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _batch(self, batch_id):
+        n = len(self.batches[batch_id])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended",
+            "request_counts": {
+                "processing": 0,
+                "succeeded": n,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": "2025-01-01T00:01:00Z",
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"http://{self.headers['Host']}/v1/messages/batches/{batch_id}/results",
+        }
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        batch_id = f"msgbatch_{len(self.batches)}"
+        self.batches[batch_id] = body["requests"]
+        self._send(200, json.dumps(self._batch(batch_id)))
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/messages/batches/(\w+)(/results)?", self.path)
+        batch_id, results = match.groups()
+        if not results:
+            self._send(200, json.dumps(self._batch(batch_id)))
+            return
+        lines = []
+        for request in self.batches[batch_id]:
+            placename = request["params"]["messages"][-1]["content"].split("\n")[0]
+            placename = placename.replace("Placename: ", "")
+            if "Theip" in placename:
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "stub"}}}
+            else:
+                result = {
+                    "type": "succeeded",
+                    "message": {
+                        "id": "msg_1",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": request["params"]["model"],
+                        "content": [{"type": "text", "text": f"Chuaigh mé go {placename} inné."}],
+                        "stop_reason": "end_turn",
+                        "stop_sequence": None,
+                        "usage": {"input_tokens": 10, "output_tokens": 5},
+                    },
+                }
+            lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+        self._send(200, "\n".join(lines) + "\n", "application/binary")
+
+
+@pytest.fixture
+def stub_server():
+    StubBatchesHandler.batches = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBatchesHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_batches_backend_merges_results_in_input_order(stub_server, tmp_path, monkeypatch):
+    """
+    Placenames go out as batch requests and come back as the usual
+    (placename, sentence, model) rows in input order; errored requests are
+    reported as failed instead of silently dropped.
+    """
+    monkeypatch.setattr(batch_synthesis, "BATCH_MAX_REQUESTS", 2)
+    failed = []
+    monkeypatch.setattr(batch_synthesis.synthesis, "save_failed_placenames", failed.extend)
+    client = Anthropic(api_key="test", base_url=stub_server)
+    placenames = ["An Carn", "Cromghlinn", "Baile Theip", "Baile Adaim"]
+
+    rows = batch_synthesis.process_with_batches(
+        placenames,
+        model="stub-model",
+        state_path=str(tmp_path / "batches.json"),
+        poll_interval=0,
+        client=client,
+    )
+
+    assert [row["placename"] for row in rows] == ["An Carn", "Cromghlinn", "Baile Adaim"]
+    assert rows[0] == {
+        "placename": "An Carn",
+        "sentence": "Chuaigh mé go An Carn inné.",
+        "model": "stub-model",
+    }
+    assert failed == ["Baile Theip"]
+    # the static system + few-shot prefix is marked for prompt caching
+    request = StubBatchesHandler.batches["msgbatch_0"][0]
+    assert request["params"]["messages"][-2]["content"][0]["cache_control"] == {
+        "type": "ephemeral"
+    }
+    assert len(StubBatchesHandler.batches) == 2
+    assert not (tmp_path / "batches.json").exists()
+
+
+def test_resumed_merge_does_not_journal_results_twice(stub_server, tmp_path, monkeypatch):
+    """A merge cut short is redone on restart without duplicating the rows it
+    had already journaled, and results are only merged for rows that still
+    hold the placename they were submitted for"""
+    monkeypatch.setattr(batch_synthesis.synthesis, "save_failed_placenames", print)
+    client = Anthropic(api_key="test", base_url=stub_server)
+    state_path = str(tmp_path / "batches.json")
+    placenames = ["An Carn", "Cromghlinn", "Baile Adaim"]
+    record_sentence = batch_synthesis.synthesis.record_sentence
+    calls = []
+
+    def crash_on_second_row(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return record_sentence(*args)
+
+    with SynthesisJournal(str(tmp_path / "journal.jsonl")) as journal:
+        monkeypatch.setattr(
+            batch_synthesis.synthesis, "record_sentence", crash_on_second_row
+        )
+        with pytest.raises(KeyboardInterrupt):
+            batch_synthesis.process_with_batches(
+                placenames,
+                model="stub-model",
+                journal=journal,
+                state_path=state_path,
+                poll_interval=0,
+                client=client,
+            )
+        monkeypatch.setattr(batch_synthesis.synthesis, "record_sentence", record_sentence)
+        state = batch_synthesis.load_batch_state(state_path)
+        assert state["batches"][0]["placenames"] == placenames
+
+        # restarted against an input whose last row has changed
+        changed = ["An Carn", "Cromghlinn", "Gaillimh"]
+        batch_synthesis.process_with_batches(
+            changed,
+            model="stub-model",
+            journal=journal,
+            state_path=state_path,
+            poll_interval=0,
+            client=client,
+        )
+        assert [row["placename"] for row in journal.rows()] == changed
+    # only the changed row was submitted again
+    assert [len(requests) for requests in StubBatchesHandler.batches.values()] == [3, 1]
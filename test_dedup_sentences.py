@@ -0,0 +1,34 @@
+import json
+
+import pandas as pd
+
+from dedup_sentences import dedup_csv
+
+
+def test_dedup_removes_exact_and_near_duplicates(tmp_path):
+    sentences = [
+        "Chuaigh mé go Corcaigh inné le mo mháthair agus m'athair.",
+        "Bíonn féilte traidisiúnta ar siúl in Oileán na Sceach gach bliain.",
+        # exact duplicate apart from case and spacing
+        "chuaigh mé go Corcaigh  inné le mo mháthair agus m'athair.",
+        "Tá siad ag iascaireacht ag Loch Bhaile Uí Chuirc anois.",
+        # near-duplicate: one word changed
+        "Bíonn féilte traidisiúnta ar siúl in Oileán na Sceach gach samhradh.",
+        "Tagann bus go Chatha gach uair an chloig.",
+    ]
+    csv_path = tmp_path / "sentences.csv"
+    pd.DataFrame(
+        {"placename": ["x"] * len(sentences), "sentence": sentences, "model": "m"}
+    ).to_csv(csv_path, index=False, encoding="utf-8-sig")
+
+    # small chunks so both passes stream over several of them
+    stats = dedup_csv(str(csv_path), chunk_rows=2, threshold=0.5)
+
+    cleaned = pd.read_csv(tmp_path / "sentences_dedup.csv", encoding="utf-8-sig")
+    assert cleaned["sentence"].tolist() == [sentences[0], sentences[1], sentences[3], sentences[5]]
+    assert list(cleaned.columns) == ["placename", "sentence", "model"]
+    assert stats["exact_duplicates"] == 1
+    assert stats["near_duplicates"] == 1
+    assert stats["duplicate_clusters"] == 2
+    with open(tmp_path / "sentences_dedup_stats.json", encoding="utf-8") as f:
+        assert json.load(f)["kept"] == 4
@@ -0,0 +1,52 @@
+from itertools import product
+
+from feature_matrix import IrishFeatureMatrix
+
+
+def test_decoded_combinations_match_the_full_product():
+    matrix = IrishFeatureMatrix()
+    expected = list(
+        product(matrix.persons, matrix.verbs, matrix.prepositions, matrix.cases, matrix.tenses)
+    )
+
+    assert len(matrix) == len(expected) == 8 * 15 * 10 * 3 * 5
+    assert [tuple(row) for row in matrix.feature_matrix.itertuples(index=False)] == expected
+    for i in (0, 1, 4567, len(expected) - 1):
+        person, verb, preposition, case, tense = expected[i]
+        assert (
+            matrix.encode(person=person, verb=verb, preposition=preposition, case=case, tense=tense)
+            == i
+        )
+
+
+def test_criteria_and_sampling_use_index_arithmetic():
+    matrix = IrishFeatureMatrix(extra_axes={"number": ["singular", "plural"]})
+    full = matrix.feature_matrix
+
+    filtered = matrix.get_features_by_criteria(verb="téigh", tense="Aimsir Cháite", number="plural")
+    expected = full[
+        (full["verb"] == "téigh") & (full["tense"] == "Aimsir Cháite") & (full["number"] == "plural")
+    ]
+    assert filtered.index.tolist() == expected.index.tolist()
+    assert len(filtered) == 8 * 10 * 3
+    assert matrix.get_features_by_criteria(verb="not a verb").empty
+
+    sample = matrix.sample_features(n=500)
+    assert len(sample.drop_duplicates()) == 500
+    assert set(sample.columns) == {"person", "verb", "preposition", "case", "tense", "number"}
+    assert matrix.sample_random_combination()["tense"] in matrix.tenses
+
+
+def test_planned_features_balance_every_axis():
+    matrix = IrishFeatureMatrix()
+    n = 1000
+
+    plan = list(matrix.iter_planned_features(n, seed=7))
+
+    assert len(plan) == n
+    for name, values in matrix.axes.items():
+        counts = [sum(features[name] == value for features in plan) for value in values]
+        assert sum(counts) == n
+        assert max(counts) - min(counts) <= 1
+    assert plan == list(matrix.iter_planned_features(n, seed=7))
+    assert plan != list(matrix.iter_planned_features(n, seed=8))
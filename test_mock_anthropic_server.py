@@ -0,0 +1,62 @@
+import asyncio
+
+import anthropic
+import pytest
+
+import mock_anthropic_server
+import synthesis
+
+
+@pytest.fixture
+def mock_server():
+    server = mock_anthropic_server.start_server(
+        latency=0.01, requests_per_minute=3, seed=1
+    )
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_mock_server_enforces_its_request_limit(mock_server):
+    client = anthropic.Anthropic(
+        api_key="test", base_url=mock_server.base_url, max_retries=0
+    )
+    messages = [{"role": "user", "content": "Placename: An Carn\n"}]
+
+    for remaining in (2, 1, 0):
+        raw = client.messages.with_raw_response.create(
+            model="mock", max_tokens=50, messages=messages
+        )
+        assert raw.headers["anthropic-ratelimit-requests-remaining"] == str(remaining)
+        assert "An Carn" in synthesis.response_text(raw.parse())
+
+    with pytest.raises(anthropic.RateLimitError) as excinfo:
+        client.messages.create(model="mock", max_tokens=50, messages=messages)
+    assert synthesis.retry_after_seconds(excinfo.value.response.headers) > 0
+
+    stats = mock_server.state.stats()
+    assert (stats["received"], stats["succeeded"], stats["rate_limited"]) == (4, 3, 1)
+    assert stats["latency_p50"] >= 0.005
+
+
+def test_async_engine_runs_against_the_mock_server(monkeypatch):
+    """Multi-placename requests end to end, with the client's limits taken from
+    the server's rate-limit headers"""
+    server = mock_anthropic_server.start_server(
+        latency=0.01, requests_per_minute=600, tokens_per_minute=10**6
+    )
+    monkeypatch.setattr(synthesis.config, "base_url", server.base_url)
+    monkeypatch.setattr(synthesis.config, "do_sampling", False)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    placenames = ["An Carn", "Cromghlinn", "Baile Adaim", "Corcaigh", "Gaillimh"]
+    try:
+        rows = asyncio.run(
+            synthesis.process_async(placenames, placenames_per_request=2)
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert [row["placename"] for row in rows] == placenames
+    assert all(row["placename"] in row["sentence"] for row in rows)
+    assert server.state.stats()["received"] == 3
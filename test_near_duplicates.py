@@ -0,0 +1,34 @@
+from near_duplicates import SentenceHistory
+
+
+def test_near_duplicates_are_flagged_on_insert():
+    history = SentenceHistory(capacity=100)
+    assert history.add("Chuaigh mé go Corcaigh inné le mo mháthair.") is None
+    assert history.add("Bíonn féilte traidisiúnta ar siúl in Oileán na Sceach.") is None
+
+    similarity, sentence = history.add("Chuaigh mé go Corcaigh inné le mo mhathair.")
+    assert sentence == "Chuaigh mé go Corcaigh inné le mo mháthair."
+    assert similarity >= history.threshold
+    assert history.near_duplicates == 1
+
+    ranked = history.most_similar("Chuaigh mé go Corcaigh inné le mo mháthair é.")
+    assert ranked[0][1].startswith("Chuaigh mé go Corcaigh inné")
+    assert "Bíonn féilte traidisiúnta ar siúl in Oileán na Sceach." not in [
+        sentence for _, sentence in ranked
+    ]
+
+
+def test_history_stays_bounded():
+    history = SentenceHistory(capacity=50)
+    for i in range(500):
+        history.add(f"Abairt uimhir {i} faoi bhaile {i * 7919} i gContae na Mí.")
+
+    assert len(history) == 50
+    assert history.added == 500
+    # evicted sentences are gone from the index too
+    indexed = set().union(*(slots for buckets in history.buckets for slots in buckets.values()))
+    assert indexed == set(range(50))
+    assert all(
+        sentence.startswith("Abairt uimhir 4") for sentence in history.sample(50)
+    )
+    assert len(history.sample_for_prompt(10)) == 10
@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+import pytest
+
+from parquet_io import read_sentences, read_table, repair_mojibake, write_parquet
+
+pytest.importorskip("pyarrow")
+
+
+def test_partitioned_sentences_read_back_only_what_is_asked_for(tmp_path):
+    root = str(tmp_path / "sentences.parquet")
+    haiku = pd.DataFrame(
+        {
+            "placename": ["An Carn", "Cromghlinn"],
+            "sentence": ["Chuaigh mé go dtí An Carn.", "Tá mé i gCromghlinn."],
+            "model": ["haiku", "haiku"],
+        }
+    )
+    sonnet = haiku.assign(model="sonnet", sentence="Rugadh í i mBaile Átha Cliath.")
+    write_parquet(haiku, root, ["model"], "shard0")
+    write_parquet(sonnet, root, ["model"], "shard0")
+    # a second shard adds to the partition instead of replacing it
+    write_parquet(haiku.iloc[:1], root, ["model"], "shard1")
+
+    df = read_sentences(root, columns=["sentence", "model"], models=["haiku"])
+    assert list(df.columns) == ["sentence", "model"]
+    assert sorted(df["sentence"]) == sorted(
+        haiku["sentence"].tolist() + ["Chuaigh mé go dtí An Carn."]
+    )
+    assert df["model"].cat.categories.tolist() == ["haiku"]
+    assert len(read_sentences(root)) == 5
+
+    # the CSV reader gives the same answer
+    csv_path = tmp_path / "sentences.csv"
+    pd.concat([haiku, sonnet]).to_csv(csv_path, index=False, encoding="utf-8-sig")
+    assert read_table(str(csv_path), ["placename"], {"model": ["sonnet"]})[
+        "placename"
+    ].tolist() == ["An Carn", "Cromghlinn"]
+
+
+def test_repair_mojibake_leaves_proper_irish_alone():
+    assert repair_mojibake("TÃ¡ sÃ© i gCorcaigh.") == "Tá sé i gCorcaigh."
+    assert repair_mojibake("Tá sé i gCorcaigh.") == "Tá sé i gCorcaigh."
+
+
+def test_placenames_dataset_is_replaced_safely_and_keeps_csv_order(tmp_path):
+    from main import write_place_names_parquet
+
+    root = str(tmp_path / "placenames.parquet")
+    records = [
+        ("contae chorcai", "Cork", "Corcaigh"),
+        ("ceantair ghaeltachta", "Carn", "An Carn"),
+        ("contae chorcai", "Ballincollig", "Baile an Chollaigh"),
+    ]
+    write_place_names_parquet(records, root)
+    # partitions are read back area by area, but rows come back in CSV order
+    assert read_table(root, ["Logainm"])["Logainm"].tolist() == [
+        "Corcaigh",
+        "An Carn",
+        "Baile an Chollaigh",
+    ]
+
+    # a rebuild replaces the whole dataset, dropping areas that are gone
+    write_place_names_parquet(records[:1], root)
+    assert read_table(root)["Logainm"].tolist() == ["Corcaigh"]
+    assert sorted(os.listdir(tmp_path)) == ["placenames.parquet"]
+
+    # anything but a *.parquet dataset is left alone
+    with pytest.raises(ValueError):
+        write_place_names_parquet(records, str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["placenames.parquet"]
@@ -0,0 +1,111 @@
+import pandas as pd
+
+from placename_index import NormalisedIndex, Placename, PlacenameIndex, fold_token
+
+PLACENAMES = [
+    Placename("Baile Átha Cliath", ("contae bhaile atha cliath",), ("Dublin",)),
+    Placename("Átha Cliath"),
+    Placename("Cromghlinn", ("contae bhaile atha cliath",), ("Crumlin",)),
+    Placename("An Carn", ("ceantair ghaeltachta",), ("Carn",)),
+    Placename("Caisleán Aircín"),
+    Placename("An Teach Mór"),
+]
+
+
+def test_exact_and_longest_matches_respect_token_boundaries():
+    index = PlacenameIndex(PLACENAMES)
+    transcript = (
+        "Chuaigh sí go BAILE ÁTHA CLIATH agus ansin go Crumlin, ní go Cromghlinnte"
+    )
+
+    assert [p.logainm for p in index.lookup("baile  átha cliath")] == [
+        "Baile Átha Cliath"
+    ]
+    assert index.lookup("Baile Átha") == ()
+    # "Átha Cliath" is inside "Baile Átha Cliath"; "Cromghlinn" inside "Cromghlinnte" isn't a token
+    assert [m.text for m in index.find_all(transcript)] == [
+        "BAILE ÁTHA CLIATH",
+        "ÁTHA CLIATH",
+        "Crumlin",
+    ]
+    longest = index.find_longest(transcript)
+    assert [(m.text, m.placenames[0].logainm, m.alias) for m in longest] == [
+        ("BAILE ÁTHA CLIATH", "Baile Átha Cliath", False),
+        ("Crumlin", "Cromghlinn", True),
+    ]
+    assert transcript[longest[1].start : longest[1].end] == "Crumlin"
+    assert PlacenameIndex(PLACENAMES, aliases=False).find_longest("go Crumlin") == []
+
+
+def test_fuzzy_lookups_allow_bounded_edits():
+    index = PlacenameIndex(PLACENAMES)
+
+    assert [(d, p.logainm) for d, p in index.lookup_fuzzy("Baile Átha Clith")] == [
+        (1, "Baile Átha Cliath")
+    ]
+    assert index.lookup_fuzzy("Baile Atha Clith") == []  # two edits
+    # names shorter than CHARS_PER_EDIT characters per edit only match exactly
+    assert index.lookup_fuzzy("Cam") == []
+
+    matches = index.find_fuzzy(
+        "tá sé ina chónaí i gCromghlin anois, in aice le Baile Átha Cliath"
+    )
+    assert [(m.text, m.distance) for m in matches] == [
+        ("Baile Átha Cliath", 0),
+    ]
+    matches = index.find_fuzzy("tá sé ina chónaí i Cromghlin anois")
+    assert [(m.text, m.placenames[0].logainm, m.distance) for m in matches] == [
+        ("Cromghlin", "Cromghlinn", 1)
+    ]
+
+
+def test_folding_strips_mutations_and_fadas():
+    assert [
+        fold_token(t)
+        for t in ["gCaisleán", "bhFear", "Bhaile", "n-Inis", "tSalainn", "hÁth"]
+    ] == ["caislean", "fear", "baile", "inis", "salainn", "ath"]
+    # n/h/t before a vowel only count as mutations when marked as such
+    assert fold_token("nead") == "nead"
+    assert fold_token("Teach") == "teach"
+    assert [fold_token(t) for t in ["TEACH", "HOWTH", "NAAS", "GCAISLEÁN"]] == [
+        "teach",
+        "howth",
+        "naas",
+        "caislean",
+    ]
+
+
+def test_normalised_index_tags_mutated_and_unaccented_names():
+    index = NormalisedIndex(PLACENAMES)
+
+    assert [p.logainm for p in index.lookup("i gCaisleán Aircín")] == []
+    assert [p.logainm for p in index.lookup("gCaisleán Aircín")] == ["Caisleán Aircín"]
+    matches = index.find("chuaigh me go bhaile atha cliath agus ansin i dTeach Mór")
+    assert [(m.text, m.placenames[0].logainm) for m in matches] == [
+        ("bhaile atha cliath", "Baile Átha Cliath"),
+        ("dTeach Mór", "An Teach Mór"),
+    ]
+    assert [m.text for m in index.find("CHUAIGH MÉ GO DTÍ AN TEACH MÓR")] == [
+        "AN TEACH MÓR"
+    ]
+    # without the article only a capitalised or eclipsed word starts a name
+    assert [m.text for m in index.find("i dteach mór")] == ["dteach mór"]
+    assert index.find("tá teach mór agam") == []
+
+    df = pd.DataFrame(
+        {
+            "placename": ["Cromghlinn", "An Carn", "Caisleán Aircín"],
+            "sentence": [
+                "Tá siopa nua i gCromghlinn agus i mBaile Átha Cliath.",
+                "Bhí mé ag siúl cois farraige inné.",
+                "Tá an scoil nua i gCaisleán Aircín.",
+            ],
+        }
+    )
+    tagged = index.tag_sentences(df)
+    assert tagged["placename_found"].tolist() == [True, False, True]
+    assert tagged["placenames_tagged"].tolist() == [
+        "Cromghlinn; Baile Átha Cliath",
+        "",
+        "Caisleán Aircín",
+    ]
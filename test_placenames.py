@@ -2,7 +2,7 @@
 import os
 import pytest
 
-from pdf_to_data_set import pdf_to_place_names_list
+from pdf_to_data_set import ENGINES, extracted_place_names, pdf_to_place_names_list
 
 # 1) First, build a flat list of (pdf_filename, single_pair) for all expected pairs:
 raw_tests = [
@@ -51,25 +51,33 @@ raw_tests = [
     ),
 ]
 
+# listed above but not in fixtures/; strict, so adding the PDF makes these fail
+# until the mark is removed
+MISSING_FIXTURES = {"an-tordu-logainmneacha-ceantair-ghaeltachta-2004.pdf"}
+
 flat_tests = []
 ids = []
 for pdf_filename, pair_list in raw_tests:
+    marks = ()
+    if pdf_filename in MISSING_FIXTURES:
+        marks = pytest.mark.xfail(strict=True, reason=f"{pdf_filename} is not in fixtures/")
     for en, ga in pair_list:
-        flat_tests.append((pdf_filename, en, ga))
+        flat_tests.append(pytest.param(pdf_filename, en, ga, marks=marks))
         # Build an ID like "ghaeltachta-2004.pdf:Addergoole/Eadargúil"
         base = os.path.basename(pdf_filename)
         ids.append(f"{base}:{en}/{ga}")
 
 
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize(
     "pdf_filename, expected_en, expected_ga",
     flat_tests,
     ids=ids,
 )
-def test_each_place_name_is_extracted(pdf_filename, expected_en, expected_ga):
+def test_each_place_name_is_extracted(pdf_filename, expected_en, expected_ga, engine):
     """
     For each PDF in tests/fixtures/, check that (expected_en, expected_ga) appears
-    in the output of pdf_to_place_names_list().
+    in the output of pdf_to_place_names_list(), with every extraction engine.
     """
     this_dir = os.path.dirname(__file__)
     fixtures_dir = os.path.join(this_dir, "fixtures")
@@ -77,7 +85,105 @@ def test_each_place_name_is_extracted(pdf_filename, expected_en, expected_ga):
 
     assert os.path.isfile(pdf_path), f"Could not find {pdf_path}"
 
-    extracted = pdf_to_place_names_list(pdf_path)
+    # memoized: each fixture is parsed once however many pairs are checked
+    extracted = extracted_place_names(pdf_path, engine=engine)
 
     pair = (expected_en, expected_ga)
     assert pair in extracted, f"Expected to find {pair} in {pdf_filename}, but did not."
+
+
+def test_parallel_extraction_matches_serial():
+    """
+    Splitting the fixtures across worker processes (a few pages at a time) must
+    give exactly the same pairs, in the same order, as the serial extractor.
+    """
+    from main import extract_place_names_parallel
+
+    this_dir = os.path.dirname(__file__)
+    fixtures_dir = os.path.join(this_dir, "fixtures")
+    pdf_paths = [
+        os.path.join(fixtures_dir, f_name) for f_name in sorted(os.listdir(fixtures_dir))
+    ]
+
+    extracted = extract_place_names_parallel(pdf_paths, workers=2, pages_per_task=5)
+
+    for pdf_path in pdf_paths:
+        assert extracted[pdf_path] == list(extracted_place_names(pdf_path))
+
+
+def test_extraction_cache_only_parses_changed_pdfs(tmp_path):
+    """
+    A second run over unchanged PDFs must be served entirely from the cache,
+    except for a PDF that failed to parse, which is tried again.
+    """
+    from extraction_cache import cached_extract
+
+    this_dir = os.path.dirname(__file__)
+    pdf_path = os.path.join(
+        this_dir, "fixtures", "an-tordu-logainmneacha-contae-bhaile-atha-cliath-2011.pdf"
+    )
+    broken_path = str(tmp_path / "broken.pdf")
+    with open(broken_path, "wb") as f:
+        f.write(b"%PDF-1.4 not really")
+    parsed = []
+
+    def extract(misses):
+        parsed.extend(misses)
+        return {f_path: pdf_to_place_names_list(f_path) for f_path in misses}
+
+    cache_dir = str(tmp_path / "cache")
+    first = cached_extract([pdf_path, broken_path], extract, cache_dir=cache_dir)
+    second = cached_extract([pdf_path, broken_path], extract, cache_dir=cache_dir)
+
+    assert parsed == [pdf_path, broken_path, broken_path]
+    assert first == second
+    assert ("Adamstown", "Baile Adaim") in second[pdf_path]
+    assert second[broken_path] == []
+
+
+def test_streaming_records_match_list():
+    """
+    iter_place_names() must stream the same pairs as pdf_to_place_names_list(),
+    tagged with the area it was given.
+    """
+    from pdf_to_data_set import iter_place_names
+
+    this_dir = os.path.dirname(__file__)
+    pdf_path = os.path.join(
+        this_dir, "fixtures", "an-tordu-logainmneacha-contae-an-longfoirt-2014-dreacht.pdf"
+    )
+
+    records = list(iter_place_names(pdf_path, area="contae an longfoirt"))
+
+    assert {area for area, _, _ in records} == {"contae an longfoirt"}
+    assert [(en, ga) for _, en, ga in records] == list(extracted_place_names(pdf_path))
+
+
+def test_stream_and_extracted_records_are_the_same_rows(tmp_path):
+    """
+    main.py --stream and the parallel/cached path write the same rows, also
+    when two PDFs are of the same area.
+    """
+    import shutil
+
+    from main import extracted_place_name_records, stream_place_name_records
+
+    this_dir = os.path.dirname(__file__)
+    fixtures_dir = os.path.join(this_dir, "fixtures")
+    longford = "an-tordu-logainmneacha-contae-an-longfoirt-2014-dreacht.pdf"
+    files = [longford, "an-tordu-logainmneacha-contae-an-longfoirt-2020.pdf"]
+    shutil.copy(os.path.join(fixtures_dir, longford), tmp_path / files[0])
+    shutil.copy(
+        os.path.join(
+            fixtures_dir, "an-tordu-logainmneacha-contae-bhaile-atha-cliath-2011.pdf"
+        ),
+        tmp_path / files[1],
+    )
+
+    streamed = list(stream_place_name_records(str(tmp_path), files))
+    extracted = extracted_place_name_records(
+        str(tmp_path), files, workers=2, cache_dir=str(tmp_path / "cache")
+    )
+
+    assert extracted == streamed
+    assert ("contae an longfoirt", "Adamstown", "Baile Adaim") in extracted
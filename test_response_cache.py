@@ -0,0 +1,86 @@
+import asyncio
+
+import mock_anthropic_server
+import synthesis
+from response_cache import ResponseCache
+
+
+def test_cache_is_namespaced_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    with ResponseCache(path, max_bytes=1100) as cache:
+        cache.put("haiku", "a", "x" * 300)
+        cache.put("sonnet", "a", "y" * 300)
+        assert cache.get("haiku", "a") == "x" * 300
+        assert cache.get("opus", "a") is None
+
+        # over the limit: the sonnet entry is the least recently used one
+        cache.put("haiku", "b", "z" * 300)
+        cache.put("haiku", "c", "w" * 300)
+        assert cache.get("sonnet", "a") is None
+        assert cache.get("haiku", "a") == "x" * 300
+        assert cache.size <= 1100
+
+    # persisted, with its size, across connections
+    with ResponseCache(path, max_bytes=1100) as cache:
+        assert len(cache) == 3
+        assert cache.get("haiku", "c") == "w" * 300
+        assert cache.size == sum(
+            len(ns) + len(k) + 300
+            for ns, k in [("haiku", "a"), ("haiku", "b"), ("haiku", "c")]
+        )
+
+
+def test_rerun_is_served_from_the_response_cache(tmp_path, monkeypatch):
+    """Every row gets its own response, repeated placenames included"""
+    server = mock_anthropic_server.start_server(latency=0.01, requests_per_minute=600)
+    monkeypatch.setattr(synthesis.config, "base_url", server.base_url)
+    monkeypatch.setattr(
+        synthesis.config, "response_cache", str(tmp_path / "responses.sqlite")
+    )
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    placenames = ["An Carn", "Cromghlinn", "An Carn", "Corcaigh", "An Carn"]
+    try:
+        first = asyncio.run(synthesis.process_async(placenames))
+        # sampled previous sentences differ between runs but aren't in the key
+        second = asyncio.run(synthesis.process_async(placenames))
+    finally:
+        server.shutdown()
+        server.server_close()
+        synthesis.open_response_cache.cache_clear()
+
+    assert server.state.stats()["received"] == len(placenames)
+    assert second == first
+    assert synthesis.response_cache_key("An Carn", True, True, 1) != (
+        synthesis.response_cache_key("An Carn", True, True)
+    )
+
+
+def test_multi_placename_requests_use_the_response_cache(tmp_path, monkeypatch):
+    server = mock_anthropic_server.start_server(latency=0.01, requests_per_minute=600)
+    monkeypatch.setattr(synthesis.config, "base_url", server.base_url)
+    monkeypatch.setattr(
+        synthesis.config, "response_cache", str(tmp_path / "responses.sqlite")
+    )
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    placenames = ["An Carn", "Cromghlinn", "An Carn", "Corcaigh", "Baile Adaim"]
+    try:
+        first = asyncio.run(synthesis.process_async(placenames, placenames_per_request=2))
+        sent = server.state.stats()["received"]
+        # only the misses are grouped and sent, in either mode
+        second = asyncio.run(synthesis.process_async(placenames, placenames_per_request=2))
+        single = asyncio.run(synthesis.process_async(placenames, placenames_per_request=1))
+        cached = synthesis.get_response_cache().get(
+            synthesis.config.model,
+            synthesis.response_cache_key(
+                "An Carn", synthesis.config.do_sampling, synthesis.config.just_sample, 1
+            ),
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+        synthesis.open_response_cache.cache_clear()
+
+    assert sent == 3
+    assert server.state.stats()["received"] == sent
+    assert second == first and single == first
+    assert cached == first[2]["sentence"]
@@ -0,0 +1,392 @@
+import asyncio
+import json
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import synthesis
+
+REAL_SLEEP = asyncio.sleep
+
+
+class FakeClock:
+    """time.monotonic and asyncio.sleep where sleeping just moves the clock on"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += max(0.0, seconds)
+        await REAL_SLEEP(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_parse_multi_response_keeps_only_valid_items():
+    placenames = ["Baile Átha Cliath", "Corcaigh", "An Carn", "Cromghlinn"]
+    text = "Here you go:\n" + json.dumps(
+        [
+            # lenited after "go"
+            {
+                "placename": "Baile Átha Cliath",
+                "sentence": "Chuaigh sí go Bhaile Átha Cliath.",
+            },
+            # eclipsed after "i"
+            {"placename": "Corcaigh", "sentence": "Tá sé ina chónaí i gCorcaigh."},
+            # doesn't mention the placename
+            {"placename": "An Carn", "sentence": "Tá an aimsir go deas."},
+            # not one of the requested placenames
+            {"placename": "Gaillimh", "sentence": "Rachaidh mé go Gaillimh."},
+        ],
+        ensure_ascii=False,
+    )
+
+    assert synthesis.parse_multi_response(text, placenames) == {
+        0: "Chuaigh sí go Bhaile Átha Cliath.",
+        1: "Tá sé ina chónaí i gCorcaigh.",
+    }
+    assert synthesis.parse_multi_response("not json [", placenames) == {}
+
+
+class FakeMessages:
+    """Answers multi-placename requests with JSON that leaves out the last
+    placename, and single-placename requests with a plain sentence"""
+
+    def __init__(self):
+        self.requests = []
+        self.times = []
+        self.with_raw_response = self
+
+    async def create(self, model, max_tokens, temperature, system, messages):
+        prompt = messages[-1]["content"].split("sample of previous sentences")[0]
+        self.requests.append(prompt)
+        self.times.append(time.monotonic())
+        if prompt.startswith("Placenames:"):
+            placenames = re.findall(r"^\d+\. (.+)$", prompt, re.M)
+            text = json.dumps(
+                [
+                    {"placename": p, "sentence": f"Chuaigh mé go {p} inné."}
+                    for p in placenames[:-1]
+                ],
+                ensure_ascii=False,
+            )
+        else:
+            placename = prompt.split("\n")[0].replace("Placename: ", "")
+            text = f"Tá mé in {placename} anois."
+        message = SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=text)],
+            model=model,
+            usage=SimpleNamespace(
+                input_tokens=10,
+                output_tokens=10,
+                model_dump=lambda: {"input_tokens": 10, "output_tokens": 10},
+            ),
+        )
+        return SimpleNamespace(headers={}, parse=lambda: message)
+
+
+def test_multi_placename_requests_fan_out_and_retry_failed_items(monkeypatch):
+    monkeypatch.setattr(synthesis, "save_failed_placenames", lambda failed: None)
+    fake = FakeMessages()
+    placenames = ["An Carn", "Cromghlinn", "Corcaigh", "Baile Adaim", "Gaillimh"]
+
+    rows = asyncio.run(
+        synthesis.process_async(
+            placenames,
+            requests_per_minute=6000,
+            tokens_per_minute=10**7,
+            client=SimpleNamespace(messages=fake),
+            placenames_per_request=3,
+        )
+    )
+
+    assert [row["placename"] for row in rows] == placenames
+    # Corcaigh and Gaillimh were left out of their group's answer
+    assert rows[2]["sentence"] == "Tá mé in Corcaigh anois."
+    assert rows[4]["sentence"] == "Tá mé in Gaillimh anois."
+    assert rows[0]["sentence"] == "Chuaigh mé go An Carn inné."
+    assert len(fake.requests) == 4
+
+
+def test_token_bucket_refills_at_its_rate(clock):
+    async def scenario():
+        bucket = synthesis.TokenBucket(60)  # a token a second, 60 at most
+        await bucket.acquire(60)
+        assert clock.sleeps == []
+        await bucket.acquire(3)
+        assert clock.now == pytest.approx(1003)
+
+        clock.now += 100
+        start = clock.now
+        # refilled to capacity, not beyond it; a request for more than the
+        # whole bucket is clamped to it rather than waiting forever
+        await bucket.acquire(1000)
+        assert clock.now == start
+        await bucket.acquire(30)
+        assert clock.now - start == pytest.approx(30)
+
+    asyncio.run(scenario())
+
+
+def test_process_async_paces_requests_to_the_rate_limit(clock, monkeypatch):
+    monkeypatch.setattr(synthesis, "save_failed_placenames", lambda failed: None)
+    fake = FakeMessages()
+    placenames = [f"Baile {i}" for i in range(8)]
+
+    rows = asyncio.run(
+        synthesis.process_async(
+            placenames,
+            concurrency=2,
+            requests_per_minute=6,
+            tokens_per_minute=10**7,
+            client=SimpleNamespace(messages=fake),
+        )
+    )
+
+    assert [row["placename"] for row in rows] == placenames
+    # a full bucket's worth at once, then one every 10 seconds
+    start = fake.times[0]
+    assert [round(t - start) for t in fake.times] == [0] * 6 + [10, 20]
+
+
+def test_requests_reserve_realistic_output_and_true_up_from_usage(clock):
+    fake = FakeMessages()
+    limiter = synthesis.AdaptiveRateLimiter(6000, 10000, 1)
+    create = fake.create
+    levels = []
+
+    async def create_and_look(**kwargs):
+        estimated = (
+            synthesis.estimate_tokens(kwargs["system"], kwargs["messages"])
+            + synthesis.MAX_TOKENS_PER_PLACENAME
+        )
+        levels.append((limiter.tokens.tokens, 10000 - estimated))
+        return await create(**kwargs)
+
+    fake.create = create_and_look
+    row = asyncio.run(
+        synthesis.agenerate_sentence_for_placename(
+            SimpleNamespace(messages=fake), limiter, "An Carn", False, True
+        )
+    )
+
+    assert row["sentence"] == "Tá mé in An Carn anois."
+    # reserved input + one sentence, not MAX_TOKENS; then the 20 tokens the
+    # response reports
+    [(level, expected)] = levels
+    assert level == pytest.approx(expected)
+    assert limiter.tokens.tokens == pytest.approx(10000 - 20)
+
+
+def test_limiter_follows_rate_limit_headers_and_backs_off_on_429(clock):
+    import anthropic
+    import httpx
+
+    async def scenario():
+        limiter = synthesis.AdaptiveRateLimiter(50, 50000, concurrency=4)
+        limiter.in_flight = 1
+        headers = {
+            "anthropic-ratelimit-requests-limit": "1000",
+            "anthropic-ratelimit-requests-remaining": "900",
+            "anthropic-ratelimit-tokens-limit": "400000",
+            "anthropic-ratelimit-tokens-remaining": "390000",
+        }
+        limiter.on_response(headers, 500, 400)
+        # re-sized to the API's limits, and one more in flight on headroom
+        assert limiter.requests.rate == pytest.approx(1000 / 60)
+        assert limiter.tokens.capacity == 400000
+        assert limiter.requests.tokens == 900
+        assert limiter.concurrency == 5
+
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        response = httpx.Response(429, headers={"retry-after": "7"}, request=request)
+        error = anthropic.RateLimitError("rate limited", response=response, body=None)
+        delay = limiter.on_retry(error, 500, attempt=0)
+        assert limiter.concurrency == 2
+        assert 7 <= delay <= 8
+        assert limiter.rate_limited == 1
+
+        # every worker waits out the retry-after, not just the one told to
+        limiter.in_flight = 0
+        start = clock.now
+        await limiter.acquire(100)
+        assert clock.now - start == pytest.approx(7)
+
+    asyncio.run(scenario())
+
+
+def test_backoff_is_jittered_capped_and_honours_retry_after():
+    delays = [synthesis.backoff_delay(3) for _ in range(200)]
+    assert all(0 <= delay <= 8 for delay in delays)
+    assert len(set(delays)) > 100
+    assert max(synthesis.backoff_delay(30) for _ in range(200)) <= synthesis.BACKOFF_CAP
+    assert all(
+        5 <= synthesis.backoff_delay(0, retry_after=5) <= 6 for _ in range(200)
+    )
+
+
+def test_threads_engine_saves_placenames_that_failed(monkeypatch, tmp_path):
+    # intermediate CSVs go to ./synthesis
+    (tmp_path / "synthesis").mkdir()
+    monkeypatch.chdir(tmp_path)
+    failed = []
+    monkeypatch.setattr(synthesis, "save_failed_placenames", failed.extend)
+    monkeypatch.setattr(
+        synthesis,
+        "generate_sentence_for_placename",
+        lambda args, cache_stats=None, occurrence=0: (
+            None if "Theip" in args[0] else {"placename": args[0]}
+        ),
+    )
+
+    rows = synthesis.process_in_batches(
+        ["An Carn", "Baile Theip", "Cromghlinn"], batch_size=2, batch_delay=0
+    )
+
+    assert sorted(row["placename"] for row in rows) == ["An Carn", "Cromghlinn"]
+    assert failed == ["Baile Theip"]
+
+
+def test_claude_instance_leaves_retries_to_the_engines(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-test")
+    assert synthesis.create_claude_instance().max_retries == 0
+
+
+def test_shared_clients_follow_config_changes(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-test")
+    first = synthesis.get_claude_instance()
+    assert synthesis.get_claude_instance() is first
+
+    monkeypatch.setattr(synthesis.config, "model", "claude-test")
+    assert synthesis.get_claude_instance().model == "claude-test"
+    monkeypatch.setattr(synthesis.config, "base_url", "http://127.0.0.1:9")
+    assert synthesis.get_claude_instance().anthropic_api_url == "http://127.0.0.1:9"
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-other")
+    assert synthesis.get_claude_instance().anthropic_api_key.get_secret_value() == "sk-other"
+    assert synthesis.get_chain(simple_mode=True).last is synthesis.get_claude_instance()
+
+
+def test_process_async_closes_the_client_it_created(monkeypatch):
+    monkeypatch.setattr(synthesis, "save_failed_placenames", lambda failed: None)
+    closed = []
+
+    async def close():
+        closed.append(True)
+
+    client = SimpleNamespace(messages=FakeMessages(), close=close)
+    monkeypatch.setattr(synthesis, "create_async_client", lambda max_concurrency: client)
+
+    rows = asyncio.run(
+        synthesis.process_async(
+            ["An Carn"], requests_per_minute=6000, tokens_per_minute=10**7
+        )
+    )
+
+    assert len(rows) == 1 and closed == [True]
+
+
+def test_cache_breakpoint_goes_on_the_last_few_shot_example(monkeypatch):
+    monkeypatch.setattr(synthesis.config, "prompt_caching", True)
+    prompt = synthesis.get_prompt_template(include_previous=False, simple_mode=True)
+    messages = prompt.format_messages(placename="An Carn")
+
+    marked = synthesis.mark_cacheable_prefix(messages)
+
+    # the system message and examples before it are unchanged, the
+    # placename's own message comes after the breakpoint
+    assert marked[:-2] == messages[:-2]
+    assert marked[-1] is messages[-1]
+    assert marked[-2].type == "ai"
+    assert marked[-2].content == [
+        {
+            "type": "text",
+            "text": messages[-2].content,
+            "cache_control": synthesis.CACHE_CONTROL,
+        }
+    ]
+    system, api_messages = synthesis.to_anthropic_request(marked)
+    assert api_messages[-2]["content"][0]["cache_control"] == {"type": "ephemeral"}
+
+    monkeypatch.setattr(synthesis.config, "prompt_caching", False)
+    assert synthesis.mark_cacheable_prefix(messages) == messages
+
+
+def test_prompt_cache_stats_add_up_cache_reads_and_writes():
+    stats = synthesis.PromptCacheStats()
+    stats.add({"input_tokens": 20, "cache_creation_input_tokens": 400, "output_tokens": 30})
+    stats.add(
+        SimpleNamespace(
+            model_dump=lambda: {"input_tokens": 20, "cache_read_input_tokens": 400}
+        )
+    )
+    # the API reports null for a request that didn't touch the cache
+    stats.add({"input_tokens": 20, "cache_read_input_tokens": None})
+
+    assert stats.requests == 3
+    assert stats.input_tokens == 60
+    assert stats.cache_read_tokens == 400
+    assert stats.cache_creation_tokens == 400
+    assert stats.hit_rate() == pytest.approx(400 / 860)
+    assert "400 tokens read (hits), 400 written (misses)" in stats.summary()
+
+
+def test_shards_cover_every_row_once(tmp_path):
+    csv_path = tmp_path / "placenames.csv"
+    placenames = [f"Baile {i}" for i in range(23)]
+    csv_path.write_text(
+        "Ceantar,Logainm\n" + "".join(f"x,{p}\n" for p in placenames), encoding="utf-8"
+    )
+
+    shards = [
+        synthesis.load_placenames(str(csv_path), start=start, stop=stop)
+        for start, stop in (synthesis.shard_bounds(23, shard, 4) for shard in range(4))
+    ]
+
+    assert [p for shard in shards for p in shard] == placenames
+    sample = synthesis.load_placenames(str(csv_path), sample=5, seed=3, limit=4)
+    assert sample == synthesis.load_placenames(str(csv_path), sample=5, seed=3)[:4]
+    assert sample == sorted(sample, key=placenames.index)
+
+
+def test_shards_split_the_rows_left_after_empty_ones_are_dropped(
+    tmp_path, capsys, monkeypatch
+):
+    # cli() sets the module's config; keep that to this test
+    monkeypatch.setattr(synthesis, "config", synthesis.SynthesisConfig())
+    csv_path = tmp_path / "placenames.csv"
+    csv_path.write_text(
+        "Ceantar,Logainm\n" + "x,\n" * 6 + "".join(f"x,Baile {i}\n" for i in range(4)),
+        encoding="utf-8",
+    )
+
+    for shard in range(2):
+        synthesis.cli(
+            ["--input", str(csv_path), "--shard", str(shard), "--num-shards", "2", "--dry-run"]
+        )
+    out = capsys.readouterr().out
+
+    assert "2 placenames from" in out and "rows 0:2" in out and "rows 2:4" in out
+    with pytest.raises(SystemExit):
+        synthesis.parse_args(["--shard", "0", "--num-shards", "2", "--start", "5"])
+
+
+def test_cli_has_no_switch_for_the_unwired_feature_mode(monkeypatch, capsys):
+    monkeypatch.setattr(synthesis, "config", synthesis.SynthesisConfig())
+    with pytest.raises(SystemExit):
+        synthesis.parse_args(["--features"])
+    synthesis.cli(["--input", "placenames.csv", "-n", "3", "--dry-run"])
+    assert synthesis.config.just_sample
+    assert "3 placenames from placenames.csv" in capsys.readouterr().out
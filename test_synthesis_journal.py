@@ -0,0 +1,25 @@
+import os
+
+from synthesis_journal import SynthesisJournal
+
+
+def test_journal_survives_a_truncated_last_line(tmp_path):
+    """
+    Entries written before a crash are kept, a line cut short mid-write is
+    ignored, and new entries appended after reopening are read back intact.
+    """
+    path = os.path.join(tmp_path, "journal.jsonl")
+    with SynthesisJournal(path) as journal:
+        journal.append(0, {"placename": "An Carn", "sentence": "Tá mé in An Carn.", "model": "m"})
+        journal.append(2, {"placename": "Cromghlinn", "sentence": "Chuaigh sé go Cromghlinn.", "model": "m"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"index": 1, "placename": "Baile')
+
+    with SynthesisJournal(path) as journal:
+        assert journal.completed_keys() == {(0, "An Carn"), (2, "Cromghlinn")}
+        journal.append(1, {"placename": "Baile Adaim", "sentence": "Tá Baile Adaim go deas.", "model": "m"})
+
+    journal = SynthesisJournal(path)
+    journal.close()
+    assert [row["placename"] for row in journal.rows()] == ["An Carn", "Baile Adaim", "Cromghlinn"]
+    assert "index" not in journal.rows()[0]